@@ -0,0 +1,199 @@
+"""Benchmark di throughput: viste sync contro viste async, con latenza del database.
+
+Avvia a turno un worker gunicorn per configurazione e lo carica con `--clients`
+utenti concorrenti (ognuno con la propria sessione) che chiedono in ciclo feed,
+i miei workout, i miei obiettivi e la pagina coach, per `--duration` secondi:
+
+- wsgi-sync:  worker sincrono (gthread, `--threads` thread), viste sync;
+- asgi-sync:  worker uvicorn, viste sync (Django le esegue in un thread);
+- asgi-async: worker uvicorn, viste async (`ASYNC_VIEWS`).
+
+Ogni query aspetta `--latency` ms (`benchmarks/slow_db.py`), come un database
+remoto; con latenza zero conta soprattutto la CPU.
+
+    cd fitness_tracker
+    python benchmarks/async_views.py --latency 20 --clients 64
+
+Senza DATABASE_URL usa un file SQLite usa e getta (benchmarks/bench_async.sqlite3).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+BENCH_DB = HERE / 'bench_async.sqlite3'
+if 'DATABASE_URL' not in os.environ:
+    # Database SQLite usa e getta, ricreato a ogni esecuzione
+    BENCH_DB.unlink(missing_ok=True)
+    os.environ['DATABASE_URL'] = f"sqlite:///{BENCH_DB}"
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY  # noqa: E402
+from django.contrib.sessions.backends.db import SessionStore  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from users import friends  # noqa: E402
+from users.models import CustomUser, Goal  # noqa: E402
+from workouts import services  # noqa: E402
+from workouts.models import Workout  # noqa: E402
+
+MODES = {
+    'wsgi-sync': ('slow_db:wsgi_application', 'False'),
+    'asgi-sync': ('slow_db:asgi_application', 'False'),
+    'asgi-async': ('slow_db:asgi_application', 'True'),
+}
+
+
+def setup_data(athletes, workouts_per_athlete):
+    """Atleti amici tra loro, un coach con obiettivi per tutti e una sessione per ciascuno."""
+    call_command('migrate', verbosity=0)
+    # Senza DEBUG gli URL statici vengono dal manifest, come in produzione
+    call_command('collectstatic', interactive=False, verbosity=0)
+    coach = CustomUser.objects.create(username='bench-coach', is_coach=True)
+    users = CustomUser.objects.bulk_create([CustomUser(username=f'bench-{i}') for i in range(athletes)])
+    friends.bulk_add([(user.id, other.id) for user in users for other in users[:10] if user != other])
+    Goal.objects.bulk_create([
+        Goal(coach=coach, athlete=user, target_running_minutes=300, target_weight=70) for user in users
+    ])
+    today = date.today()
+    for user in users:
+        for day in range(workouts_per_athlete):
+            services.create_workout(Workout(
+                user=user, type=('run', 'swim', 'bike')[day % 3], duration_minutes=30 + day,
+                date=today - timedelta(days=day),
+            ))
+    sessions = []
+    for user in [coach] + users:
+        session = SessionStore()
+        session.update({
+            SESSION_KEY: str(user.pk),
+            BACKEND_SESSION_KEY: settings.AUTHENTICATION_BACKENDS[0],
+            HASH_SESSION_KEY: user.get_session_auth_hash(),
+        })
+        session.create()
+        sessions.append(session.session_key)
+    return sessions
+
+
+async def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Il server non risponde")
+
+
+async def fetch(port, path, session_key):
+    """Una richiesta GET (una connessione); restituisce lo status."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+        f"Cookie: {settings.SESSION_COOKIE_NAME}={session_key}\r\n\r\n".encode()
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    await reader.read()
+    writer.close()
+    return status
+
+
+async def client(port, paths, session_key, deadline, latencies, errors):
+    index = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status = await fetch(port, paths[index % len(paths)], session_key)
+        except OSError:
+            status = None
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(status)
+        index += 1
+
+
+async def load(args, sessions):
+    await wait_for_port(args.port)
+    paths = [reverse(name) for name in ('feed', 'my_workouts', 'my_goals')]
+    coach_paths = [reverse('manage_goals')]
+    # Riscaldamento: import, connessioni, cache
+    for session_key in sessions:
+        await fetch(args.port, paths[0], session_key)
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.duration
+    # Un client su dieci è il coach (sessions[0]), gli altri sono atleti
+    await asyncio.gather(*(
+        client(args.port, coach_paths, sessions[0], deadline, latencies, errors) if index % 10 == 0
+        else client(args.port, paths, sessions[1 + index % (len(sessions) - 1)], deadline, latencies, errors)
+        for index in range(args.clients)
+    ))
+    return latencies, errors
+
+
+def run_mode(args, mode, sessions):
+    app, async_views = MODES[mode]
+    command = [sys.executable, '-m', 'gunicorn', app, '--bind', f'127.0.0.1:{args.port}', '--workers', '1',
+               '--log-level', 'warning', '--backlog', str(args.clients * 2)]
+    if mode == 'wsgi-sync':
+        command += ['--worker-class', 'gthread', '--threads', str(args.threads)]
+    else:
+        command += ['--worker-class', 'uvicorn_worker.UvicornWorker']
+    env = {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join([str(HERE), str(HERE.parent)]),
+        'ASYNC_VIEWS': async_views,
+        'BENCH_DB_LATENCY_MS': str(args.latency),
+    }
+    server = subprocess.Popen(command, cwd=HERE.parent, env=env)
+    try:
+        latencies, errors = asyncio.run(load(args, sessions))
+    finally:
+        server.terminate()
+        server.wait()
+    latencies.sort()
+    quantile = (lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000) if latencies else (lambda q: 0)
+    print(
+        f"{mode:<11} {len(latencies) / args.duration:8.1f} {quantile(0.5):8.1f} {quantile(0.95):8.1f} "
+        f"{statistics.fmean(latencies) * 1000 if latencies else 0:8.1f} {len(errors):7d}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--latency', type=float, default=20, help="Millisecondi aggiunti a ogni query.")
+    parser.add_argument('--clients', type=int, default=64, help="Utenti concorrenti.")
+    parser.add_argument('--duration', type=float, default=10, help="Secondi di carico per configurazione.")
+    parser.add_argument('--threads', type=int, default=8, help="Thread del worker gthread (wsgi-sync).")
+    parser.add_argument('--athletes', type=int, default=50)
+    parser.add_argument('--workouts', type=int, default=30, help="Workout per atleta.")
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    sessions = setup_data(args.athletes, args.workouts)
+    print(f"Latenza per query {args.latency:g} ms, {args.clients} client, {args.duration:g}s per configurazione")
+    print(f"{'modo':<11} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'media':>8} {'errori':>7}")
+    for mode in args.modes:
+        run_mode(args, mode, sessions)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Benchmark end to end delle analisi di carico del coach (`users.analytics`).
+
+Crea un coach con `--athletes` atleti e gli aggregati giornalieri di
+`--days` giorni (in media un allenamento ogni due giorni, a volte due tipi
+nello stesso giorno), poi misura, come li esegue la vista:
+
+- la query sugli aggregati degli ultimi `analytics.HISTORY_DAYS` giorni (due
+  anni), letti come colonne di interi (`analytics.daily_minutes`);
+- `coach_report` intero: query, matrice, indicatori e righe del report;
+- la richiesta a `coach_analytics` con il test client (middleware e template):
+  la prima pagina con la cache vuota e un'altra pagina, servita dalla cache.
+
+    cd fitness_tracker
+    python benchmarks/coach_analytics.py --athletes 10000 --days 730
+
+Senza DATABASE_URL usa un file SQLite (benchmarks/bench_coach.sqlite3), che
+viene riusato se contiene già i dati di oggi: generarli è la parte lenta.
+Gli aggregati vengono scritti con un INSERT diretto, perché qui interessa
+solo la lettura.
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+BENCH_DB = HERE / 'bench_coach.sqlite3'
+if 'DATABASE_URL' not in os.environ:
+    os.environ['DATABASE_URL'] = f"sqlite:///{BENCH_DB}"
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from users import analytics  # noqa: E402
+from users.models import CustomUser, Goal  # noqa: E402
+from workouts.models import Workout, WorkoutRollup  # noqa: E402
+
+# La vista analizza fino a oggi: i dati finiscono oggi (e si rigenerano il giorno dopo)
+TODAY = date.today()
+TYPES = [code for code, _ in Workout.WORKOUT_CHOICES]
+
+
+def coach_name(athletes, days):
+    return f'bench-coach-{athletes}x{days}-{TODAY:%Y%m%d}'
+
+
+def seed(athletes, days):
+    """Coach, atleti, obiettivi e aggregati giornalieri; riusa quelli già presenti."""
+    name = coach_name(athletes, days)
+    coach = CustomUser.objects.filter(username=name).first()
+    if coach is not None:
+        return coach
+    started = time.perf_counter()
+    with transaction.atomic():
+        coach = CustomUser.objects.create(username=name, is_coach=True)
+        athlete_ids = [
+            user.id for user in CustomUser.objects.bulk_create(
+                [CustomUser(username=f'{name}-{i:05d}') for i in range(athletes)], batch_size=2000)
+        ]
+        Goal.objects.bulk_create([Goal(coach=coach, athlete_id=user_id) for user_id in athlete_ids], batch_size=2000)
+
+    table = connection.ops.quote_name(WorkoutRollup._meta.db_table)
+    sql = (f"INSERT INTO {table} (user_id, type, period, start, minutes, count) "
+           f"VALUES (%s, %s, %s, %s, %s, %s)")
+    rng = random.Random(42)
+    first_day = TODAY - timedelta(days=days - 1)
+    rows = 0
+    for offset in range(0, len(athlete_ids), 500):
+        chunk = []
+        for user_id in athlete_ids[offset:offset + 500]:
+            for day in range(days):
+                if rng.random() < 0.5:
+                    for workout_type in rng.sample(TYPES, 2 if rng.random() < 0.2 else 1):
+                        chunk.append((user_id, workout_type, WorkoutRollup.DAY,
+                                      first_day + timedelta(days=day), rng.randint(10, 120), 1))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, chunk)
+        rows += len(chunk)
+    print(f"Dati generati in {time.perf_counter() - started:.1f}s: {rows:,} aggregati giornalieri")
+    return coach
+
+
+def best_of(repeat, func):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--athletes', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    # Senza DEBUG gli URL statici vengono dal manifest, come in produzione
+    call_command('collectstatic', interactive=False, verbosity=0)
+    coach = seed(args.athletes, args.days)
+    first_day = TODAY - timedelta(days=analytics.HISTORY_DAYS - 1)
+    print(f"{args.athletes:,} atleti × {args.days} giorni, analisi sugli ultimi {analytics.HISTORY_DAYS} giorni")
+
+    query_seconds, (users, _, _) = best_of(args.repeat, lambda: analytics.daily_minutes(coach, first_day))
+    report_seconds, (report, _) = best_of(args.repeat, lambda: analytics.coach_report(coach, today=TODAY))
+
+    # SERVER_NAME: l'host deve essere in ALLOWED_HOSTS
+    client = Client(SERVER_NAME='localhost')
+    client.force_login(coach)
+
+    def first_page():
+        cache.clear()
+        return client.get(reverse('coach_analytics'))
+
+    view_seconds, response = best_of(args.repeat, first_page)
+    cached_seconds, _ = best_of(args.repeat, lambda: client.get(reverse('coach_analytics'), {'pagina': 2}))
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"Query sugli aggregati: {query_seconds:.2f}s ({len(users):,} righe)")
+    print(f"coach_report (query, matrice, indicatori, righe): {report_seconds:.2f}s "
+          f"({len(report):,} atleti, {sum(1 for row in report if row['flags']):,} segnalati)")
+    print(f"Richiesta coach_analytics, prima pagina senza cache: {view_seconds:.2f}s "
+          f"(stato {response.status_code}, {len(response.content) / 1e3:.0f} kB di HTML)")
+    print(f"Richiesta coach_analytics, seconda pagina dalla cache: {cached_seconds * 1000:.0f} ms")
+    print(f"Migliore di {args.repeat}; picco di memoria del processo: {peak_kb / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark dell'import in streaming dei workout da CSV.
+
+Genera un CSV sintetico e lo importa con `workouts.importers`, stampando
+righe al secondo e picco di memoria del processo.
+
+    cd fitness_tracker
+    python benchmarks/import_workouts.py --rows 500000
+
+Senza DATABASE_URL usa un file SQLite usa e getta (benchmarks/bench_import.sqlite3).
+"""
+import argparse
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+BENCH_DB = HERE / 'bench_import.sqlite3'
+if 'DATABASE_URL' not in os.environ:
+    # Database SQLite usa e getta, ricreato a ogni esecuzione
+    BENCH_DB.unlink(missing_ok=True)
+    os.environ['DATABASE_URL'] = f"sqlite:///{BENCH_DB}"
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+
+from users.models import CustomUser  # noqa: E402
+from workouts import importers  # noqa: E402
+from workouts.models import Workout  # noqa: E402
+
+
+def write_csv(path, rows):
+    rng = random.Random(42)
+    first_day = date.today() - timedelta(days=10 * 365)
+    types = [code for code, _ in Workout.WORKOUT_CHOICES]
+    with open(path, 'w', newline='') as fileobj:
+        writer = csv.writer(fileobj)
+        writer.writerow(['date', 'type', 'duration_minutes', 'notes'])
+        for i in range(rows):
+            writer.writerow([
+                (first_day + timedelta(days=i * 3650 // rows)).isoformat(),
+                rng.choice(types),
+                rng.randint(10, 180),
+                '',
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--batch-size', type=int, default=importers.BATCH_SIZE)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    user = CustomUser.objects.create(username=f'bench-import-{time.time_ns()}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'workouts.csv')
+        write_csv(path, args.rows)
+        print(f"CSV di {args.rows:,} righe ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+        started = time.perf_counter()
+        with open(path, 'rb') as fileobj:
+            result = importers.import_workouts(user, importers.read_file(fileobj, path), args.batch_size)
+        elapsed = time.perf_counter() - started
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        print(
+            f"{result.processed:,} righe in {elapsed:.2f}s: {result.processed / elapsed:,.0f} righe/s "
+            f"({result.created:,} importati, {result.duplicates:,} duplicati)"
+        )
+        print(f"Picco di memoria del processo: {peak_kb / 1024:.1f} MB")
+
+        started = time.perf_counter()
+        with open(path, 'rb') as fileobj:
+            result = importers.import_workouts(user, importers.read_file(fileobj, path), args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"Re-import: {result.duplicates:,} duplicati scartati in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
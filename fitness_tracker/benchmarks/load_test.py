@@ -0,0 +1,334 @@
+"""Test di carico HTTP dell'intero stack contro gunicorn in locale.
+
+Genera un dataset con `workouts.seed`, avvia gunicorn come nel Procfile con
+ogni configurazione richiesta (classe e numero di worker) e lo carica con un
+generatore asyncio senza dipendenze esterne:
+
+- un gruppo di utenti generati fa il login dal form (`accounts/login/`),
+  una volta sola: le sessioni restano valide tra una configurazione e l'altra;
+- ogni client virtuale ripete un mix di azioni (lettura del feed, creazione
+  di un workout col form e token CSRF, obiettivi, i miei workout);
+- la concorrenza sale a gradini (`--ramp`), `--stage` secondi ciascuno.
+
+Per ogni gradino registra throughput, percentuali di errore, p50/p95/p99 e
+un istogramma delle latenze, anche per azione. Alla fine riassume per ogni
+configurazione il throughput massimo e la concorrenza più alta con p95 entro
+`--slo` ms; i dettagli vanno nel file JSON (`--output`).
+
+Configurazioni (`--configs`), nella forma classe:worker[xthread]:
+    sync:2  gthread:2x8  uvicorn:2
+
+    cd fitness_tracker
+    python benchmarks/load_test.py --configs sync:1 sync:4 gthread:2x8 uvicorn:2 --ramp 1 8 32 64
+
+Senza DATABASE_URL usa un file SQLite usa e getta (benchmarks/bench_load.sqlite3);
+per dimensionare la produzione conviene puntarlo a un PostgreSQL di prova.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from http.cookies import SimpleCookie
+from pathlib import Path
+from urllib.parse import urlencode
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+BENCH_DB = HERE / 'bench_load.sqlite3'
+if 'DATABASE_URL' not in os.environ:
+    # Database SQLite usa e getta, ricreato a ogni esecuzione
+    BENCH_DB.unlink(missing_ok=True)
+    os.environ['DATABASE_URL'] = f"sqlite:///{BENCH_DB}"
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from users.models import CustomUser  # noqa: E402
+from workouts import seed  # noqa: E402
+
+PASSWORD = 'carico-di-prova-2025'
+# Azione: peso nel mix
+MIX = {'feed': 60, 'create_workout': 10, 'my_goals': 20, 'my_workouts': 10}
+# Limiti superiori dei bucket dell'istogramma, in millisecondi
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+WORKER_CLASSES = {
+    'sync': ('core.wsgi:application', 'sync'),
+    'gthread': ('core.wsgi:application', 'gthread'),
+    'uvicorn': ('core.asgi:application', 'uvicorn_worker.UvicornWorker'),
+}
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def cookies(self):
+        jar = SimpleCookie()
+        for name, value in self.headers:
+            if name == 'set-cookie':
+                jar.load(value)
+        return {name: morsel.value for name, morsel in jar.items()}
+
+
+async def request(port, method, path, cookies=None, form=None, timeout=30):
+    """Una richiesta HTTP/1.1 su una connessione nuova (`Connection: close`)."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        body = urlencode(form).encode() if form is not None else b''
+        lines = [f"{method} {path} HTTP/1.1", "Host: localhost", "Connection: close"]
+        if cookies:
+            lines.append("Cookie: " + "; ".join(f"{name}={value}" for name, value in cookies.items()))
+        if form is not None:
+            lines += ["Content-Type: application/x-www-form-urlencoded", f"Content-Length: {len(body)}"]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, content = raw.partition(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    headers = [(name.strip().lower(), value.strip()) for name, _, value in (line.partition(':') for line in header_lines)]
+    return Response(int(status_line.split()[1]), headers, content)
+
+
+async def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Il server non risponde")
+
+
+async def login(port, username):
+    """Login dal form, come un browser: restituisce i cookie di sessione e CSRF."""
+    path = reverse('login')
+    cookies = (await request(port, 'GET', path)).cookies()
+    response = await request(port, 'POST', path, cookies, {
+        'username': username, 'password': PASSWORD, 'csrfmiddlewaretoken': cookies['csrftoken'],
+    })
+    if response.status != 302:
+        raise RuntimeError(f"Login di {username} non riuscito ({response.status})")
+    return {**cookies, **response.cookies()}
+
+
+async def act(port, action, cookies, rng):
+    if action == 'create_workout':
+        form = {
+            'type': rng.choice(['run', 'bike', 'swim']),
+            'duration_minutes': rng.randint(20, 90),
+            'notes': '',
+            'csrfmiddlewaretoken': cookies['csrftoken'],
+        }
+        response = await request(port, 'POST', reverse('create_workout'), cookies, form)
+        return response.status == 302
+    response = await request(port, 'GET', reverse(action), cookies)
+    return response.status == 200
+
+
+class Stats:
+    """Latenze ed errori di un gradino, in totale e per azione."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, action, elapsed, ok):
+        if ok:
+            self.latencies[action].append(elapsed * 1000)
+        else:
+            self.errors[action] += 1
+
+    @staticmethod
+    def summary(latencies, errors, duration):
+        total = len(latencies) + errors
+        row = {
+            'requests': total,
+            'throughput': round(len(latencies) / duration, 1),
+            'error_rate': round(errors / total, 4) if total else 0,
+        }
+        if latencies:
+            latencies = sorted(latencies)
+            for name, fraction in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+                row[name] = round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 1)
+            row['mean_ms'] = round(statistics.fmean(latencies), 1)
+            counts = [0] * (len(BUCKETS) + 1)
+            for value in latencies:
+                counts[bisect.bisect_left(BUCKETS, value)] += 1
+            row['histogram'] = {
+                (f"<={limit}" if index < len(BUCKETS) else f">{BUCKETS[-1]}"): count
+                for index, (limit, count) in enumerate(zip(BUCKETS + [None], counts)) if count
+            }
+        return row
+
+    def report(self, duration):
+        every = [value for values in self.latencies.values() for value in values]
+        result = self.summary(every, sum(self.errors.values()), duration)
+        result['actions'] = {
+            action: self.summary(self.latencies[action], self.errors[action], duration)
+            for action in MIX if self.latencies[action] or self.errors[action]
+        }
+        return result
+
+
+async def virtual_user(port, cookies, rng, deadline, stats):
+    actions, weights = list(MIX), list(MIX.values())
+    while time.perf_counter() < deadline:
+        action = rng.choices(actions, weights)[0]
+        started = time.perf_counter()
+        try:
+            ok = await act(port, action, cookies, rng)
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            ok = False
+        stats.add(action, time.perf_counter() - started, ok)
+
+
+async def run_stage(port, sessions, concurrency, duration, seed_value):
+    stats = Stats()
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        virtual_user(port, sessions[index % len(sessions)], random.Random(seed_value + index), deadline, stats)
+        for index in range(concurrency)
+    ))
+    return stats.report(duration)
+
+
+def parse_config(text):
+    worker_class, _, size = text.partition(':')
+    if worker_class not in WORKER_CLASSES:
+        raise argparse.ArgumentTypeError(f"classe di worker sconosciuta: {worker_class}")
+    workers, _, threads = (size or '1').partition('x')
+    return {'name': text, 'class': worker_class, 'workers': int(workers), 'threads': int(threads or 1)}
+
+
+def start_server(config, port, backlog):
+    app, worker_class = WORKER_CLASSES[config['class']]
+    command = [
+        sys.executable, '-m', 'gunicorn', app, '--bind', f'127.0.0.1:{port}',
+        '--workers', str(config['workers']), '--worker-class', worker_class,
+        '--log-level', 'warning', '--backlog', str(backlog), '--timeout', '60',
+    ]
+    if config['class'] == 'gthread':
+        command += ['--threads', str(config['threads'])]
+    return subprocess.Popen(command, cwd=HERE.parent, env={**os.environ, 'PYTHONPATH': str(HERE.parent)})
+
+
+async def run_config(args, config, sessions, usernames):
+    await wait_for_port(args.port)
+    if not sessions:
+        for start in range(0, len(usernames), 8):
+            sessions += await asyncio.gather(*(login(args.port, name) for name in usernames[start:start + 8]))
+        print(f"{len(sessions)} utenti collegati")
+    stages = []
+    for concurrency in args.ramp:
+        result = await run_stage(args.port, sessions, concurrency, args.stage, args.seed)
+        result['concurrency'] = concurrency
+        stages.append(result)
+        print(
+            f"  {config['name']:<12} conc {concurrency:4d}  {result['throughput']:7.1f} req/s  "
+            f"p50 {result.get('p50_ms', 0):7.1f}  p95 {result.get('p95_ms', 0):7.1f}  "
+            f"p99 {result.get('p99_ms', 0):7.1f} ms  errori {result['error_rate'] * 100:5.1f}%"
+        )
+    return stages
+
+
+def sizing(stages, slo):
+    """Throughput massimo e concorrenza più alta con p95 ed errori entro i limiti."""
+    peak = max(stages, key=lambda stage: stage['throughput'])
+    within = [
+        stage for stage in stages
+        if stage.get('p95_ms', float('inf')) <= slo and stage['error_rate'] <= 0.01
+    ]
+    best = max(within, key=lambda stage: stage['concurrency']) if within else None
+    return {
+        'peak_throughput': peak['throughput'],
+        'peak_concurrency': peak['concurrency'],
+        'max_concurrency_within_slo': best['concurrency'] if best else None,
+        'throughput_within_slo': best['throughput'] if best else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', type=parse_config, nargs='+',
+                        default=[parse_config(text) for text in ('sync:2', 'gthread:2x4', 'uvicorn:2')])
+    parser.add_argument('--ramp', type=int, nargs='+', default=[1, 4, 16, 32, 64], help="Client concorrenti per gradino.")
+    parser.add_argument('--stage', type=float, default=10, help="Secondi per gradino.")
+    parser.add_argument('--users', type=int, default=1000, help="Utenti del dataset.")
+    parser.add_argument('--workouts', type=int, default=30, help="Workout per utente nel dataset.")
+    parser.add_argument('--pool', type=int, default=32, help="Utenti che fanno login e generano il carico.")
+    parser.add_argument('--slo', type=float, default=500, help="Obiettivo di p95 in ms per il riepilogo.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--output', default='load_test.json')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    # Senza DEBUG gli URL statici vengono dal manifest, come in produzione
+    call_command('collectstatic', interactive=False, verbosity=0)
+    if not CustomUser.objects.filter(username__startswith='carico').exists():
+        started = time.perf_counter()
+        seed.seed(seed.SeedConfig(
+            users=args.users, workouts=args.workouts, coaches=max(1, args.users // 50),
+            prefix='carico', seed=args.seed, password=PASSWORD,
+        ), log=lambda message: None)
+        print(f"Dataset di {args.users:,} utenti generato in {time.perf_counter() - started:.1f}s")
+
+    report = {
+        'meta': {
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'cpus': os.cpu_count(),
+            'mix': MIX,
+            'stage_seconds': args.stage,
+            'slo_ms': args.slo,
+        },
+        'configs': {},
+    }
+    athletes = list(CustomUser.objects.filter(is_coach=False).order_by('id').values_list('username', flat=True))
+    usernames = random.Random(args.seed).sample(athletes, min(args.pool, len(athletes)))
+    sessions = []
+    for config in args.configs:
+        server = start_server(config, args.port, backlog=max(args.ramp) * 2)
+        try:
+            stages = asyncio.run(run_config(args, config, sessions, usernames))
+        finally:
+            server.terminate()
+            server.wait()
+        report['configs'][config['name']] = {**config, 'stages': stages, 'sizing': sizing(stages, args.slo)}
+
+    print(f"\nRiepilogo (p95 entro {args.slo:g} ms, errori entro l'1%):")
+    for name, data in report['configs'].items():
+        summary = data['sizing']
+        within = (
+            f"fino a {summary['max_concurrency_within_slo']} client ({summary['throughput_within_slo']} req/s)"
+            if summary['max_concurrency_within_slo'] else "mai entro l'obiettivo"
+        )
+        print(f"  {name:<12} picco {summary['peak_throughput']:7.1f} req/s a {summary['peak_concurrency']} client; {within}")
+
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f"\nRisultati scritti in {args.output}")
+
+
+if __name__ == '__main__':
+    main()
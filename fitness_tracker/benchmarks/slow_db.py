@@ -0,0 +1,30 @@
+"""Applicazioni WSGI/ASGI con latenza del database simulata, per i benchmark.
+
+Ogni query aspetta `BENCH_DB_LATENCY_MS` millisecondi prima di partire, come
+se il database fosse su un'altra macchina:
+
+    gunicorn slow_db:wsgi_application    (con benchmarks/ nel PYTHONPATH)
+    gunicorn slow_db:asgi_application -k uvicorn_worker.UvicornWorker
+"""
+import os
+import time
+
+from django.db.backends.signals import connection_created
+
+LATENCY = float(os.environ.get('BENCH_DB_LATENCY_MS', 0)) / 1000
+
+
+def _delay(execute, sql, params, many, context):
+    time.sleep(LATENCY)
+    return execute(sql, params, many, context)
+
+
+def _install(sender, connection, **kwargs):
+    if _delay not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_delay)
+
+
+connection_created.connect(_install)
+
+from core.asgi import application as asgi_application  # noqa: E402
+from core.wsgi import application as wsgi_application  # noqa: E402
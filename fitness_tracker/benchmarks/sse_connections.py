@@ -0,0 +1,176 @@
+"""Benchmark delle connessioni SSE inattive su un worker ASGI.
+
+Avvia uvicorn (un solo processo) su `core.asgi`, apre N connessioni a
+`feed/stream/` come follower di uno stesso atleta e misura memoria (RSS) e
+thread del worker prima e dopo; poi registra un workout dell'atleta e misura
+quanto ci mette l'evento `feed` ad arrivare a tutte le connessioni.
+
+    cd fitness_tracker
+    python benchmarks/sse_connections.py --connections 5000
+
+Senza DATABASE_URL usa un file SQLite usa e getta (benchmarks/bench_sse.sqlite3).
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+BENCH_DB = HERE / 'bench_sse.sqlite3'
+if 'DATABASE_URL' not in os.environ:
+    # Database SQLite usa e getta, ricreato a ogni esecuzione
+    BENCH_DB.unlink(missing_ok=True)
+    os.environ['DATABASE_URL'] = f"sqlite:///{BENCH_DB}"
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY  # noqa: E402
+from django.contrib.sessions.backends.db import SessionStore  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+from users import friends  # noqa: E402
+from users.models import CustomUser  # noqa: E402
+from workouts import services  # noqa: E402
+from workouts.models import Workout  # noqa: E402
+
+
+def setup_users(followers):
+    """L'atleta, i suoi follower e una sessione per ciascuno."""
+    call_command('migrate', verbosity=0)
+    prefix = f'bench-sse-{time.time_ns()}'
+    author = CustomUser.objects.create(username=f'{prefix}-autore')
+    users = CustomUser.objects.bulk_create([CustomUser(username=f'{prefix}-{i}') for i in range(followers)])
+    friends.bulk_add([(author.id, user.id) for user in users])
+    sessions = []
+    for user in users:
+        session = SessionStore()
+        session.update({
+            SESSION_KEY: str(user.pk),
+            BACKEND_SESSION_KEY: settings.AUTHENTICATION_BACKENDS[0],
+            HASH_SESSION_KEY: user.get_session_auth_hash(),
+        })
+        session.create()
+        sessions.append(session.session_key)
+    return author, sessions
+
+
+def process_status(pid):
+    """(RSS in MB, thread) del processo dal /proc."""
+    fields = {}
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            key, _, value = line.partition(':')
+            fields[key] = value.strip()
+    return int(fields['VmRSS'].split()[0]) / 1024, int(fields['Threads'])
+
+
+async def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Il server non risponde")
+
+
+async def connect(port, session_key):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=2 ** 20)
+    writer.write(
+        f"GET /feed/stream/ HTTP/1.1\r\nHost: localhost\r\n"
+        f"Cookie: {settings.SESSION_COOKIE_NAME}={session_key}\r\n\r\n".encode()
+    )
+    await writer.drain()
+    # Intestazioni e primo messaggio (`retry:`)
+    while b'retry:' not in await reader.readline():
+        pass
+    return reader, writer
+
+
+async def wait_event(reader):
+    while not (await reader.readline()).startswith(b'event: feed'):
+        pass
+    return time.perf_counter()
+
+
+async def run(args, author, sessions):
+    await wait_for_port(args.port)
+    # Una connessione di riscaldamento: import e avvio del watcher
+    _, warmup = await connect(args.port, sessions[0])
+    warmup.close()
+    await asyncio.sleep(1)
+    rss_before, threads_before = process_status(args.server_pid)
+    print(f"Worker a riposo: {rss_before:.1f} MB, {threads_before} thread")
+
+    started = time.perf_counter()
+    connections = []
+    for start in range(0, args.connections, args.batch):
+        connections += await asyncio.gather(*(
+            connect(args.port, sessions[index % len(sessions)])
+            for index in range(start, min(start + args.batch, args.connections))
+        ))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(2)
+    rss_after, threads_after = process_status(args.server_pid)
+    print(f"{len(connections):,} connessioni aperte in {elapsed:.1f}s")
+    print(
+        f"Worker con le connessioni: {rss_after:.1f} MB, {threads_after} thread "
+        f"({(rss_after - rss_before) * 1024 / len(connections):.1f} KB per connessione)"
+    )
+
+    waiters = [asyncio.create_task(wait_event(reader)) for reader, _ in connections]
+    published = time.perf_counter()
+    await asyncio.to_thread(
+        services.create_workout, Workout(user=author, type='run', duration_minutes=30, date=date.today()))
+    received = sorted(await asyncio.gather(*waiters))
+    print(
+        f"Evento consegnato a tutte in {(received[-1] - published) * 1000:.0f} ms "
+        f"(mediana {(received[len(received) // 2] - published) * 1000:.0f} ms, "
+        f"intervallo di lettura {settings.REALTIME_POLL_INTERVAL}s)"
+    )
+    for _, writer in connections:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--users', type=int, help="Follower distinti (predefinito: uno per connessione).")
+    parser.add_argument('--batch', type=int, default=200, help="Connessioni aperte in parallelo.")
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    # Due descrittori per connessione (client e server nello stesso host)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < args.connections * 2 + 100:
+        parser.error(f"Limite di file aperti troppo basso ({hard}) per {args.connections} connessioni")
+
+    author, sessions = setup_users(min(args.users or args.connections, args.connections))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'core.asgi:application', '--port', str(args.port),
+         '--log-level', 'warning', '--backlog', str(args.batch * 2)],
+        cwd=HERE.parent, env={**os.environ, 'PYTHONPATH': str(HERE.parent)},
+    )
+    args.server_pid = server.pid
+    try:
+        asyncio.run(run(args, author, sessions))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""Suite di benchmark delle viste principali, a più scale di dati.
+
+Per ogni scala (numero di utenti) svuota il database, genera i dati con
+`seed_fitness_data` (stessi parametri e seed: stessi dati a ogni esecuzione) e
+chiama con il test client di Django, attraverso tutti i middleware:
+
+    feed, my_workouts, my_goals, manage_goals, search_users, toggle_friend
+
+Per ogni vista registra latenza (p50, p95, media), query SQL per richiesta e
+picco di memoria allocata durante una richiesta (tracemalloc, in un passaggio
+separato per non falsare i tempi). La cache per utente viene svuotata prima di
+ogni richiesta, salvo `--warm`. I risultati vanno in un file JSON; con
+`--compare` si confrontano con quelli di un'esecuzione precedente.
+
+    cd fitness_tracker
+    python benchmarks/view_suite.py --scales 200 1000 5000 --output prima.json
+    python benchmarks/view_suite.py --scales 200 1000 5000 --output dopo.json --compare prima.json
+
+Senza DATABASE_URL usa un file SQLite usa e getta (benchmarks/bench_views.sqlite3).
+Qualunque altro database viene svuotato solo con `--yes-wipe-database`: con
+DATABASE_URL impostato (su Render è quello di produzione) la suite si rifiuta
+di partire.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+BENCH_DB = HERE / 'bench_views.sqlite3'
+if 'DATABASE_URL' not in os.environ:
+    # Database SQLite usa e getta, ricreato a ogni esecuzione
+    BENCH_DB.unlink(missing_ok=True)
+    os.environ['DATABASE_URL'] = f"sqlite:///{BENCH_DB}"
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from core.querybudget import count_queries  # noqa: E402
+from users import friends  # noqa: E402
+from users.models import CustomUser  # noqa: E402
+from workouts import seed  # noqa: E402
+
+VIEWS = ('feed', 'my_workouts', 'my_goals', 'manage_goals', 'search_users', 'toggle_friend')
+# Data finale fissa: i dati non cambiano con il giorno in cui si esegue
+END = date(2025, 6, 30)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def build_requests(args, rng):
+    """Per ogni vista, le richieste da misurare: (client, metodo, url, dati)."""
+    clients = {}
+
+    def client_for(user):
+        if user.id not in clients:
+            # SERVER_NAME: l'host deve essere in ALLOWED_HOSTS
+            client = Client(SERVER_NAME='localhost')
+            client.force_login(user)
+            clients[user.id] = client
+        return clients[user.id]
+
+    users = list(CustomUser.objects.filter(is_coach=False).order_by('id'))
+    coaches = list(CustomUser.objects.filter(is_coach=True).order_by('id'))
+    athletes = rng.sample(users, min(args.sample, len(users)))
+    requests = {name: [] for name in VIEWS}
+    for index in range(args.iterations):
+        athlete = athletes[index % len(athletes)]
+        client = client_for(athlete)
+        requests['feed'].append((client, 'get', reverse('feed'), None))
+        requests['my_workouts'].append((client, 'get', reverse('my_workouts'), None))
+        requests['my_goals'].append((client, 'get', reverse('my_goals'), None))
+        requests['search_users'].append((client, 'get', reverse('search_users'), {'q': rng.choice(seed.LAST_NAMES)}))
+        coach = coaches[index % len(coaches)]
+        requests['manage_goals'].append((client_for(coach), 'get', reverse('manage_goals'), None))
+        # Aggiunge e poi toglie lo stesso amico: i dati tornano come prima
+        target = rng.choice(users)
+        while target == athlete or friends.are_friends(athlete, target):
+            target = rng.choice(users)
+        toggle = reverse('toggle_friend', args=[target.id])
+        requests['toggle_friend'] += [(client, 'post', toggle, None), (client, 'post', toggle, None)]
+    return requests
+
+
+def send(request, warm):
+    client, method, url, data = request
+    if not warm:
+        cache.clear()
+    response = getattr(client, method)(url, data)
+    if response.status_code not in (200, 302):
+        raise RuntimeError(f"{url}: risposta {response.status_code}")
+    return response
+
+
+def measure(requests, args):
+    latencies, queries = [], []
+    for request in requests:
+        with count_queries() as counter:
+            started = time.perf_counter()
+            send(request, args.warm)
+            latencies.append(time.perf_counter() - started)
+        queries.append(counter.count)
+
+    # Memoria in un passaggio a parte: tracemalloc rallenta ogni allocazione
+    peaks = []
+    tracemalloc.start()
+    try:
+        for request in requests[:args.memory_samples]:
+            if not args.warm:
+                cache.clear()
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            send(request, warm=True)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'queries': statistics.median_low(queries),
+        'queries_max': max(queries),
+        'peak_kb': round(max(peaks) / 1024, 1),
+    }
+
+
+def is_throwaway_database():
+    database = settings.DATABASES['default']
+    return connection.vendor == 'sqlite' and Path(database['NAME']).resolve() == BENCH_DB
+
+
+def run_scale(users, args):
+    call_command('flush', interactive=False, verbosity=0)
+    cache.clear()
+    config = seed.SeedConfig(
+        users=users, friends=args.friends, coaches=max(1, users // 50), roster=args.roster,
+        workouts=args.workouts, days=args.days, end=END, seed=args.seed,
+    )
+    started = time.perf_counter()
+    dataset = seed.seed(config, log=lambda message: None)
+    print(f"\n{users:,} utenti: dati generati in {time.perf_counter() - started:.1f}s")
+
+    requests = build_requests(args, random.Random(args.seed))
+    results = {}
+    for name in VIEWS:
+        # Riscaldamento: import, template compilati, connessione
+        send(requests[name][0], args.warm)
+        results[name] = measure(requests[name], args)
+        row = results[name]
+        print(f"  {name:<14} p50 {row['p50_ms']:7.2f} ms  p95 {row['p95_ms']:7.2f} ms  "
+              f"query {row['queries']:3d} (max {row['queries_max']:3d})  picco {row['peak_kb']:8.1f} KB")
+    return {'dataset': dataset, 'views': results}
+
+
+def compare(current, previous):
+    print("\nConfronto con l'esecuzione precedente (differenza percentuale; query come differenza assoluta):")
+    for scale, data in current['scales'].items():
+        old_scale = previous.get('scales', {}).get(scale)
+        if old_scale is None:
+            print(f"  {scale} utenti: assente nel file precedente")
+            continue
+        for name, row in data['views'].items():
+            old = old_scale['views'].get(name)
+            if old is None:
+                continue
+
+            def delta(key):
+                return f"{(row[key] - old[key]) / old[key] * 100:+6.1f}%" if old[key] else "   n/d"
+
+            print(f"  {scale:>6} {name:<14} p50 {delta('p50_ms')}  p95 {delta('p95_ms')}  "
+                  f"query {row['queries'] - old['queries']:+d}  picco {delta('peak_kb')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[200, 1000, 5000], help="Utenti per scala.")
+    parser.add_argument('--friends', type=int, default=10)
+    parser.add_argument('--roster', type=int, default=25)
+    parser.add_argument('--workouts', type=int, default=50, help="Workout per utente.")
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=100, help="Richieste misurate per vista.")
+    parser.add_argument('--sample', type=int, default=20, help="Utenti diversi a cui si alternano le richieste.")
+    parser.add_argument('--memory-samples', type=int, default=10)
+    parser.add_argument('--warm', action='store_true', help="Non svuota la cache tra una richiesta e l'altra.")
+    parser.add_argument('--output', default='view_suite.json')
+    parser.add_argument('--compare', metavar='FILE', help="JSON di un'esecuzione precedente.")
+    parser.add_argument('--yes-wipe-database', action='store_true',
+                        help="Svuota anche un database diverso da benchmarks/bench_views.sqlite3.")
+    args = parser.parse_args()
+    if not is_throwaway_database() and not args.yes_wipe_database:
+        # A ogni scala `flush` cancella tutte le tabelle
+        parser.error(f"il database {settings.DATABASES['default']['NAME']} ({connection.vendor}) verrebbe "
+                     "svuotato: togliere DATABASE_URL o aggiungere --yes-wipe-database")
+
+    call_command('migrate', verbosity=0)
+    # Senza DEBUG gli URL statici vengono dal manifest, come in produzione
+    call_command('collectstatic', interactive=False, verbosity=0)
+    report = {
+        'meta': {
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'git': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'async_views': settings.ASYNC_VIEWS,
+            'warm_cache': args.warm,
+            'iterations': args.iterations,
+            'seed': args.seed,
+        },
+        'scales': {},
+    }
+    for users in args.scales:
+        report['scales'][str(users)] = run_scale(users, args)
+
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f"\nRisultati scritti in {args.output}")
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(report, json.load(previous))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Benchmark degli indici di Workout sulle query di feed e obiettivi.
+
+Popola un database separato con qualche milione di workout, poi stampa piano
+di esecuzione (EXPLAIN) e tempi delle query calde prima e dopo la creazione
+degli indici composti.
+
+    cd fitness_tracker
+    python benchmarks/workout_indexes.py --rows 2000000
+    DATABASE_URL=postgres://... python benchmarks/workout_indexes.py
+
+Senza DATABASE_URL usa un file SQLite dedicato (benchmarks/bench.sqlite3),
+mai il db.sqlite3 di sviluppo.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{HERE / 'bench.sqlite3'}")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+
+from users.models import CustomUser  # noqa: E402
+from workouts.models import Workout  # noqa: E402
+
+TYPES = [choice for choice, _ in Workout.WORKOUT_CHOICES]
+
+
+def seed(users, rows, batch=50_000):
+    if Workout.objects.count() >= rows:
+        print(f"Database già popolato ({Workout.objects.count()} workout).")
+        return
+    Workout.objects.all().delete()
+    CustomUser.objects.filter(username__startswith='bench').delete()
+    CustomUser.objects.bulk_create(
+        [CustomUser(username=f'bench{i}', password='!') for i in range(users)],
+        batch_size=5_000,
+    )
+    user_ids = list(CustomUser.objects.filter(username__startswith='bench').values_list('id', flat=True))
+
+    rng = random.Random(42)
+    start_day = date.today() - timedelta(days=3 * 365)
+    table = Workout._meta.db_table
+    sql = (
+        f"INSERT INTO {table} (user_id, date, type, duration_minutes, notes) "
+        "VALUES (%s, %s, %s, %s, '')"
+    )
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        for offset in range(0, rows, batch):
+            params = [
+                (
+                    rng.choice(user_ids),
+                    start_day + timedelta(days=rng.randrange(3 * 365)),
+                    rng.choice(TYPES),
+                    rng.randint(10, 180),
+                )
+                for _ in range(min(batch, rows - offset))
+            ]
+            with transaction.atomic():
+                cursor.executemany(sql, params)
+            print(f"\r  {offset + len(params):>10,} / {rows:,} righe", end='', flush=True)
+    print(f"\n  seed completato in {time.perf_counter() - started:.1f}s")
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f"VACUUM ANALYZE {table}")
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+
+def hot_queries(user_id):
+    return {
+        'feed / my_workouts': Workout.objects.filter(user_id=user_id).order_by('-date', '-id')[:20],
+        'my_goals (somme per tipo)': (
+            Workout.objects.filter(user_id=user_id)
+            .values('type').annotate(total=Sum('duration_minutes')).order_by()
+        ),
+    }
+
+
+def measure(label, sample_users, repeat):
+    print(f"\n=== {label} ===")
+    for name, queryset in hot_queries(sample_users[0]).items():
+        print(f"\n-- {name}\n{queryset.explain()}")
+    for name in hot_queries(sample_users[0]):
+        timings = []
+        for user_id in sample_users[:repeat]:
+            queryset = hot_queries(user_id)[name]
+            started = time.perf_counter()
+            list(queryset)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        p50 = timings[len(timings) // 2] * 1000
+        p95 = timings[int(len(timings) * 0.95)] * 1000
+        print(f"{name:<28} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"Database: {connection.vendor} {connection.settings_dict['NAME']}")
+    call_command('migrate', verbosity=0)
+    seed(args.users, args.rows)
+
+    rng = random.Random(7)
+    sample_users = rng.sample(
+        list(CustomUser.objects.filter(username__startswith='bench').values_list('id', flat=True)),
+        args.repeat,
+    )
+    indexes = Workout._meta.indexes
+
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.remove_index(Workout, index)
+    measure('senza indici composti', sample_users, args.repeat)
+
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.add_index(Workout, index)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    measure('con indici composti', sample_users, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
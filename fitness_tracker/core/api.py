@@ -0,0 +1,74 @@
+"""Strumenti comuni dell'API JSON in sola lettura.
+
+Ogni endpoint dichiara l'ambito di versione da cui dipende (`versioned`):
+ETag e Last-Modified vengono calcolati dal contatore `UserVersion` con una
+sola query, e se il client ha già la versione corrente la vista non viene
+nemmeno eseguita (304 Not Modified).
+"""
+import hashlib
+from functools import wraps
+
+from django.http import JsonResponse
+from django.views.decorators.http import condition
+
+from users import versions
+from . import cache
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def api_login_required(view_func):
+    """Come `login_required`, ma risponde 401 in JSON invece di reindirizzare."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': "Autenticazione richiesta."}, status=401)
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def versioned(scope):
+    """ETag/Last-Modified dal contatore di versione `scope` dell'utente."""
+    def current(request):
+        cached = getattr(request, '_api_versions', None)
+        if cached is None:
+            cached = request._api_versions = {}
+        if scope not in cached:
+            cached[scope] = versions.get(request.user, scope)
+        return cached[scope]
+
+    def etag(request, *args, **kwargs):
+        value, _ = current(request)
+        # Pagine e campi diversi hanno ETag diversi
+        query = hashlib.md5(request.GET.urlencode().encode(), usedforsecurity=False).hexdigest()[:8]
+        return f"{scope}-{request.user.id}-{value}-{query}"
+
+    def last_modified(request, *args, **kwargs):
+        return current(request)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def cache_stats(request):
+    """Hit/miss della cache per frammento (solo staff, per il monitoraggio)."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': "Accesso riservato allo staff."}, status=403)
+    return JsonResponse(cache.stats())
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('limite', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        size = DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def requested_fields(request, allowed):
+    """Campi richiesti con `?campi=a,b` (tutti quelli ammessi se assente)."""
+    raw = request.GET.get('campi')
+    if not raw:
+        return list(allowed)
+    fields = [name for name in raw.split(',') if name in allowed]
+    return fields or list(allowed)
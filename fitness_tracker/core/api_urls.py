@@ -0,0 +1,14 @@
+from django.urls import path
+
+from core import api
+
+from users import api as users_api
+from workouts import api as workouts_api
+
+urlpatterns = [
+    path('feed/', workouts_api.feed_api, name='api_feed'),
+    path('workouts/', workouts_api.workouts_api, name='api_workouts'),
+    path('obiettivi/', users_api.goals_api, name='api_goals'),
+    path('coach/', users_api.coach_api, name='api_coach'),
+    path('cache/', api.api_login_required(api.cache_stats), name='api_cache_stats'),
+]
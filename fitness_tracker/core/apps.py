@@ -0,0 +1,19 @@
+from django.apps import AppConfig
+from django.core.checks import Tags, register
+from django.db.backends.signals import connection_created
+
+
+class CoreConfig(AppConfig):
+    name = 'core'
+
+    def ready(self):
+        # Controlli sui riferimenti ai file statici nei template (core.E001, core.E002, core.W001)
+        from . import static
+
+        register(static.check_static_references, Tags.staticfiles)
+        register(static.check_manifest, Tags.staticfiles, deploy=True)
+
+        # Execute wrapper delle richieste async (core.dbhooks)
+        from . import dbhooks
+
+        connection_created.connect(dbhooks.install)
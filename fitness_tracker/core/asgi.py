@@ -13,4 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Importati dopo il setup di Django
+from django.urls import reverse  # noqa: E402
+
+from workouts.stream import asgi_stream  # noqa: E402
+
+STREAM_PATH = reverse('feed_stream')
+
+
+async def application(scope, receive, send):
+    # Le connessioni SSE, lunghe e quasi sempre inattive, saltano i middleware
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        return await asgi_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,115 @@
+"""Cache per utente basata sui contatori di versione (`users.versions`).
+
+La chiave di ogni frammento contiene la versione corrente dell'ambito da cui
+dipende: quando un workout, un obiettivo, un'amicizia o la scheda personale
+cambiano, `versions.bump` incrementa il contatore e le chiavi vecchie non
+vengono più lette (scadono o vengono espulse dall'LRU). Non serve alcuna
+invalidazione esplicita, quindi funziona anche con backend locali per
+processo (memoria) o condivisi su disco (file).
+"""
+import os
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+from users import versions
+from . import metrics
+
+# Frammenti in cache: feed, progressi di my_goals, andamento del peso della
+# scheda personale, analisi del carico del coach
+FRAGMENTS = ('feed', 'goals', 'sheet', 'analytics')
+_MISSING = object()
+
+
+def _count(fragment, outcome):
+    # Contatori in memoria del processo (core.metrics), non nella cache:
+    # add/incr non sono atomici con il backend su file
+    metrics.registry.count_cache(fragment, outcome)
+
+
+def get_or_build(fragment, user, scope, build, *parts, timeout=DEFAULT_TIMEOUT):
+    """Restituisce il frammento dalla cache o lo calcola con `build()`.
+
+    `parts` distingue varianti dello stesso frammento (es. il cursore di
+    pagina). Costa una query per leggere la versione, qualunque sia il
+    lavoro risparmiato.
+    """
+    version, _ = versions.get(user, scope)
+    key = ':'.join(str(part) for part in (fragment, user.pk, version, *parts))
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        _count(fragment, 'miss')
+        value = build()
+        cache.set(key, value, timeout)
+    else:
+        _count(fragment, 'hit')
+    return value
+
+
+async def aget_or_build(fragment, user, scope, abuild, *parts, timeout=DEFAULT_TIMEOUT):
+    """Come `get_or_build`, per le viste async: `abuild()` è una coroutine."""
+    version, _ = await versions.aget(user, scope)
+    key = ':'.join(str(part) for part in (fragment, user.pk, version, *parts))
+    value = await cache.aget(key, _MISSING)
+    if value is _MISSING:
+        _count(fragment, 'miss')
+        value = await abuild()
+        await cache.aset(key, value, timeout)
+    else:
+        _count(fragment, 'hit')
+    return value
+
+
+def stats(fragments=FRAGMENTS):
+    """Hit, miss e hit rate per frammento, sommati su tutti i worker.
+
+    Gli altri worker contano dall'ultimo salvataggio dei loro file di metriche
+    (al più `METRICS_FLUSH_INTERVAL` secondi fa; mai, con `METRICS_ENABLED`
+    spento).
+    """
+    counts = metrics.collect()['cache']
+    result = {}
+    for fragment in fragments:
+        hits = counts.get(fragment, {}).get('hit', 0)
+        misses = counts.get(fragment, {}).get('miss', 0)
+        total = hits + misses
+        result[fragment] = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 3) if total else None}
+    return result
+
+
+class LRUFileBasedCache(FileBasedCache):
+    """Cache su file con espulsione LRU.
+
+    Il backend di Django, quando supera `MAX_ENTRIES`, cancella file a caso;
+    qui ogni lettura riuscita aggiorna la data di modifica del file e la
+    pulizia elimina quelli letti meno di recente. La scadenza non cambia:
+    è salvata nel contenuto del file, non nella data.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))
+        except FileNotFoundError:
+            pass
+        return value
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+        for fname in sorted(filelist, key=_mtime)[:num_entries // self._cull_frequency]:
+            self._delete(fname)
+
+
+def _mtime(fname):
+    try:
+        return os.path.getmtime(fname)
+    except FileNotFoundError:
+        return 0
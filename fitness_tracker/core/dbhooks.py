@@ -0,0 +1,43 @@
+"""Execute wrapper per tutto il contesto di una richiesta, anche async.
+
+`connection.execute_wrapper` ha due limiti per i middleware:
+- vale solo per la connessione del thread corrente, mentre in una richiesta
+  ASGI il codice sync (viste, ORM) gira nei thread di `sync_to_async`, con
+  connessioni diverse da quella che vede l'event loop;
+- all'uscita toglie l'ultimo wrapper della lista: se la connessione è stata
+  aperta durante il blocco, toglie quello aggiunto da `connection_created`
+  e lascia il proprio sulla connessione persistente.
+
+`execute_wrapper` qui tiene invece il wrapper in una ContextVar, che i thread
+di `sync_to_async` ereditano; `install` (collegato a `connection_created` da
+`CoreConfig.ready`) aggiunge una volta a ogni connessione il wrapper che
+chiama quelli del contesto corrente.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import partial
+
+_wrappers = contextvars.ContextVar('execute_wrappers', default=())
+
+
+def _execute(execute, sql, params, many, context):
+    wrappers = _wrappers.get()
+    # Il primo registrato è il più esterno, come con connection.execute_wrapper
+    for wrapper in reversed(wrappers):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install(sender, connection, **kwargs):
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+@contextmanager
+def execute_wrapper(wrapper):
+    """Come `connection.execute_wrapper`, per ogni connessione usata nel contesto corrente."""
+    token = _wrappers.set((*_wrappers.get(), wrapper))
+    try:
+        yield
+    finally:
+        _wrappers.reset(token)
@@ -0,0 +1,371 @@
+"""Metriche per vista esposte in formato testo di Prometheus (`/metrics`).
+
+`MetricsMiddleware` misura ogni richiesta e la attribuisce al nome dell'URL:
+richieste per classe di stato, istogramma delle latenze, numero e tempo delle
+query SQL (con `core.dbhooks.execute_wrapper`) e tempo di rendering dei template
+(dal backend `TimedDjangoTemplates`). `core.cache` vi aggiunge hit e miss per
+frammento.
+
+Ogni processo tiene solo contatori e somme in memoria; al più ogni
+`METRICS_FLUSH_INTERVAL` secondi li scrive in un file suo
+(`METRICS_DIR/<pid>-<istanza>.json`: l'istanza, casuale, evita che un worker
+nuovo con il pid di uno morto ne erediti il file). Quando il processo termina,
+o il master gunicorn lo vede uscire (`child_exit` in `gunicorn.conf.py`) se è
+stato ucciso, i suoi contatori vengono sommati in `archived.json` e il suo
+file cancellato: come nella modalità multiprocesso di prometheus_client, i
+contatori non scendono mai e Prometheus non scambia l'uscita di un worker per
+un reset. Archiviazione (lock esclusivo) e lettura dei file (lock condiviso)
+si escludono, così nessuna lettura conta due volte un worker o non lo conta.
+L'endpoint somma i file di tutti i worker gunicorn e l'archivio senza toccare
+il database.
+È protetto da `METRICS_TOKEN` (`Authorization: Bearer <token>`, per lo
+scraper) oppure riservato allo staff.
+"""
+import atexit
+import bisect
+import contextvars
+import fcntl
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates
+
+from . import dbhooks
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'fitness_tracker'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Limiti superiori (secondi) dei bucket dell'istogramma delle latenze
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Somme per vista, oltre a richieste e bucket
+TOTALS = ('seconds', 'queries', 'sql_seconds', 'template_seconds')
+# Contatori dei processi terminati e lock che ne protegge l'aggiornamento
+ARCHIVE = 'archived.json'
+LOCK = 'archived.lock'
+
+_current = contextvars.ContextVar('metrics_request', default=None)
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'METRICS_DIR', '/tmp/fitness_tracker_metrics'))
+
+
+def flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+
+def _new_view():
+    return {'requests': {}, 'buckets': [0] * (len(BUCKETS) + 1), **dict.fromkeys(TOTALS, 0)}
+
+
+class Registry:
+    """Contatori del processo, aggiornati sotto lock (worker gthread)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.cache = {}
+        self.flushed_at = 0.0
+        self.pid = None
+        self.file_name = None
+
+    def observe(self, view, status, seconds, queries=0, sql_seconds=0.0, template_seconds=0.0):
+        status_class = f'{status // 100}xx'
+        with self.lock:
+            data = self.views.get(view) or self.views.setdefault(view, _new_view())
+            data['requests'][status_class] = data['requests'].get(status_class, 0) + 1
+            data['buckets'][bisect.bisect_left(BUCKETS, seconds)] += 1
+            data['seconds'] += seconds
+            data['queries'] += queries
+            data['sql_seconds'] += sql_seconds
+            data['template_seconds'] += template_seconds
+
+    def count_cache(self, fragment, outcome):
+        with self.lock:
+            counts = self.cache.get(fragment) or self.cache.setdefault(fragment, {'hit': 0, 'miss': 0})
+            counts[outcome] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'views': {
+                    view: {**data, 'requests': dict(data['requests']), 'buckets': list(data['buckets'])}
+                    for view, data in self.views.items()
+                },
+                'cache': {fragment: dict(counts) for fragment, counts in self.cache.items()},
+            }
+
+    def maybe_flush(self):
+        now = time.monotonic()
+        if now - self.flushed_at >= flush_interval():
+            self.flushed_at = now
+            self.flush()
+
+    def own_file(self):
+        """Nome del file di questo processo, nuovo dopo un fork."""
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.file_name = f'{self.pid}-{uuid.uuid4().hex[:12]}.json'
+            atexit.register(self.archive_file)
+        return self.file_name
+
+    def archive_file(self):
+        """All'uscita: i contatori aggiornati vanno nell'archivio al posto del file."""
+        if self.pid == os.getpid():
+            self.flush()
+            archive([metrics_dir() / self.file_name])
+
+    def flush(self):
+        """Scrive i contatori nel file del processo (sostituito in modo atomico)."""
+        path = metrics_dir() / self.own_file()
+        temporary = path.with_suffix('.tmp')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary.write_text(json.dumps(self.snapshot()))
+            os.replace(temporary, path)
+        except OSError:
+            logger.warning("Metriche non salvate in %s", path, exc_info=True)
+
+
+registry = Registry()
+
+
+@contextmanager
+def _locked(exclusive):
+    directory = metrics_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / LOCK, 'a') as lock:
+        # Rilasciato alla chiusura del file
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        # File già archiviato da un altro processo, o incompleto
+        return None
+
+
+def archive(paths):
+    """Somma in `ARCHIVE` i file di processi terminati e li cancella."""
+    with _locked(exclusive=True):
+        snapshots = [snapshot for snapshot in map(_read, paths) if snapshot is not None]
+        if not snapshots:
+            return
+        path = metrics_dir() / ARCHIVE
+        archived = _read(path)
+        temporary = path.with_suffix('.tmp')
+        try:
+            temporary.write_text(json.dumps(merge([archived, *snapshots] if archived else snapshots)))
+            os.replace(temporary, path)
+        except OSError:
+            # Meglio un worker contato ancora dal suo file che perso
+            logger.warning("Metriche non archiviate in %s", path, exc_info=True)
+            return
+        for dead in paths:
+            dead.unlink(missing_ok=True)
+
+
+def archive_worker_files(pid):
+    """Archivia i file di un worker terminato (dal master gunicorn)."""
+    archive(list(metrics_dir().glob(f'{pid}-*.json')))
+
+
+def merge(snapshots):
+    merged = {'views': {}, 'cache': {}}
+    for snapshot in snapshots:
+        for view, data in snapshot.get('views', {}).items():
+            total = merged['views'].get(view) or merged['views'].setdefault(view, _new_view())
+            for status_class, count in data['requests'].items():
+                total['requests'][status_class] = total['requests'].get(status_class, 0) + count
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], data['buckets'])]
+            for key in TOTALS:
+                total[key] += data[key]
+        for fragment, counts in snapshot.get('cache', {}).items():
+            total = merged['cache'].setdefault(fragment, {'hit': 0, 'miss': 0})
+            for outcome in total:
+                total[outcome] += counts.get(outcome, 0)
+    return merged
+
+
+def collect():
+    """Metriche di tutti i processi: questo dalla memoria, gli altri dai loro file, i terminati dall'archivio."""
+    own = registry.own_file()
+    snapshots = [registry.snapshot()]
+    with _locked(exclusive=False):
+        for path in metrics_dir().glob('*.json'):
+            if path.name != own:
+                snapshots.append(_read(path))
+    return merge(snapshot for snapshot in snapshots if snapshot is not None)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(data):
+    """Testo nel formato di esposizione di Prometheus."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(str(label))}"' for key, label in labels)
+            lines.append(f"{PREFIX}_{name}{suffix}{{{label_text}}} {value:g}" if label_text
+                         else f"{PREFIX}_{name}{suffix} {value:g}")
+
+    views = sorted(data['views'].items())
+    metric('requests_total', 'counter', "Richieste per vista e classe di stato.", [
+        ('', [('view', view), ('status', status_class)], count)
+        for view, values in views for status_class, count in sorted(values['requests'].items())
+    ])
+    histogram = []
+    for view, values in views:
+        cumulative = 0
+        for limit, count in zip(BUCKETS + ('+Inf',), values['buckets']):
+            cumulative += count
+            histogram.append(('_bucket', [('view', view), ('le', limit)], cumulative))
+        histogram.append(('_sum', [('view', view)], values['seconds']))
+        histogram.append(('_count', [('view', view)], cumulative))
+    metric('request_duration_seconds', 'histogram', "Durata delle richieste per vista.", histogram)
+    metric('db_queries_total', 'counter', "Query SQL eseguite per vista.", [
+        ('', [('view', view)], values['queries']) for view, values in views
+    ])
+    metric('db_query_seconds_total', 'counter', "Tempo passato nelle query SQL per vista.", [
+        ('', [('view', view)], values['sql_seconds']) for view, values in views
+    ])
+    metric('template_render_seconds_total', 'counter', "Tempo di rendering dei template per vista.", [
+        ('', [('view', view)], values['template_seconds']) for view, values in views
+    ])
+    fragments = sorted(data['cache'].items())
+    metric('cache_requests_total', 'counter', "Letture della cache per frammento ed esito.", [
+        ('', [('fragment', fragment), ('outcome', outcome)], count)
+        for fragment, counts in fragments for outcome, count in sorted(counts.items())
+    ])
+    metric('cache_hit_ratio', 'gauge', "Frazione di letture della cache riuscite per frammento.", [
+        ('', [('fragment', fragment)], counts['hit'] / (counts['hit'] + counts['miss']))
+        for fragment, counts in fragments if counts['hit'] + counts['miss']
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+class _RequestTimes:
+    """Query e tempi di una richiesta; fa anche da execute wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    """Registra le metriche di ogni richiesta (in MIDDLEWARE prima di quelli dell'app)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        times = _RequestTimes()
+        token = _current.set(times)
+        started = time.perf_counter()
+        try:
+            with dbhooks.execute_wrapper(times):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, times, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        # sync_to_async copia il contesto: anche query e template eseguiti nei
+        # thread finiscono in `times`
+        times = _RequestTimes()
+        token = _current.set(times)
+        started = time.perf_counter()
+        try:
+            with dbhooks.execute_wrapper(times):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, times, time.perf_counter() - started)
+
+    def record(self, request, response, times, elapsed):
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'non_trovata'
+        registry.observe(view, response.status_code, elapsed, times.queries, times.sql_seconds, times.template_seconds)
+        registry.maybe_flush()
+        return response
+
+
+class TimedTemplate:
+    """Template del backend Django che somma il tempo di `render` alla richiesta corrente."""
+
+    def __init__(self, template):
+        self._timed = template
+
+    def __getattr__(self, name):
+        return getattr(self._timed, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self._timed.render(context, request)
+        finally:
+            times = _current.get()
+            if times is not None:
+                times.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Backend `DjangoTemplates` che misura il rendering (gli include sono compresi nel padre)."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def _authorized(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    # Prima il token: lo scraper non legge né sessione né utente dal database
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def metrics_view(request):
+    if not _authorized(request):
+        return HttpResponse("Accesso riservato.\n", status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
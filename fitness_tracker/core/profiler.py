@@ -0,0 +1,411 @@
+"""Profilazione a campione delle richieste (opt-in), consultabile dallo staff.
+
+`ProfilerMiddleware` non strumenta il codice della richiesta: la registra tra
+quelle in corso e un thread per processo ne campiona lo stack ogni
+`PROFILER_INTERVAL` secondi con `sys._current_frames()`. Vengono profilate le
+richieste estratte a sorte (`PROFILER_SAMPLE_RATE`) dall'inizio e tutte le
+altre da quando superano `PROFILER_THRESHOLD` secondi; con entrambe le
+impostazioni a zero il middleware non viene caricato.
+
+Nella catena async (ASGI) il middleware resta async: le query e la durata
+sono quelle di tutta la richiesta, ma i campioni coprono solo il codice async
+in esecuzione nel thread dell'event loop (non quello sync che Django manda nei
+thread di `sync_to_async`).
+
+Di ogni richiesta profilata si salvano l'albero delle chiamate (campioni per
+stack) e le query SQL in `PROFILER_DIR`, un buffer ad anello che tiene gli
+ultimi `PROFILER_MAX_PROFILES` profili di tutti i worker. Le pagine in
+`/admin/profili/` li elencano, li mostrano e confrontano i punti caldi di due
+profili.
+"""
+import json
+import os
+import random
+import re
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404
+from django.shortcuts import render
+from django.urls import reverse
+
+from . import dbhooks
+
+PROFILE_ID = re.compile(r'\d+-\d+')
+# Query conservate per profilo (le altre contano solo nei totali)
+MAX_QUERIES = 500
+# Nodi dell'albero sotto questa frazione dei campioni non vengono mostrati
+MIN_SHARE = 0.01
+HOTSPOTS = 25
+STDLIB = sysconfig.get_paths()['stdlib']
+
+
+def profiles_dir():
+    return Path(getattr(settings, 'PROFILER_DIR', '/tmp/fitness_tracker_profiles'))
+
+
+class Profile:
+    """Campioni e query di una richiesta; fa anche da execute wrapper."""
+
+    def __init__(self, thread_id, recording, entry=None):
+        self.thread_id = thread_id
+        # Async: il frame del middleware, perché l'event loop alterna più richieste
+        self.entry = entry
+        self.started = time.perf_counter()
+        self.recording = recording
+        self.trigger = 'campione' if recording else None
+        self.recorded_from = 0.0
+        # Nodo dell'albero: [campioni, {etichetta: nodo figlio}]
+        self.tree = [0, {}]
+        self.queries = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+
+    def start_recording(self, elapsed):
+        self.trigger = 'soglia'
+        self.recorded_from = elapsed
+        self.recording = True
+
+    def add_stack(self, labels):
+        node = self.tree
+        node[0] += 1
+        for label in labels:
+            children = node[1]
+            node = children.get(label) or children.setdefault(label, [0, {}])
+            node[0] += 1
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            # Anche la query in corso quando la richiesta supera la soglia
+            if self.recording:
+                seconds = time.perf_counter() - started
+                self.query_count += 1
+                self.query_seconds += seconds
+                if len(self.queries) < MAX_QUERIES:
+                    self.queries.append((sql, seconds))
+
+    def as_dict(self, request, response, seconds):
+        match = request.resolver_match
+        return {
+            'view': (match.url_name or match.view_name) if match else 'non_trovata',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'seconds': seconds,
+            'trigger': self.trigger,
+            'recorded_from': self.recorded_from,
+            'interval': settings.PROFILER_INTERVAL,
+            'samples': self.tree[0],
+            'tree': self.tree,
+            'queries': self.queries,
+            'query_count': self.query_count,
+            'query_seconds': self.query_seconds,
+        }
+
+
+_labels = {}
+
+
+def _label(code):
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(str(settings.BASE_DIR)):
+            filename = os.path.relpath(filename, settings.BASE_DIR)
+        elif 'site-packages' in filename:
+            filename = filename.split('site-packages' + os.sep, 1)[1]
+        elif filename.startswith(STDLIB):
+            filename = os.path.relpath(filename, STDLIB)
+        label = _labels[code] = f'{code.co_qualname} ({filename}:{code.co_firstlineno})'
+    return label
+
+
+def _stack(frame, entry=None):
+    """Etichette dello stack dalla radice, escluso ciò che sta sopra il middleware.
+
+    Con `entry` (richieste async) None se lo stack non passa da quel frame:
+    l'event loop sta eseguendo un'altra richiesta.
+    """
+    labels = []
+    while frame is not None and frame is not entry and frame.f_code is not _ENTRY:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    if entry is not None and frame is not entry:
+        return None
+    labels.reverse()
+    return labels
+
+
+class Sampler(threading.Thread):
+    """Thread che campiona gli stack delle richieste in corso del processo."""
+
+    def __init__(self):
+        super().__init__(name='profiler', daemon=True)
+        self.lock = threading.Lock()
+        self.active = set()
+        self.wakeup = threading.Event()
+
+    def add(self, profile):
+        with self.lock:
+            self.active.add(profile)
+        if profile.recording:
+            self.wakeup.set()
+
+    def discard(self, profile):
+        # Sotto lock: dopo questa chiamata il profilo non viene più toccato
+        with self.lock:
+            self.active.discard(profile)
+
+    def pause(self):
+        with self.lock:
+            recording = any(profile.recording for profile in self.active)
+        if recording:
+            return settings.PROFILER_INTERVAL
+        if settings.PROFILER_THRESHOLD:
+            # Nessuno da campionare: si controlla solo chi supera la soglia
+            return max(settings.PROFILER_INTERVAL, settings.PROFILER_THRESHOLD / 4)
+        return None
+
+    def sample(self):
+        threshold = settings.PROFILER_THRESHOLD
+        with self.lock:
+            now = time.perf_counter()
+            due = [
+                profile for profile in self.active
+                if profile.recording or (threshold and now - profile.started >= threshold)
+            ]
+            if not due:
+                return
+            frames = sys._current_frames()
+            for profile in due:
+                if not profile.recording:
+                    profile.start_recording(now - profile.started)
+                frame = frames.get(profile.thread_id)
+                labels = _stack(frame, profile.entry) if frame is not None else None
+                if labels is not None:
+                    profile.add_stack(labels)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.pause())
+            self.wakeup.clear()
+            self.sample()
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Il thread di campionamento del processo (ricreato dopo un fork)."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = Sampler()
+            _sampler.start()
+        return _sampler
+
+
+def save(data):
+    """Scrive il profilo e rimuove i più vecchi oltre `PROFILER_MAX_PROFILES`."""
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Id ordinabile per tempo, unico tra i worker
+    profile_id = f'{time.time_ns()}-{os.getpid()}'
+    path = directory / f'{profile_id}.json'
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+    for old in sorted(directory.glob('*.json'))[:-settings.PROFILER_MAX_PROFILES]:
+        old.unlink(missing_ok=True)
+    return profile_id
+
+
+def load(profile_id):
+    if not PROFILE_ID.fullmatch(profile_id or ''):
+        raise Http404
+    try:
+        data = json.loads((profiles_dir() / f'{profile_id}.json').read_text())
+    except (OSError, ValueError):
+        raise Http404("Profilo non trovato (forse già sostituito da uno più recente).")
+    data['id'] = profile_id
+    return data
+
+
+def recent():
+    profiles = []
+    for path in sorted(profiles_dir().glob('*.json'), reverse=True):
+        try:
+            profiles.append(load(path.stem))
+        except Http404:
+            continue
+    return profiles
+
+
+class ProfilerMiddleware:
+    """Profila le richieste estratte a sorte o più lente della soglia."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not (settings.PROFILER_SAMPLE_RATE or settings.PROFILER_THRESHOLD):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self, request):
+        """True/False se la richiesta va profilata dall'inizio o solo oltre la soglia, None se mai."""
+        sampled = random.random() < settings.PROFILER_SAMPLE_RATE
+        # Le pagine dei profili non si profilano: sostituirebbero quelli che si stanno guardando
+        if not (sampled or settings.PROFILER_THRESHOLD) or request.path.startswith(reverse('profile_list')):
+            return None
+        return sampled
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sampled = self.sampled(request)
+        if sampled is None:
+            return self.get_response(request)
+
+        profile = Profile(threading.get_ident(), recording=sampled)
+        sampler = get_sampler()
+        sampler.add(profile)
+        try:
+            with dbhooks.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            sampler.discard(profile)
+        if profile.recording:
+            save(profile.as_dict(request, response, time.perf_counter() - profile.started))
+        return response
+
+    async def __acall__(self, request):
+        sampled = self.sampled(request)
+        if sampled is None:
+            return await self.get_response(request)
+
+        profile = Profile(threading.get_ident(), recording=sampled, entry=sys._getframe())
+        sampler = get_sampler()
+        sampler.add(profile)
+        try:
+            with dbhooks.execute_wrapper(profile):
+                response = await self.get_response(request)
+        finally:
+            sampler.discard(profile)
+        if profile.recording:
+            data = profile.as_dict(request, response, time.perf_counter() - profile.started)
+            await sync_to_async(save)(data)
+        return response
+
+
+_ENTRY = ProfilerMiddleware.__call__.__code__
+
+
+def hotspots(data):
+    """Campioni propri e inclusivi per funzione (le ricorsioni contano una volta)."""
+    own, inclusive = Counter(), Counter()
+
+    def walk(label, node, ancestors):
+        count, children = node
+        ancestors = ancestors | {label}
+        # Campioni in cui questa chiamata era in cima allo stack
+        top = count - sum(child[0] for child in children.values())
+        own[label] += top
+        for name in ancestors:
+            inclusive[name] += top
+        for child_label, child in children.items():
+            walk(child_label, child, ancestors)
+
+    for label, node in data['tree'][1].items():
+        walk(label, node, frozenset())
+    total = data['samples'] or 1
+    return {
+        label: {
+            'own': own[label], 'inclusive': inclusive[label],
+            'own_share': own[label] / total, 'inclusive_share': inclusive[label] / total,
+            'own_ms': own[label] * data['interval'] * 1000,
+        }
+        for label in inclusive
+    }
+
+
+def tree_rows(data):
+    """Albero appiattito (profondità, etichetta, campioni, quota) per il template."""
+    rows = []
+    total = data['samples'] or 1
+
+    def walk(children, depth):
+        for label, (count, grandchildren) in sorted(children.items(), key=lambda item: -item[1][0]):
+            if count / total < MIN_SHARE:
+                continue
+            rows.append({'depth': depth, 'indent': depth * 12, 'label': label, 'samples': count,
+                         'share': count / total * 100})
+            walk(grandchildren, depth + 1)
+
+    walk(data['tree'][1], 0)
+    return rows
+
+
+def query_groups(data):
+    """Query raggruppate per testo (i parametri non sono salvati), le più costose prima."""
+    groups = defaultdict(lambda: {'count': 0, 'seconds': 0.0})
+    for sql, seconds in data['queries']:
+        groups[sql]['count'] += 1
+        groups[sql]['seconds'] += seconds
+    return sorted(({'sql': sql, **group} for sql, group in groups.items()), key=lambda group: -group['seconds'])
+
+
+@staff_member_required
+def profile_list(request):
+    return render(request, 'profiler/list.html', {
+        'profiles': recent(),
+        'sample_rate': settings.PROFILER_SAMPLE_RATE,
+        'threshold': settings.PROFILER_THRESHOLD,
+    })
+
+
+@staff_member_required
+def profile_detail(request, profile_id):
+    data = load(profile_id)
+    spots = sorted(hotspots(data).items(), key=lambda item: -item[1]['own'])[:HOTSPOTS]
+    return render(request, 'profiler/detail.html', {
+        'profile': data,
+        'hotspots': [{'label': label, **values} for label, values in spots],
+        'rows': tree_rows(data),
+        'query_groups': query_groups(data)[:HOTSPOTS],
+    })
+
+
+@staff_member_required
+def profile_diff(request):
+    """Differenza delle quote di tempo proprio per funzione tra due profili."""
+    before, after = load(request.GET.get('a')), load(request.GET.get('b'))
+    spots_before, spots_after = hotspots(before), hotspots(after)
+    empty = {'own_share': 0.0, 'own_ms': 0.0}
+    rows = []
+    for label in spots_before.keys() | spots_after.keys():
+        old, new = spots_before.get(label, empty), spots_after.get(label, empty)
+        rows.append({
+            'label': label,
+            'before': old['own_share'] * 100, 'after': new['own_share'] * 100,
+            'delta': (new['own_share'] - old['own_share']) * 100,
+            'before_ms': old['own_ms'], 'after_ms': new['own_ms'],
+        })
+    rows.sort(key=lambda row: -abs(row['delta']))
+    return render(request, 'profiler/diff.html', {'before': before, 'after': after, 'rows': rows[:HOTSPOTS]})
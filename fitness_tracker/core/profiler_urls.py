@@ -0,0 +1,9 @@
+from django.urls import path
+
+from .profiler import profile_detail, profile_diff, profile_list
+
+urlpatterns = [
+    path('', profile_list, name='profile_list'),
+    path('confronto/', profile_diff, name='profile_diff'),
+    path('<str:profile_id>/', profile_detail, name='profile_detail'),
+]
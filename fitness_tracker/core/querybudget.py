@@ -0,0 +1,138 @@
+"""Conteggio delle query SQL per vista, con un budget dichiarato per ogni vista.
+
+Una vista dichiara quante query può eseguire con il decoratore `query_budget`
+(oppure tramite `QUERY_BUDGETS` in settings, indicizzato per nome dell'URL).
+`QueryBudgetMiddleware` misura ogni richiesta e registra un warning, o solleva
+`QueryBudgetExceeded` se `QUERY_BUDGET_STRICT` è attivo, quando il budget viene
+superato. Nei test si può usare `assert_max_queries` / `QueryBudgetMixin`.
+
+Come gli altri middleware di `core`, funziona sia nella catena sincrona sia in
+quella async (ASGI): se la catena è async, Django non passa a un thread per
+attraversarlo.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import dbhooks
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """Execute wrapper che conta le query e ne somma la durata."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements.append(sql)
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    with dbhooks.execute_wrapper(counter):
+        yield counter
+
+
+def query_budget(max_queries):
+    """Dichiara il numero massimo di query SQL che una vista può eseguire."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            return view_func(*args, **kwargs)
+        if iscoroutinefunction(view_func):
+            # Le viste async restano async (Django non le esegue in un thread)
+            markcoroutinefunction(wrapper)
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+def _report(label, budget, counter):
+    return (
+        f"{label}: {counter.count} query in {counter.duration * 1000:.1f} ms "
+        f"(budget {budget})\n" + "\n".join(counter.statements)
+    )
+
+
+@contextmanager
+def assert_max_queries(max_queries, label='blocco'):
+    """Fallisce se il blocco esegue più di `max_queries` query."""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > max_queries:
+        raise QueryBudgetExceeded(_report(label, max_queries, counter))
+
+
+class QueryBudgetMixin:
+    """Mixin per TestCase: `with self.assertMaxQueries(3): ...`."""
+
+    def assertMaxQueries(self, max_queries, label='blocco'):
+        return assert_max_queries(max_queries, label)
+
+
+class QueryBudgetMiddleware:
+    """Controlla il budget di query delle viste (attivo solo in DEBUG o nei test)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not (settings.DEBUG or getattr(settings, 'QUERY_BUDGET_STRICT', False)):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.strict = getattr(settings, 'QUERY_BUDGET_STRICT', False)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with count_queries() as counter:
+            response = self.get_response(request)
+        return self.check(request, response, counter)
+
+    async def __acall__(self, request):
+        with count_queries() as counter:
+            response = await self.get_response(request)
+        return self.check(request, response, counter)
+
+    def check(self, request, response, counter):
+        match = request.resolver_match
+        if match is None:
+            return response
+        budget = getattr(match.func, 'query_budget', None)
+        if budget is None:
+            budget = self.budgets.get(match.url_name)
+        if budget is None:
+            return response
+
+        label = match.url_name or match.view_name
+        if counter.count > budget:
+            message = _report(label, budget, counter)
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        else:
+            logger.debug("%s: %d query in %.1f ms", label, counter.count, counter.duration * 1000)
+        return response
@@ -0,0 +1,124 @@
+"""Pub/sub in-process per gli aggiornamenti in tempo reale (Server-Sent Events).
+
+Ogni processo ASGI ha un `Hub`: le connessioni SSE si abbonano al canale del
+proprio utente e ricevono i messaggi in una coda asyncio limitata, senza un
+thread né una connessione al database per connessione.
+
+Chi pubblica non è sempre nello stesso processo (viste WSGI, worker della
+coda): al posto di un broker esterno, un unico task per processo
+(`VersionWatcher`) legge ogni `REALTIME_POLL_INTERVAL` secondi i contatori di
+versione (`UserVersion`) degli utenti collegati con una sola query, e
+pubblica sull'hub gli ambiti che sono cambiati. Un backend diverso (Redis,
+LISTEN/NOTIFY) può sostituire il watcher chiamando `hub.publish`.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from users.models import UserVersion
+
+logger = logging.getLogger(__name__)
+
+# Messaggi in attesa per connessione: oltre, i più vecchi vengono scartati
+QUEUE_SIZE = 32
+# Margine per le scritture confermate dopo l'istante registrato in `updated_at`
+COMMIT_LAG = timedelta(seconds=5)
+
+
+def poll_interval():
+    return getattr(settings, 'REALTIME_POLL_INTERVAL', 1.0)
+
+
+def heartbeat_interval():
+    return getattr(settings, 'REALTIME_HEARTBEAT', 20)
+
+
+class Hub:
+    """Canali (id utente) → code asyncio delle connessioni abbonate."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers[channel].add(queue)
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        queues = self._subscribers.get(channel)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[channel]
+
+    def channels(self):
+        return list(self._subscribers)
+
+    def connections(self):
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, channel, message):
+        """Consegna `message` agli abbonati del canale (dal thread del loop)."""
+        for queue in self._subscribers.get(channel, ()):
+            if queue.full():
+                # Client lento: si perde il messaggio più vecchio, non il più recente
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+
+class VersionWatcher:
+    """Trasforma gli incrementi di `UserVersion` in messaggi sull'hub."""
+
+    SCOPES = (UserVersion.FEED, UserVersion.GOALS)
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.task = None
+        self.since = None
+        self.seen = {}
+
+    def ensure_running(self):
+        if self.task is None or self.task.done() or self.task.get_loop() is not asyncio.get_running_loop():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def changes(self, user_ids):
+        """(user_id, ambito, versione) cambiati dall'ultima lettura; una query per tutti gli utenti.
+
+        La finestra riparte `COMMIT_LAG` prima dell'ultima lettura, così un
+        incremento salvato con un istante precedente ma confermato dopo non
+        si perde; i doppioni si scartano confrontando le versioni già viste.
+        """
+        close_old_connections()
+        now = timezone.now()
+        rows = list(
+            UserVersion.objects.filter(
+                user_id__in=user_ids, scope__in=self.SCOPES, updated_at__gte=(self.since or now) - COMMIT_LAG,
+            ).values_list('user_id', 'scope', 'value')
+        )
+        changed = [(user_id, scope, value) for user_id, scope, value in rows if self.seen.get((user_id, scope), 0) < value]
+        self.seen = {(user_id, scope): value for user_id, scope, value in rows}
+        self.since = now
+        return changed
+
+    async def run(self):
+        while self.hub.channels():
+            try:
+                changed = await sync_to_async(self.changes, thread_sensitive=False)(self.hub.channels())
+            except Exception:
+                logger.exception("Lettura delle versioni non riuscita")
+                changed = []
+            for user_id, scope, value in changed:
+                self.hub.publish(user_id, {'scope': scope, 'version': value})
+            await asyncio.sleep(poll_interval())
+        # Nessuno collegato: il task si ferma e ricomincia al prossimo abbonamento
+        self.since, self.seen = None, {}
+
+
+hub = Hub()
+watcher = VersionWatcher(hub)
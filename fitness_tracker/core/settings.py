@@ -22,13 +22,20 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'core',
     'users',
     'workouts',
+    'jobs',
 ]
 
 # Middleware
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # File statici serviti prima di tutto il resto (e fuori dalle metriche)
+    'core.static.WhiteNoiseMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'core.profiler.ProfilerMiddleware',
+    'core.querybudget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -43,7 +50,8 @@ ROOT_URLCONF = 'core.urls'
 # Template engine
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates che misura il tempo di rendering per le metriche
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -57,8 +65,13 @@ TEMPLATES = [
     },
 ]
 
-# WSGI
+# WSGI / ASGI: il sito è servito via WSGI (processo `web`), lo stream SSE del
+# feed via ASGI (processo `stream`, vedi Procfile)
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'
+# Versioni async di feed, my_workouts, my_goals e manage_goals (utili solo serviti
+# via ASGI); spente di default, si attivano con ASYNC_VIEWS=True
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "False") == "True"
 
 # Database (supporta SQLite in locale, PostgreSQL su Render)
 DATABASES = {
@@ -69,6 +82,22 @@ DATABASES = {
     )
 }
 
+# SQLite con più worker della coda (jobs.queue) e il web in parallelo: WAL
+# perché le letture non aspettino le scritture, transazioni IMMEDIATE perché
+# chi legge e poi scrive (il claim dei lavori) aspetti il lock invece di
+# fallire subito con "database is locked". Cache delle pagine di 64 MB per
+# connessione invece di 2: con gli indici dei workout più grandi della cache
+# gli import in blocco passano il tempo a rileggere pagine
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA cache_size=-65536;',
+        'transaction_mode': 'IMMEDIATE',
+    })
+
+# PostgreSQL: lookup trigram (`%>`) per la ricerca utenti
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    INSTALLED_APPS.append('django.contrib.postgres')
+
 # Password validators
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -87,6 +116,15 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
+# collectstatic scrive nomi hashati, manifest e varianti gzip/Brotli (core.static);
+# WhiteNoise serve i nomi hashati con Cache-Control immutable
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.static.StaticStorage'},
+}
+
+# File caricati (import in coda dei workout)
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", BASE_DIR / "media")
 
 # Default primary key
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -97,3 +135,84 @@ LOGOUT_REDIRECT_URL = '/accounts/signup/'
 
 # Custom user model
 AUTH_USER_MODEL = 'users.CustomUser'
+
+# Cache per utente (core.cache): in memoria per processo, oppure su file
+# condivisa tra i worker con CACHE_BACKEND=file. Entrambe espellono in LRU.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+CACHES = {
+    'default': {
+        'BACKEND': (
+            'core.cache.LRUFileBasedCache' if CACHE_BACKEND == 'file'
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': (
+            os.environ.get("CACHE_LOCATION", "/tmp/fitness_tracker_cache") if CACHE_BACKEND == 'file'
+            else 'fitness_tracker'
+        ),
+        'TIMEOUT': int(os.environ.get("CACHE_TIMEOUT", 600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get("CACHE_MAX_ENTRIES", 5000)),
+            'CULL_FREQUENCY': 4,
+        },
+    }
+}
+
+# Feed degli amici
+FEED_PAGE_SIZE = 20
+FEED_BACKFILL_LIMIT = 200
+
+# Aggiornamenti in tempo reale (core.realtime): secondi tra due letture delle
+# versioni e tra due heartbeat sulle connessioni SSE aperte
+REALTIME_POLL_INTERVAL = float(os.environ.get("REALTIME_POLL_INTERVAL", 1.0))
+REALTIME_HEARTBEAT = 20
+# URL completo dello stream se il processo `stream` ha un host suo (vuoto:
+# `feed/stream/` sullo stesso host, instradato da un proxy o da runserver),
+# origini del sito che possono aprirlo e dominio del cookie di sessione
+# condiviso dai due host (es. `.example.com`)
+REALTIME_STREAM_URL = os.environ.get("REALTIME_STREAM_URL", "")
+REALTIME_ALLOWED_ORIGINS = [origin for origin in os.environ.get("REALTIME_ALLOWED_ORIGINS", "").split(",") if origin]
+SESSION_COOKIE_DOMAIN = os.environ.get("SESSION_COOKIE_DOMAIN") or None
+
+# File di import oltre questa dimensione (byte) vengono importati in coda
+# (workouts.import_file) invece che durante la richiesta
+IMPORT_INLINE_MAX_BYTES = int(os.environ.get("IMPORT_INLINE_MAX_BYTES", 2 * 1024 * 1024))
+
+# Notifiche per pagina
+NOTIFICATIONS_PAGE_SIZE = 20
+
+# Età massima (secondi) delle classifiche del periodo in corso prima del ricalcolo
+LEADERBOARD_MAX_AGE = int(os.environ.get("LEADERBOARD_MAX_AGE", 15 * 60))
+
+# Budget di query SQL per vista (controllato solo in DEBUG o nei test)
+QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT", "False") == "True"
+QUERY_BUDGETS = {}
+
+# Metriche per vista (core.metrics): ogni worker le scrive in METRICS_DIR al
+# più ogni METRICS_FLUSH_INTERVAL secondi; /metrics le somma. Senza METRICS_TOKEN
+# l'endpoint è visibile solo allo staff
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True") == "True"
+METRICS_DIR = os.environ.get("METRICS_DIR", "/tmp/fitness_tracker_metrics")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+# I test scrivono metriche, profili e file caricati in una cartella temporanea
+# e usano i file statici senza manifest
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Profilazione a campione (core.profiler), spenta se entrambe sono a zero:
+# frazione di richieste profilate dall'inizio e soglia (secondi) oltre la quale
+# qualunque richiesta viene profilata fino alla fine. Profili in /admin/profili/
+PROFILER_SAMPLE_RATE = float(os.environ.get("PROFILER_SAMPLE_RATE", 0))
+PROFILER_THRESHOLD = float(os.environ.get("PROFILER_THRESHOLD", 0))
+# Secondi tra due campioni dello stack
+PROFILER_INTERVAL = float(os.environ.get("PROFILER_INTERVAL", 0.005))
+PROFILER_DIR = os.environ.get("PROFILER_DIR", "/tmp/fitness_tracker_profiles")
+PROFILER_MAX_PROFILES = int(os.environ.get("PROFILER_MAX_PROFILES", 200))
+
+# Coda dei lavori (jobs.queue, eseguita da `manage.py run_workers`)
+JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", 5))
+# Attesa (secondi) dopo il primo errore, raddoppiata a ogni tentativo fino al massimo
+JOBS_BACKOFF_BASE = 10
+JOBS_BACKOFF_MAX = 60 * 60
+# Oltre questo tempo (secondi) un lavoro in esecuzione è considerato abbandonato
+JOBS_LOCK_TIMEOUT = int(os.environ.get("JOBS_LOCK_TIMEOUT", 10 * 60))
+JOBS_RETENTION_DAYS = 7
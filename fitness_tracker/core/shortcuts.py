@@ -0,0 +1,15 @@
+"""Scorciatoie per le viste async."""
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+
+
+async def arender(request, template_name, context=None):
+    """`render` per le viste async.
+
+    Il template e i context processor (utente, messaggi, sessione) leggono il
+    database in modo sincrono, quindi il rendering gira nel thread della
+    richiesta; `request.user` viene prima sostituito con l'utente già letto
+    da `request.auser()`, per non ripetere la query.
+    """
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
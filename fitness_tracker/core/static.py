@@ -0,0 +1,122 @@
+"""File statici con nomi hashati, compressi e serviti da WhiteNoise.
+
+`collectstatic` copia i file in STATIC_ROOT con l'hash del contenuto nel nome
+(`style.3f2a9c1b04de.css`), scrive il manifest e genera le varianti `.gz` e
+`.br` (Brotli). WhiteNoise serve i nomi hashati con
+`Cache-Control: max-age=315360000, public, immutable`: dopo la prima visita il
+browser non li richiede più finché il contenuto non cambia.
+
+Perché funzioni, i template devono passare sempre da `{% static %}`:
+`check_static_references` segnala gli indirizzi scritti a mano e i file che
+non esistono (che in produzione darebbero errore al rendering). I controlli
+sono registrati da `CoreConfig.ready`.
+
+WhiteNoise 6 ha solo il middleware sincrono: in cima alla catena farebbe
+passare ogni richiesta ASGI da un thread anche con tutti gli altri middleware
+async. `WhiteNoiseMiddleware` qui sotto aggiunge il percorso async.
+"""
+import re
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import StaticFilesStorage
+from django.core.checks import Error, Warning
+from whitenoise import middleware
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+# Estensioni dei file che devono arrivare da `{% static %}`
+ASSET_EXTENSIONS = ('css', 'js', 'png', 'jpg', 'jpeg', 'gif', 'svg', 'ico', 'webp', 'woff', 'woff2')
+# Attributo src/href con un valore scritto a mano (non un tag né una variabile)
+LITERAL_ASSET = re.compile(
+    r'''\b(?:src|href)\s*=\s*["'](?![{]|https?:|//)([^"']*?\.(?:%s))(?:[?#][^"']*)?["']''' % '|'.join(ASSET_EXTENSIONS),
+    re.IGNORECASE,
+)
+STATIC_TAG = re.compile(r'''{%\s*static\s+["']([^"']+)["']''')
+
+
+class StaticStorage(CompressedManifestStaticFilesStorage):
+    """Storage di produzione; in DEBUG, senza manifest (niente `collectstatic`), usa i nomi originali.
+
+    Fuori da DEBUG un manifest mancante o incompleto fa fallire il rendering,
+    invece di servire URL senza hash (`check --deploy` lo segnala, core.W001).
+    """
+
+    def url(self, name, force=False):
+        if settings.DEBUG and not self.hashed_files and not force:
+            # Sviluppo: i file arrivano dai finder
+            return StaticFilesStorage.url(self, name)
+        return super().url(name, force)
+
+
+class WhiteNoiseMiddleware(middleware.WhiteNoiseMiddleware):
+    """Il middleware di WhiteNoise, anche nella catena async."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Solo in sviluppo: cerca il file su disco
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Apre soltanto il file: il contenuto lo legge il server mentre lo invia
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+def _template_files():
+    directories = [Path(directory) for engine in settings.TEMPLATES for directory in engine.get('DIRS', [])]
+    directories += [Path(app.path) / 'templates' for app in apps.get_app_configs()
+                    if not app.name.startswith('django.')]
+    for directory in directories:
+        yield from sorted(directory.rglob('*.html'))
+
+
+def check_static_references(app_configs=None, **kwargs):
+    """I template usano `{% static %}` per ogni file statico, e i file esistono."""
+    errors = []
+    for path in _template_files():
+        source = path.read_text(encoding='utf-8')
+        for match in LITERAL_ASSET.finditer(source):
+            line = source.count('\n', 0, match.start()) + 1
+            errors.append(Error(
+                f"{path}:{line}: '{match.group(1)}' è scritto a mano, quindi non ha l'hash nel nome "
+                f"e non può essere messo in cache a lungo.",
+                hint="Usa {% static '...' %}.",
+                id='core.E001',
+            ))
+        for match in STATIC_TAG.finditer(source):
+            if not finders.find(match.group(1)):
+                line = source.count('\n', 0, match.start()) + 1
+                errors.append(Error(
+                    f"{path}:{line}: il file statico '{match.group(1)}' non esiste.",
+                    id='core.E002',
+                ))
+    return errors
+
+
+def check_manifest(app_configs=None, **kwargs):
+    storage_class = settings.STORAGES['staticfiles']['BACKEND']
+    manifest = Path(settings.STATIC_ROOT) / StaticStorage.manifest_name
+    if storage_class == 'core.static.StaticStorage' and not manifest.exists():
+        return [Warning(
+            "Manca il manifest dei file statici: gli URL non avranno l'hash.",
+            hint="Esegui `manage.py collectstatic --noinput` durante il build.",
+            id='core.W001',
+        )]
+    return []
@@ -0,0 +1,36 @@
+"""Runner dei test (`TEST_RUNNER`)."""
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Metriche, profili e file caricati dei test in una cartella temporanea,
+    non in quelle condivise con il server di sviluppo, e budget di query delle
+    viste controllati in modo rigoroso (`QUERY_BUDGET_STRICT`).
+
+    I test girano senza DEBUG e senza `collectstatic`: i file statici usano lo
+    storage senza manifest, mentre `StaticStorage` fallirebbe.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.TemporaryDirectory(prefix='fitness_tracker_test_')
+        root = Path(self.directory.name)
+        self.settings = override_settings(
+            QUERY_BUDGET_STRICT=True,
+            METRICS_DIR=str(root / 'metrics'), PROFILER_DIR=str(root / 'profiles'), MEDIA_ROOT=str(root / 'media'),
+            STORAGES={
+                **settings.STORAGES,
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+        )
+        self.settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings.disable()
+        self.directory.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -2,8 +2,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 
+from core import metrics
+
 urlpatterns = [
+    path('admin/profili/', include('core.profiler_urls')),
     path('admin/', admin.site.urls),
+    path('api/', include('core.api_urls')),
+    path('metrics', metrics.metrics_view, name='metrics'),
+    path('lavori/', include('jobs.urls')),
     path('accounts/logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('accounts/', include('django.contrib.auth.urls')),
     path('accounts/', include('users.urls')),
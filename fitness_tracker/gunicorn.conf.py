@@ -0,0 +1,11 @@
+"""Configurazione di gunicorn, letta dalla cartella di lavoro (quella del Procfile)."""
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+
+def child_exit(server, worker):
+    # Un worker ucciso (timeout, OOM) non archivia da sé le sue metriche
+    from core import metrics
+
+    metrics.archive_worker_files(worker.pid)
@@ -0,0 +1,115 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+
+from jobs import queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Esegue i lavori in coda con N thread worker (ognuno con la sua connessione). "
+        "Da avviare come processo separato, ad esempio `worker: python manage.py run_workers` nel Procfile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help="Thread worker in parallelo.")
+        parser.add_argument('--batch-size', type=int, default=10, help="Lavori presi per volta da ogni worker.")
+        parser.add_argument('--poll', type=float, default=1.0, help="Secondi di attesa quando la coda è vuota.")
+        parser.add_argument('--once', action='store_true', help="Svuota la coda ed esce.")
+        parser.add_argument(
+            '--reclaim-interval', type=float, default=60.0,
+            help="Secondi tra due controlli dei lavori rimasti in esecuzione senza segni di vita.",
+        )
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: self.stop.set())
+
+        # Lavori rimasti a metà da worker terminati e completati troppo vecchi
+        reclaimed, purged = queue.reclaim(), queue.purge()
+        connection.close()
+        self.stdout.write(
+            f"{options['concurrency']} worker, lavori registrati: {', '.join(queue.registered()) or 'nessuno'} "
+            f"({reclaimed} rimessi in coda, {purged} cancellati)"
+        )
+
+        self.done = self.failed = 0
+        self.lock = threading.Lock()
+        threads = [
+            threading.Thread(target=self.work, args=(index, options), name=f'worker-{index}')
+            for index in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        next_reclaim = time.monotonic() + options['reclaim_interval']
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=0.5)
+                if time.monotonic() >= next_reclaim:
+                    self.reclaim()
+                    next_reclaim = time.monotonic() + options['reclaim_interval']
+        except KeyboardInterrupt:
+            self.stop.set()
+
+        self.stdout.write(self.style.SUCCESS(f"Lavori completati: {self.done}, falliti: {self.failed}."))
+
+    def reclaim(self):
+        """Rimette in coda i lavori abbandonati (anche da questo processo, vedi `work`)."""
+        try:
+            reclaimed = queue.reclaim()
+        except DatabaseError as exc:
+            self.stderr.write(f"[reclaim] {exc}")
+            reclaimed = 0
+        finally:
+            connection.close()
+        if reclaimed:
+            self.stdout.write(f"{reclaimed} lavori rimessi in coda")
+
+    def work(self, index, options):
+        worker = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                try:
+                    jobs = queue.claim(worker, options['batch_size'])
+                except DatabaseError as exc:
+                    # Database occupato (lock di SQLite) o non raggiungibile: si riprova dopo una pausa
+                    self.stderr.write(f"[{worker}] {exc}")
+                    connection.close()
+                    self.stop.wait(options['poll'])
+                    continue
+                if not jobs:
+                    if options['once']:
+                        return
+                    self.stop.wait(options['poll'])
+                    continue
+                for job in jobs:
+                    started = time.monotonic()
+                    try:
+                        ok = queue.execute(job)
+                    except DatabaseError as exc:
+                        # Esito non salvato: il lavoro resta "in esecuzione" e, senza più
+                        # `heartbeat`, torna in coda al primo `reclaim` dopo JOBS_LOCK_TIMEOUT
+                        self.stderr.write(f"[{worker}] {job.name} #{job.pk}: {exc}")
+                        connection.close()
+                        ok = False
+                    with self.lock:
+                        if ok:
+                            self.done += 1
+                        else:
+                            self.failed += 1
+                    if options['verbosity'] > 1:
+                        self.stdout.write(
+                            f"[{worker}] {job.name} #{job.pk} {'ok' if ok else 'errore'} "
+                            f"in {(time.monotonic() - started) * 1000:.0f} ms"
+                        )
+        finally:
+            connection.close()
@@ -0,0 +1,47 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Lavoro in coda, eseguito dai worker di `run_workers`.
+
+    `key` è la chiave di idempotenza: finché esiste un lavoro non fallito
+    con la stessa chiave, un nuovo `enqueue` con quella chiave viene ignorato.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'In coda'),
+        (RUNNING, 'In esecuzione'),
+        (DONE, 'Completato'),
+        (FAILED, 'Fallito'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=~Q(status='failed'), name='job_key_uniq'),
+        ]
+        indexes = [
+            # Lavori pronti, nell'ordine in cui li prendono i worker
+            models.Index(fields=['run_at', 'id'], condition=Q(status='queued'), name='job_ready_idx'),
+            models.Index(fields=['status', 'finished_at'], name='job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
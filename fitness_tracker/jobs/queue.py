@@ -0,0 +1,207 @@
+"""Coda di lavori sul database dell'applicazione, senza broker esterni.
+
+Le viste accodano con `enqueue` (nella stessa transazione delle loro
+scritture, quindi il lavoro esiste solo se la scrittura è andata a buon
+fine) e tornano subito; `manage.py run_workers` prende i lavori pronti e li
+esegue.
+
+- Su PostgreSQL i worker prendono i lavori con `SELECT ... FOR UPDATE SKIP
+  LOCKED`, senza attendersi a vicenda.
+- Su SQLite (niente lock di riga) un `UPDATE` condizionato sullo stato
+  assegna ogni lavoro a un solo worker.
+- Il lavoro e il suo passaggio a "completato" stanno nella stessa
+  transazione: un errore annulla tutto e il lavoro torna in coda con attesa
+  esponenziale, fino a `max_attempts` tentativi. I lavori registrati con
+  `atomic=False` (import lunghi, fan-out a blocchi) confermano da soli ogni
+  blocco e devono poter ripartire da capo senza duplicare nulla.
+- I lavori rimasti "in esecuzione" oltre `JOBS_LOCK_TIMEOUT` senza segni
+  di vita (worker terminato, esito non salvato) tornano in coda: `run_workers`
+  chiama `reclaim` a intervalli regolari. I lavori lunghi chiamano
+  `heartbeat` dopo ogni blocco confermato, così non vengono mai ripresi da un
+  altro worker mentre sono ancora in esecuzione.
+"""
+import contextvars
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+# Lavori che gestiscono da soli le proprie transazioni
+_non_atomic = set()
+# Lavoro in esecuzione nel thread (per `heartbeat`)
+_running = contextvars.ContextVar('jobs_running', default=None)
+
+
+class LockLost(Exception):
+    """Il lavoro è stato rimesso in coda (`reclaim`) mentre era ancora in esecuzione."""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task(name, atomic=True):
+    """Registra una funzione come lavoro; viene chiamata con `**payload`.
+
+    Con `atomic=False` la funzione non gira in un'unica transazione: ciò che ha
+    già confermato resta anche se poi fallisce, e il nuovo tentativo deve
+    riconoscerlo (chiavi uniche, `ignore_conflicts`, duplicati scartati).
+    """
+    def register(func):
+        _tasks[name] = func
+        if atomic:
+            _non_atomic.discard(name)
+        else:
+            _non_atomic.add(name)
+        return func
+    return register
+
+
+def registered():
+    return sorted(_tasks)
+
+
+def enqueue(name, payload=None, key=None, delay=None, max_attempts=None):
+    """Accoda il lavoro `name`; ignorato se la chiave `key` è già in uso."""
+    if name not in _tasks:
+        raise ValueError(f"Lavoro non registrato: {name}")
+    job = Job(
+        name=name, payload=payload or {}, key=key,
+        run_at=timezone.now() + (delay or timedelta()),
+        max_attempts=max_attempts or _setting('JOBS_MAX_ATTEMPTS', 5),
+    )
+    # ON CONFLICT DO NOTHING / INSERT OR IGNORE sulla chiave di idempotenza
+    Job.objects.bulk_create([job], ignore_conflicts=True)
+
+
+def backoff(attempts):
+    """Attesa prima del tentativo successivo: raddoppia a ogni errore, con un po' di casualità."""
+    base = _setting('JOBS_BACKOFF_BASE', 10)
+    seconds = min(base * 2 ** (attempts - 1), _setting('JOBS_BACKOFF_MAX', 3600))
+    return timedelta(seconds=seconds * random.uniform(1, 1.25))
+
+
+def claim(worker, limit=1):
+    """Assegna a `worker` fino a `limit` lavori pronti e li restituisce."""
+    now = timezone.now()
+    ready = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(ready.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+        else:
+            ids = list(ready.values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        # Senza SKIP LOCKED due worker possono leggere gli stessi id: la
+        # condizione sullo stato fa vincere solo il primo UPDATE
+        Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+        return list(
+            Job.objects.filter(pk__in=ids, status=Job.RUNNING, locked_by=worker, locked_at=now).order_by('run_at', 'id')
+        )
+
+
+def _owned(job):
+    """Il lavoro, solo se è ancora assegnato a chi lo sta eseguendo."""
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by)
+
+
+def _mark_done(job):
+    _owned(job).update(
+        status=Job.DONE, finished_at=timezone.now(), locked_by='', locked_at=None, last_error='',
+    )
+
+
+def heartbeat():
+    """Rinnova il lock del lavoro in esecuzione, così `reclaim` non lo rimette in coda.
+
+    Da chiamare nei lavori lunghi dopo ogni blocco confermato; fuori da un
+    lavoro non fa nulla. Solleva `LockLost` se nel frattempo il lavoro è stato
+    rimesso in coda: proseguire lo eseguirebbe due volte in parallelo.
+    """
+    job = _running.get()
+    if job is None:
+        return
+    if not _owned(job).update(locked_at=timezone.now()):
+        raise LockLost(f"{job.name} #{job.pk}")
+
+
+def execute(job):
+    """Esegue un lavoro già assegnato; True se è stato completato."""
+    token = _running.set(job)
+    try:
+        func = _tasks.get(job.name)
+        if func is None:
+            raise LookupError(f"Lavoro non registrato: {job.name}")
+        if job.name in _non_atomic:
+            func(**job.payload)
+            _mark_done(job)
+        else:
+            with transaction.atomic():
+                func(**job.payload)
+                _mark_done(job)
+        return True
+    except LockLost:
+        # Ora appartiene a un altro tentativo: lo stato non va toccato
+        logger.warning("Lavoro %s #%s rimesso in coda durante l'esecuzione: interrotto", job.name, job.pk)
+        return False
+    except Exception:
+        logger.exception("Lavoro %s #%s fallito (tentativo %d di %d)", job.name, job.pk, job.attempts, job.max_attempts)
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            changes = {'status': Job.FAILED, 'finished_at': now}
+        else:
+            changes = {'status': Job.QUEUED, 'run_at': now + backoff(job.attempts)}
+        _owned(job).update(locked_by='', locked_at=None, last_error=traceback.format_exc(), **changes)
+        return False
+    finally:
+        _running.reset(token)
+
+
+def run_pending(worker='inline', limit=100):
+    """Esegue nel processo corrente i lavori pronti (test e comandi); restituisce quanti ne ha completati."""
+    return sum(execute(job) for job in claim(worker, limit))
+
+
+def reclaim():
+    """Rimette in coda i lavori senza segni di vita (`heartbeat`) da `JOBS_LOCK_TIMEOUT` secondi."""
+    cutoff = timezone.now() - timedelta(seconds=_setting('JOBS_LOCK_TIMEOUT', 600))
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    with transaction.atomic():
+        failed = stale.filter(attempts__gte=F('max_attempts')).update(
+            status=Job.FAILED, finished_at=timezone.now(), locked_by='', locked_at=None,
+            last_error="Worker interrotto durante l'esecuzione.",
+        )
+        requeued = stale.update(status=Job.QUEUED, locked_by='', locked_at=None)
+    return requeued + failed
+
+
+def purge():
+    """Cancella i lavori completati da più di `JOBS_RETENTION_DAYS` giorni."""
+    cutoff = timezone.now() - timedelta(days=_setting('JOBS_RETENTION_DAYS', 7))
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def stats():
+    """Conteggi per lavoro e stato, e attesa del lavoro pronto più vecchio."""
+    counts = {}
+    rows = Job.objects.order_by().values_list('name', 'status').annotate(total=Count('id'))
+    for name, status, total in rows:
+        counts.setdefault(name, dict.fromkeys(dict(Job.STATUS_CHOICES), 0))[status] = total
+    oldest = Job.objects.filter(status=Job.QUEUED, run_at__lte=timezone.now()).aggregate(oldest=Min('run_at'))['oldest']
+    return {
+        'counts': counts,
+        'oldest_ready_seconds': round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0,
+    }
@@ -0,0 +1,190 @@
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users import friends
+from users.models import CustomUser, FriendSuggestion
+from . import queue
+from .models import Job
+
+calls = []
+
+
+@queue.task('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@queue.task('tests.broken')
+def broken():
+    raise RuntimeError("rotto")
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        queue.enqueue('tests.record', {'value': 1})
+        queue.enqueue('tests.record', {'value': 2}, delay=timedelta(hours=1))
+        self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 1)
+        self.assertEqual(queue.run_pending(), 0)
+
+    def test_idempotency_key(self):
+        for _ in range(3):
+            queue.enqueue('tests.record', {'value': 1}, key='unico')
+        queue.run_pending()
+        queue.enqueue('tests.record', {'value': 1}, key='unico')
+        self.assertEqual(queue.run_pending(), 0)
+        self.assertEqual(calls, [1])
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(ValueError):
+            queue.enqueue('tests.inesistente')
+
+    def test_retries_with_backoff_then_fails(self):
+        queue.enqueue('tests.broken', max_attempts=2, key='rotto')
+        with self.assertLogs('jobs.queue', 'ERROR') as logs:
+            self.assertEqual(queue.run_pending(), 0)
+        self.assertIn('tentativo 1 di 2', logs.output[0])
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=9))
+        self.assertIn('RuntimeError', job.last_error)
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        # Dopo un fallimento definitivo la chiave si può riusare
+        queue.enqueue('tests.broken', key='rotto')
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_failed_task_rolls_back(self):
+        @queue.task('tests.partial')
+        def partial():
+            CustomUser.objects.create_user('mezzo')
+            raise RuntimeError("a metà")
+
+        queue.enqueue('tests.partial')
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run_pending()
+        self.assertFalse(CustomUser.objects.filter(username='mezzo').exists())
+
+    def test_non_atomic_task_keeps_committed_work(self):
+        @queue.task('tests.chunked', atomic=False)
+        def chunked():
+            CustomUser.objects.create_user('primo blocco')
+            raise RuntimeError("secondo blocco")
+
+        queue.enqueue('tests.chunked')
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run_pending()
+        self.assertTrue(CustomUser.objects.filter(username='primo blocco').exists())
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_reclaim_abandoned_jobs(self):
+        queue.enqueue('tests.record', {'value': 1})
+        queue.claim('morto')
+        self.assertEqual(queue.reclaim(), 0)
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(queue.reclaim(), 1)
+        self.assertEqual(queue.run_pending(), 1)
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_heartbeat_keeps_running_job(self):
+        @queue.task('tests.heartbeat', atomic=False)
+        def long_job():
+            # Il primo blocco è durato più di JOBS_LOCK_TIMEOUT
+            Job.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+            queue.heartbeat()
+            calls.append(queue.reclaim())
+
+        queue.enqueue('tests.heartbeat')
+        self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(calls, [0])
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_reclaimed_job_stops_at_heartbeat(self):
+        @queue.task('tests.reclaimed', atomic=False)
+        def reclaimed_job():
+            # Un altro worker l'ha rimesso in coda e ripreso
+            Job.objects.update(locked_by='altro')
+            queue.heartbeat()
+            calls.append('secondo blocco')
+
+        queue.enqueue('tests.reclaimed')
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            self.assertEqual(queue.run_pending(), 0)
+        self.assertEqual(calls, [])
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.locked_by, job.last_error), (Job.RUNNING, 'altro', ''))
+
+    def test_claim_is_exclusive(self):
+        for value in range(3):
+            queue.enqueue('tests.record', {'value': value})
+        first = queue.claim('a', limit=2)
+        second = queue.claim('b', limit=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+
+    def test_friendship_refreshes_suggestions_in_background(self):
+        anna, bruno, carla = (CustomUser.objects.create_user(name) for name in ('anna', 'bruno', 'carla'))
+        friends.add(anna, bruno)
+        friends.add(bruno, carla)
+        self.assertFalse(FriendSuggestion.objects.exists())
+        queue.run_pending()
+        self.assertEqual([s.suggested for s in friends.suggestions(anna)], [carla])
+
+    def test_status_page_is_staff_only(self):
+        queue.enqueue('tests.broken', max_attempts=1)
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run_pending()
+        self.client.force_login(CustomUser.objects.create_user('utente'))
+        self.assertEqual(self.client.get(reverse('job_status')).status_code, 302)
+        self.client.force_login(CustomUser.objects.create_user('admin', is_staff=True))
+        response = self.client.get(reverse('job_status'))
+        self.assertEqual(response.context['counts']['tests.broken'][Job.FAILED], 1)
+        self.assertContains(response, 'RuntimeError')
+
+
+class RunWorkersTests(TransactionTestCase):
+    def test_workers_drain_queue(self):
+        calls.clear()
+        for value in range(20):
+            queue.enqueue('tests.record', {'value': value})
+        out = StringIO()
+        # Un solo thread: il database di test in memoria condiviso non attende i lock tra connessioni
+        call_command('run_workers', concurrency=1, batch_size=4, once=True, stdout=out)
+        self.assertEqual(sorted(calls), list(range(20)))
+        self.assertIn('Lavori completati: 20', out.getvalue())
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 20)
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_workers_reclaim_periodically(self):
+        calls.clear()
+        queue.enqueue('tests.record', {'value': 'orfano'})
+        orphan = queue.claim('morto')[0]
+
+        @queue.task('tests.aging', atomic=False)
+        def aging():
+            # Il worker morto smette di dare segni di vita dopo l'avvio di run_workers
+            Job.objects.filter(pk=orphan.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+            time.sleep(1.5)
+
+        queue.enqueue('tests.aging')
+        out = StringIO()
+        # Il database di test in memoria non attende i lock: un reclaim può fallire e riprovare
+        call_command('run_workers', concurrency=1, once=True, reclaim_interval=0, stdout=out, stderr=StringIO())
+        self.assertIn('1 lavori rimessi in coda', out.getvalue())
+        self.assertEqual(calls, ['orfano'])
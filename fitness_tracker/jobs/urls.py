@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .views import job_status
+
+urlpatterns = [
+    path('', job_status, name='job_status'),
+]
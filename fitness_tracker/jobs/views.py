@@ -0,0 +1,22 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render
+
+from . import queue
+from .models import Job
+
+RECENT_FAILURES = 20
+
+
+@staff_member_required
+def job_status(request):
+    """Stato della coda: conteggi per lavoro, lavori in esecuzione e ultimi errori."""
+    context = queue.stats()
+    context.update({
+        'statuses': Job.STATUS_CHOICES,
+        'running': Job.objects.filter(status=Job.RUNNING).order_by('locked_at')
+                   .only('name', 'attempts', 'locked_by', 'locked_at'),
+        'failures': Job.objects.filter(status__in=[Job.QUEUED, Job.FAILED]).exclude(last_error='')
+                    .order_by('-id').only('name', 'status', 'attempts', 'max_attempts', 'run_at', 'last_error')
+                    [:RECENT_FAILURES],
+    })
+    return render(request, 'jobs/status.html', context)
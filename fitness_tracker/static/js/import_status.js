@@ -0,0 +1,10 @@
+// Avanzamento di un import in coda: ricarica la pagina ogni RELOAD_MS finché
+// l'import non è completato o fallito.
+(function () {
+  const RELOAD_MS = 2000;
+
+  const status = document.querySelector('[data-import-running]');
+  if (!status) return;
+
+  setTimeout(() => window.location.reload(), RELOAD_MS);
+})();
@@ -0,0 +1,66 @@
+// Aggiornamenti in tempo reale da `feed/stream/` (Server-Sent Events):
+// i nuovi workout degli amici compaiono in cima al feed e i progressi degli
+// obiettivi si aggiornano senza ricaricare la pagina. EventSource si
+// riconnette da solo e riprende dall'ultimo evento ricevuto.
+(function () {
+  const script = document.currentScript;
+  if (!script || !window.EventSource) return;
+
+  const feed = document.getElementById('feed-live');
+  const goals = document.getElementById('activity-goals');
+  // Le credenziali servono quando lo stream è su un altro host (REALTIME_STREAM_URL)
+  const source = new EventSource(script.dataset.streamUrl, { withCredentials: true });
+
+  function paragraph(label, value) {
+    const p = document.createElement('p');
+    p.className = 'card-text';
+    const strong = document.createElement('strong');
+    strong.textContent = label + ':';
+    p.append(strong, ' ' + value);
+    return p;
+  }
+
+  function card(workout) {
+    const body = document.createElement('div');
+    body.className = 'card-body';
+    const title = document.createElement('h5');
+    title.className = 'card-title';
+    title.textContent = workout.username + ' 🏋️';
+    body.append(
+      title,
+      paragraph('Tipo', workout.type),
+      paragraph('Durata', workout.duration_minutes + ' minuti'),
+      paragraph('Data', workout.date),
+    );
+    if (workout.notes) {
+      const notes = document.createElement('p');
+      notes.className = 'card-text text-muted';
+      notes.textContent = workout.notes;
+      body.append(notes);
+    }
+    const wrapper = document.createElement('div');
+    wrapper.className = 'card mb-3 new';
+    wrapper.append(body);
+    return wrapper;
+  }
+
+  source.addEventListener('feed', (event) => {
+    if (!feed) return;
+    // Arrivano dal più vecchio al più recente: ognuno va in cima
+    for (const workout of JSON.parse(event.data)) feed.prepend(card(workout));
+  });
+
+  source.addEventListener('obiettivi', (event) => {
+    if (!goals) return;
+    const progress = JSON.parse(event.data);
+    for (const [type, activity] of Object.entries(progress.activities)) {
+      const item = goals.querySelector(`.goal-item[data-type="${type}"]`);
+      if (!item) continue;
+      item.querySelector('.goal-current').textContent = activity.current;
+      const status = item.querySelector('.goal-status');
+      status.textContent = activity.met ? '✅ Completato' : '⏳ In corso';
+      status.classList.toggle('success', activity.met);
+      status.classList.toggle('progress', !activity.met);
+    }
+  });
+})();
@@ -0,0 +1,16 @@
+// Badge delle notifiche non lette nella barra di navigazione: il conteggio
+// arriva da un contatore mantenuto sul server, letto dopo il caricamento
+// della pagina così non pesa sul rendering di ogni vista.
+(function () {
+  const badge = document.getElementById('notification-count');
+  if (!badge) return;
+
+  function show(unread) {
+    badge.textContent = unread > 99 ? '99+' : String(unread);
+    badge.hidden = unread === 0;
+  }
+
+  fetch(badge.dataset.url, { headers: { 'Accept': 'application/json' } })
+    .then((response) => (response.ok ? response.json() : null))
+    .then((data) => { if (data) show(data.unread); });
+})();
@@ -0,0 +1,53 @@
+// Autocompletamento della ricerca utenti: una richiesta solo quando si smette
+// di scrivere per DEBOUNCE_MS, e le risposte superate vengono annullate.
+(function () {
+  const DEBOUNCE_MS = 200;
+  const MIN_LENGTH = 2;
+
+  const input = document.querySelector('.autocomplete input[name="q"]');
+  const list = document.querySelector('.autocomplete .suggestions');
+  if (!input || !list) return;
+
+  let timer = null;
+  let controller = null;
+
+  function render(results) {
+    list.replaceChildren(...results.map((user) => {
+      const item = document.createElement('li');
+      const link = document.createElement('a');
+      link.href = '?q=' + encodeURIComponent(user.username);
+      link.textContent = user.name ? `${user.username} — ${user.name}` : user.username;
+      if (user.is_friend) link.textContent += ' · amico';
+      if (user.is_my_coach) link.textContent += ' · il tuo coach';
+      item.appendChild(link);
+      return item;
+    }));
+    list.hidden = results.length === 0;
+  }
+
+  async function suggest(query) {
+    if (controller) controller.abort();
+    controller = new AbortController();
+    try {
+      const response = await fetch(`${list.dataset.url}?q=${encodeURIComponent(query)}`, {
+        signal: controller.signal,
+        headers: { 'Accept': 'application/json' },
+      });
+      if (response.ok) render((await response.json()).results);
+    } catch (error) {
+      if (error.name !== 'AbortError') throw error;
+    }
+  }
+
+  input.addEventListener('input', () => {
+    clearTimeout(timer);
+    const query = input.value.trim();
+    if (query.length < MIN_LENGTH) {
+      render([]);
+      return;
+    }
+    timer = setTimeout(() => suggest(query), DEBOUNCE_MS);
+  });
+
+  input.addEventListener('blur', () => setTimeout(() => { list.hidden = true; }, 150));
+})();
@@ -0,0 +1,159 @@
+"""Analisi del carico di allenamento di tutti gli atleti di un coach.
+
+I minuti giornalieri degli ultimi due anni arrivano dagli aggregati
+`WorkoutRollup` con una sola query SQL, come tuple di interi (il giorno è già
+un numero calcolato dal database), e vengono messi in una matrice atleti ×
+giorni; ogni indicatore è un'operazione NumPy sull'intera matrice, senza cicli
+Python per atleta:
+
+- carico acuto (media degli ultimi 7 giorni) e cronico (ultimi 28);
+- rapporto acuto:cronico (ACWR), con la soglia di sovraccarico a 1,5, e
+  giorni passati sopra soglia in tutto lo storico (dalle somme cumulative);
+- tendenza: pendenza dei minuti settimanali nelle ultime 8 settimane;
+- percentile del carico cronico nel gruppo e percentili del gruppo;
+- segnalazioni di sovraccarico e di calo improvviso.
+"""
+from datetime import date, timedelta
+from functools import partial
+from itertools import chain
+
+import numpy as np
+from django.db import connection
+
+from workouts.models import WorkoutRollup
+from .models import Goal
+
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+TREND_WEEKS = 8
+# Giorni di storico (due anni) caricati per il conteggio dei giorni in sovraccarico
+HISTORY_DAYS = 2 * 365
+OVERLOAD_RATIO = 1.5
+DROP_RATIO = 0.5
+# Sotto questo carico cronico (minuti al giorno) un calo non è significativo
+MIN_CHRONIC_MINUTES = 10
+COHORT_PERCENTILES = (25, 50, 75, 90)
+
+OVERLOAD = 'sovraccarico'
+DROP = 'calo improvviso'
+
+# Ogni riga arriva come un solo intero, (atleta << 32) | (giorno << 20) | minuti:
+# un valore per riga invece di una tupla di tre costa la metà da leggere
+DAY_BITS, MINUTE_BITS = 12, 20
+FETCH_SIZE = 50_000
+
+# Giorni tra `start` e il primo giorno analizzato, come intero
+DAY_OFFSET_SQL = {
+    'sqlite': "CAST(julianday({start}) - julianday(%s) AS INTEGER)",
+    'postgresql': "({start} - %s::date)",
+}
+
+
+def daily_minutes(coach, first_day):
+    """Colonne (atleta, giorno, minuti) degli aggregati giornalieri dal `first_day`.
+
+    Niente ORM: convertire milioni di righe in `date` e tuple costa più
+    dell'intera analisi. Il giorno è il numero di giorni da `first_day`.
+    """
+    quote = connection.ops.quote_name
+    rollup, goal = WorkoutRollup._meta, Goal._meta
+    user, start = quote(rollup.get_field('user').column), quote(rollup.get_field('start').column)
+    offset = DAY_OFFSET_SQL[connection.vendor].format(start=start)
+    sql = (
+        f"SELECT ({user} * {1 << DAY_BITS} + {offset}) * {1 << MINUTE_BITS} "
+        f"+ {quote(rollup.get_field('minutes').column)} FROM {quote(rollup.db_table)} "
+        f"WHERE {user} IN (SELECT {quote(goal.get_field('athlete').column)} FROM {quote(goal.db_table)} "
+        f"WHERE {quote(goal.get_field('coach').column)} = %s) "
+        f"AND {quote(rollup.get_field('period').column)} = %s AND {start} >= %s"
+    )
+    first = connection.ops.adapt_datefield_value(first_day)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [first, coach.pk, WorkoutRollup.DAY, first])
+        # fetchmany a blocchi: iterare sul cursore di Django passa da un generatore per riga
+        chunks = iter(partial(cursor.fetchmany, FETCH_SIZE), [])
+        packed = np.fromiter(chain.from_iterable(chain.from_iterable(chunks)), np.int64)
+    return (
+        packed >> (DAY_BITS + MINUTE_BITS),
+        (packed >> MINUTE_BITS) & ((1 << DAY_BITS) - 1),
+        packed & ((1 << MINUTE_BITS) - 1),
+    )
+
+
+def daily_matrix(user_ids, users, days_from_start, minutes, days):
+    """Matrice (atleti × giorni) dei minuti dalle colonne (user_id, giorno, minuti).
+
+    `user_ids` deve essere ordinato; i minuti di più tipi nello stesso
+    giorno vengono sommati con `np.bincount` sugli indici di cella.
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    if len(users) == 0:
+        return np.zeros((len(user_ids), days), dtype=np.float64)
+    users, columns = np.asarray(users, dtype=np.int64), np.asarray(days_from_start, dtype=np.int64)
+    minutes = np.asarray(minutes, dtype=np.float64)
+    inside = (columns >= 0) & (columns < days)
+    cells = np.searchsorted(user_ids, users[inside]) * days + columns[inside]
+    return np.bincount(cells, weights=minutes[inside], minlength=len(user_ids) * days).reshape(len(user_ids), days)
+
+
+def analyze(matrix):
+    """Indicatori per ogni riga della matrice atleti × giorni (l'ultima colonna è oggi)."""
+    # Medie mobili di tutti i giorni a partire dal 28° con le somme cumulative
+    sums = np.concatenate((np.zeros((len(matrix), 1)), np.cumsum(matrix, axis=1)), axis=1)
+    acute_series = (sums[:, CHRONIC_DAYS:] - sums[:, CHRONIC_DAYS - ACUTE_DAYS:-ACUTE_DAYS]) / ACUTE_DAYS
+    chronic_series = (sums[:, CHRONIC_DAYS:] - sums[:, :-CHRONIC_DAYS]) / CHRONIC_DAYS
+    ratio_series = np.divide(acute_series, chronic_series, out=np.zeros_like(acute_series), where=chronic_series > 0)
+    acute, chronic, ratio = acute_series[:, -1], chronic_series[:, -1], ratio_series[:, -1]
+
+    # Minuti per settimana (dalla più vecchia) e pendenza per tutti gli atleti in una regressione
+    weeks = matrix[:, -TREND_WEEKS * 7:].reshape(len(matrix), TREND_WEEKS, 7).sum(axis=2)
+    trend = np.polyfit(np.arange(TREND_WEEKS), weeks.T, 1)[0] if len(matrix) else np.zeros(0)
+
+    # Percentile di ciascuno (0-100) dal rango del carico cronico
+    ranks = chronic.argsort(kind='stable').argsort()
+    percentile = ranks * 100.0 / max(len(chronic) - 1, 1)
+
+    overload = ratio > OVERLOAD_RATIO
+    drop = (chronic >= MIN_CHRONIC_MINUTES) & (acute < DROP_RATIO * chronic)
+    return {
+        'acute': acute,
+        'chronic': chronic,
+        'ratio': ratio,
+        'overload_days': (ratio_series > OVERLOAD_RATIO).sum(axis=1),
+        'trend': trend,
+        'percentile': percentile,
+        'overload': overload,
+        'drop': drop,
+        'cohort': dict(zip(
+            COHORT_PERCENTILES,
+            np.percentile(chronic, COHORT_PERCENTILES) if len(chronic) else [0.0] * len(COHORT_PERCENTILES),
+        )),
+    }
+
+
+def coach_report(coach, today=None):
+    """Righe per atleta (ordinate per ACWR decrescente) e percentili del gruppo."""
+    today = today or date.today()
+    first_day = today - timedelta(days=HISTORY_DAYS - 1)
+    athletes = dict(
+        Goal.objects.filter(coach=coach).order_by('athlete_id').values_list('athlete_id', 'athlete__username')
+    )
+    user_ids = list(athletes)
+    matrix = daily_matrix(user_ids, *daily_minutes(coach, first_day), HISTORY_DAYS)
+    result = analyze(matrix)
+
+    report = []
+    for index in np.argsort(-result['ratio'], kind='stable'):
+        flags = [name for name, key in ((OVERLOAD, 'overload'), (DROP, 'drop')) if result[key][index]]
+        report.append({
+            'athlete_id': user_ids[index],
+            'username': athletes[user_ids[index]],
+            'acute': round(float(result['acute'][index]), 1),
+            'chronic': round(float(result['chronic'][index]), 1),
+            'ratio': round(float(result['ratio'][index]), 2),
+            'overload_days': int(result['overload_days'][index]),
+            'trend': round(float(result['trend'][index]), 1),
+            'percentile': round(float(result['percentile'][index])),
+            'flags': flags,
+        })
+    cohort = {key: round(float(value), 1) for key, value in result['cohort'].items()}
+    return report, cohort
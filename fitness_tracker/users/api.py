@@ -0,0 +1,70 @@
+"""API JSON di obiettivi e dashboard del coach."""
+from django.http import JsonResponse
+
+from core.api import api_login_required, page_size, requested_fields, versioned
+from workouts import totals
+from . import dashboard
+from .models import Goal, UserVersion
+
+ACTIVITY_FIELDS = {'run': 'target_running_minutes', 'swim': 'target_swimming_minutes', 'bike': 'target_cycling_minutes'}
+COACH_FIELDS = ['athlete', 'weight_kg', 'target_weight', 'run_minutes', 'swim_minutes', 'bike_minutes', 'goals_met']
+
+
+def goal_progress(user):
+    """Obiettivi dell'atleta e minuti correnti (usato anche dallo stream in tempo reale)."""
+    goal = Goal.objects.filter(athlete=user).select_related('coach').first()
+    minutes = totals.minutes_by_type(user)
+    activities = {}
+    if goal:
+        for workout_type, target_field in ACTIVITY_FIELDS.items():
+            target = getattr(goal, target_field)
+            if target is not None:
+                activities[workout_type] = {
+                    'current': minutes[workout_type],
+                    'target': target,
+                    'met': minutes[workout_type] >= target,
+                }
+    return {
+        'coach': goal.coach.username if goal else None,
+        'weight_kg': user.weight_kg,
+        'target_weight': goal.target_weight if goal else None,
+        'activities': activities,
+    }
+
+
+@api_login_required
+@versioned(UserVersion.GOALS)
+def goals_api(request):
+    return JsonResponse(goal_progress(request.user))
+
+
+@api_login_required
+@versioned(UserVersion.COACH)
+def coach_api(request):
+    """Progressi degli atleti del coach, in ordine di username (cursore = ultimo username)."""
+    fields = requested_fields(request, COACH_FIELDS)
+    size = page_size(request)
+    goals = dashboard.athlete_progress(request.user, sort='atleta')
+    cursor = request.GET.get('cursor')
+    if cursor:
+        goals = goals.filter(athlete__username__gt=cursor)
+    goals = list(goals[:size + 1])
+
+    next_cursor = None
+    if len(goals) > size:
+        goals = goals[:size]
+        next_cursor = goals[-1].athlete.username
+
+    results = []
+    for goal in goals:
+        row = {
+            'athlete': goal.athlete.username,
+            'weight_kg': goal.athlete.weight_kg,
+            'target_weight': goal.target_weight,
+            'run_minutes': goal.run_minutes,
+            'swim_minutes': goal.swim_minutes,
+            'bike_minutes': goal.bike_minutes,
+            'goals_met': goal.goals_met,
+        }
+        results.append({name: row[name] for name in fields})
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
@@ -0,0 +1,126 @@
+"""Storico di peso e altezza (`BodyMeasurement`) e andamento del peso.
+
+I calcoli sull'andamento lavorano su array NumPy: la serie viene portata su
+una griglia giornaliera (interpolando i giorni senza misura), le medie
+mobili si ottengono dalle somme cumulative e la pendenza da una regressione
+lineare sugli ultimi giorni, senza cicli Python sui punti.
+"""
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+
+from .models import BodyMeasurement, Goal
+
+WINDOWS = (7, 30)
+# Giorni usati per stimare la velocità di variazione del peso
+FIT_DAYS = 30
+# Sotto questa differenza (kg) l'obiettivo è considerato raggiunto
+TOLERANCE_KG = 0.1
+
+
+def record(user, day=None):
+    """Salva peso e altezza correnti di `user` come misura del giorno."""
+    if user.weight_kg is None and user.height_cm is None:
+        return
+    BodyMeasurement.objects.update_or_create(
+        user=user, date=day or date.today(),
+        defaults={'weight_kg': user.weight_kg, 'height_cm': user.height_cm, 'samples': 1},
+    )
+
+
+def weight_series(user, since=None):
+    """(date, pesi) in ordine cronologico come array NumPy (ordinali dei giorni, kg)."""
+    rows = BodyMeasurement.objects.filter(user=user, weight_kg__isnull=False)
+    if since:
+        rows = rows.filter(date__gte=since)
+    rows = list(rows.order_by('date').values_list('date', 'weight_kg'))
+    days = np.fromiter((day.toordinal() for day, _ in rows), dtype=np.int64, count=len(rows))
+    weights = np.fromiter((weight for _, weight in rows), dtype=np.float64, count=len(rows))
+    return days, weights
+
+
+def moving_average(values, window):
+    """Media mobile sugli ultimi `window` valori (meno all'inizio della serie)."""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - window, 0)
+    return (sums[end] - sums[start]) / (end - start)
+
+
+def trend(days, weights, target=None, windows=WINDOWS, fit_days=FIT_DAYS):
+    """Serie giornaliera, medie mobili, pendenza e data prevista per `target`."""
+    if len(days) == 0:
+        return None
+    grid = np.arange(days[0], days[-1] + 1)
+    daily = np.interp(grid, days, weights)
+
+    recent = slice(-min(fit_days, len(grid)), None)
+    if len(grid[recent]) >= 2:
+        slope, intercept = np.polyfit(grid[recent] - grid[-1], daily[recent], 1)
+    else:
+        slope, intercept = 0.0, daily[-1]
+
+    projected = None
+    if target is not None:
+        remaining = target - intercept
+        if abs(remaining) <= TOLERANCE_KG:
+            projected = date.fromordinal(int(grid[-1]))
+        elif slope and remaining / slope > 0:
+            projected = date.fromordinal(int(grid[-1]) + math.ceil(remaining / slope))
+
+    measured = np.zeros(len(grid), dtype=bool)
+    measured[days - days[0]] = True
+    return {
+        'dates': [date.fromordinal(int(day)).isoformat() for day in grid],
+        'weight': np.round(daily, 2).tolist(),
+        'measured': measured.tolist(),
+        'moving_averages': {str(window): np.round(moving_average(daily, window), 2).tolist() for window in windows},
+        'current': round(float(intercept), 2),
+        'kg_per_week': round(float(slope) * 7, 2),
+        'target_weight': target,
+        'projected_date': projected.isoformat() if projected else None,
+    }
+
+
+def user_trend(user, since=None):
+    goal = Goal.objects.filter(athlete=user).only('target_weight').first()
+    days, weights = weight_series(user, since)
+    return trend(days, weights, goal.target_weight if goal else None)
+
+
+def downsample(before, user_ids=None):
+    """Accorpa per settimana le misure precedenti a `before`.
+
+    Ogni settimana diventa una riga al lunedì con la media pesata sul numero
+    di misure; restituisce le righe eliminate.
+    """
+    rows = BodyMeasurement.objects.filter(date__lt=before)
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    weeks = defaultdict(list)
+    for row in rows.order_by('user_id', 'date').iterator(chunk_size=2000):
+        weeks[(row.user_id, row.date - timedelta(days=row.date.weekday()))].append(row)
+
+    removed, merged = [], []
+    for (user_id, monday), group in weeks.items():
+        if len(group) == 1 and group[0].date == monday:
+            continue
+        samples = sum(row.samples for row in group)
+        weighted = [row for row in group if row.weight_kg is not None]
+        merged.append(BodyMeasurement(
+            user_id=user_id, date=monday, samples=samples,
+            weight_kg=(
+                sum(row.weight_kg * row.samples for row in weighted) / sum(row.samples for row in weighted)
+                if weighted else None
+            ),
+            height_cm=next((row.height_cm for row in reversed(group) if row.height_cm is not None), None),
+        ))
+        removed += [row.pk for row in group]
+    with transaction.atomic():
+        for start in range(0, len(removed), 1000):
+            BodyMeasurement.objects.filter(pk__in=removed[start:start + 1000]).delete()
+        BodyMeasurement.objects.bulk_create(merged, batch_size=1000)
+    return len(removed) - len(merged)
@@ -0,0 +1,70 @@
+"""Dashboard del coach: obiettivi e progressi di tutti gli atleti in un'unica query."""
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Goal
+
+# Parametro ?ordina= -> espressione di ordinamento
+SORT_FIELDS = {
+    'atleta': 'athlete__username',
+    'corsa': 'run_minutes',
+    'nuoto': 'swim_minutes',
+    'bici': 'bike_minutes',
+    'peso': 'athlete__weight_kg',
+    'obiettivi': 'goals_met',
+}
+
+ACTIVITIES = [
+    ('run', 'run_minutes', 'target_running_minutes'),
+    ('swim', 'swim_minutes', 'target_swimming_minutes'),
+    ('bike', 'bike_minutes', 'target_cycling_minutes'),
+]
+
+
+def _met(minutes_field, target_field):
+    """1 se l'obiettivo di minuti è raggiunto o assente, altrimenti 0."""
+    return Case(
+        When(Q(**{f'{target_field}__isnull': True}) | Q(**{f'{minutes_field}__gte': F(target_field)}), then=Value(1)),
+        default=Value(0),
+    )
+
+
+def athlete_progress(coach, search='', status='', sort='atleta'):
+    """Obiettivi del coach con i minuti correnti di ogni atleta.
+
+    I minuti arrivano dai totali mantenuti (`WorkoutTotal`) con un solo
+    aggregato raggruppato per obiettivo, quindi il numero di query non
+    dipende dal numero di atleti.
+    """
+    totals = {
+        minutes_field: Coalesce(
+            Sum('athlete__workout_totals__minutes', filter=Q(athlete__workout_totals__type=workout_type)),
+            Value(0),
+        )
+        for workout_type, minutes_field, _ in ACTIVITIES
+    }
+    goals = (
+        Goal.objects.filter(coach=coach)
+        .select_related('athlete')
+        .only(
+            'target_weight', 'target_running_minutes', 'target_swimming_minutes', 'target_cycling_minutes',
+            'athlete__id', 'athlete__username', 'athlete__weight_kg',
+        )
+        .annotate(**totals)
+        .annotate(goals_met=sum(
+            (_met(minutes_field, target_field) for _, minutes_field, target_field in ACTIVITIES),
+            Value(0),
+        ))
+    )
+
+    if search:
+        goals = goals.filter(athlete__username__istartswith=search)
+    if status == 'completati':
+        goals = goals.filter(goals_met=len(ACTIVITIES))
+    elif status == 'in_corso':
+        goals = goals.filter(goals_met__lt=len(ACTIVITIES))
+
+    descending = sort.startswith('-')
+    field = SORT_FIELDS.get(sort.lstrip('-'), SORT_FIELDS['atleta'])
+    ordering = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+    return goals.order_by(ordering, 'athlete__id')
@@ -23,7 +23,10 @@ class PersonalDataForm(forms.ModelForm):
 
 # Form per la ricerca utenti
 class UserSearchForm(forms.Form):
-    username = forms.CharField(label="Cerca utente", max_length=150)
+    q = forms.CharField(
+        label="Cerca utente", max_length=150,
+        widget=forms.TextInput(attrs={'autocomplete': 'off', 'placeholder': "Username, nome o email"}),
+    )
 
 # Form per l'impostazione degli obiettivi da parte del coach
 # forms.py
@@ -0,0 +1,158 @@
+"""Grafo delle amicizie.
+
+`CustomUser.friends` è un M2M con `symmetrical=False`: un'amicizia sono due
+righe, (a, b) e (b, a). Ogni operazione qui le scrive o cancella entrambe
+nella stessa transazione, insieme al feed materializzato e ai contatori di
+versione, così non possono restare amicizie "a metà".
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+
+from jobs import queue
+from workouts import feed
+from . import versions
+from .models import CustomUser, FriendSuggestion, UserVersion
+
+Friendship = CustomUser.friends.through
+
+SUGGESTIONS_PER_USER = 20
+CHUNK_SIZE = 500
+FORGET_CHUNK_SIZE = 200
+
+
+def _id(user):
+    return user if isinstance(user, int) else user.pk
+
+
+def friend_ids(user):
+    return Friendship.objects.filter(from_customuser_id=_id(user)).values_list('to_customuser_id', flat=True)
+
+
+def are_friends(user, other):
+    return Friendship.objects.filter(from_customuser_id=_id(user), to_customuser_id=_id(other)).exists()
+
+
+def _forget_suggestions(pairs):
+    pairs = list(pairs)
+    # A blocchi: una catena di OR troppo lunga supera la profondità massima delle espressioni di SQLite
+    for start in range(0, len(pairs), FORGET_CHUNK_SIZE):
+        condition = Q()
+        for user_id, other_id in pairs[start:start + FORGET_CHUNK_SIZE]:
+            condition |= Q(user_id=user_id, suggested_id=other_id)
+        FriendSuggestion.objects.filter(condition).delete()
+
+
+def _refresh_later(user_ids):
+    """Accoda il ricalcolo dei suggerimenti di chi ha cambiato amicizie."""
+    user_ids = sorted(user_ids)
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        queue.enqueue('users.refresh_suggestions', {'user_ids': user_ids[start:start + CHUNK_SIZE]})
+
+
+def add(user, other):
+    """Rende amici `user` e `other`; restituisce False se lo erano già."""
+    return bulk_add([(_id(user), _id(other))]) > 0
+
+
+def bulk_add(pairs):
+    """Crea in blocco le amicizie `(user_id, other_id)` in entrambe le direzioni.
+
+    Pensato per import e onboarding di squadre: le righe mancanti vengono
+    inserite con un solo `bulk_create`, il feed viene riempito con una query
+    per nuovo amico e le versioni incrementate una volta per utente.
+    Restituisce il numero di amicizie nuove.
+    """
+    edges = set()
+    for user_id, other_id in pairs:
+        if user_id != other_id:
+            edges.update({(user_id, other_id), (other_id, user_id)})
+    if not edges:
+        return 0
+
+    with transaction.atomic():
+        user_ids = {user_id for user_id, _ in edges}
+        existing = set(
+            Friendship.objects.filter(from_customuser_id__in=user_ids, to_customuser_id__in=user_ids)
+            .values_list('from_customuser_id', 'to_customuser_id')
+        )
+        new_edges = sorted(edges - existing)
+        if not new_edges:
+            return 0
+        Friendship.objects.bulk_create(
+            [Friendship(from_customuser_id=owner_id, to_customuser_id=friend_id) for owner_id, friend_id in new_edges],
+            batch_size=CHUNK_SIZE, ignore_conflicts=True,
+        )
+        feed.follow_many(new_edges)
+        _forget_suggestions(new_edges)
+        changed = {user_id for edge in new_edges for user_id in edge}
+        versions.bump(changed, UserVersion.FEED)
+        _refresh_later(changed)
+    # Ogni amicizia sono due righe
+    return len({frozenset(edge) for edge in new_edges})
+
+
+def remove(user, other):
+    """Rompe l'amicizia in entrambe le direzioni; False se non esisteva."""
+    user_id, other_id = _id(user), _id(other)
+    with transaction.atomic():
+        deleted, _ = Friendship.objects.filter(
+            Q(from_customuser_id=user_id, to_customuser_id=other_id)
+            | Q(from_customuser_id=other_id, to_customuser_id=user_id)
+        ).delete()
+        if not deleted:
+            return False
+        feed.unfollow(user_id, other_id)
+        feed.unfollow(other_id, user_id)
+        versions.bump([user_id, other_id], UserVersion.FEED)
+        _refresh_later([user_id, other_id])
+    return True
+
+
+# ----------------- AMICI IN COMUNE E SUGGERIMENTI -----------------
+
+def mutual_friends(user, other):
+    """Amici che `user` e `other` hanno in comune."""
+    return CustomUser.objects.filter(id__in=friend_ids(user)).filter(id__in=friend_ids(other))
+
+
+def friends_of_friends(user, limit=SUGGESTIONS_PER_USER):
+    """(id, amici in comune) degli amici di amici che non sono già amici.
+
+    Una sola query: join della tabella delle amicizie con sé stessa,
+    raggruppata per candidato e ordinata per numero di amici in comune.
+    """
+    user_id = _id(user)
+    return list(
+        Friendship.objects.filter(from_customuser_id__in=friend_ids(user_id))
+        .exclude(to_customuser_id=user_id)
+        .exclude(to_customuser_id__in=friend_ids(user_id))
+        .values('to_customuser_id')
+        .annotate(mutual=Count('id'))
+        .order_by('-mutual', 'to_customuser_id')
+        .values_list('to_customuser_id', 'mutual')[:limit]
+    )
+
+
+def refresh_suggestions(user_ids, limit=SUGGESTIONS_PER_USER):
+    """Ricalcola i suggerimenti salvati per gli utenti indicati."""
+    rows = []
+    for user_id in user_ids:
+        rows += [
+            FriendSuggestion(user_id=user_id, suggested_id=suggested_id, mutual_count=mutual)
+            for suggested_id, mutual in friends_of_friends(user_id, limit)
+        ]
+    with transaction.atomic():
+        FriendSuggestion.objects.filter(user_id__in=user_ids).delete()
+        FriendSuggestion.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+    return len(rows)
+
+
+def suggestions(user, limit=10):
+    """Suggerimenti precalcolati, dal più probabile."""
+    return (
+        FriendSuggestion.objects.filter(user=user)
+        .select_related('suggested')
+        .only('mutual_count', 'suggested__id', 'suggested__username', 'suggested__first_name',
+              'suggested__last_name', 'suggested__is_coach')
+        .order_by('-mutual_count', 'suggested_id')[:limit]
+    )
@@ -0,0 +1,17 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from users import body
+
+
+class Command(BaseCommand):
+    help = "Accorpa per settimana le misure di peso e altezza più vecchie di --giorni."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--giorni', type=int, default=365,
+                            help="Le misure più recenti di così restano giornaliere.")
+
+    def handle(self, *args, **options):
+        removed = body.downsample(date.today() - timedelta(days=options['giorni']))
+        self.stdout.write(self.style.SUCCESS(f"Misure accorpate: {removed} righe in meno."))
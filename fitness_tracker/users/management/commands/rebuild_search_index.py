@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users import search
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Ricalcola i trigrammi della ricerca utenti (dopo import in blocco che saltano i segnali)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if search.uses_trigram_index():
+            self.stdout.write("PostgreSQL usa gli indici trigram: niente da ricalcolare.")
+            return
+
+        chunk = []
+        total_users = total_grams = 0
+        users = CustomUser.objects.only(*search.SEARCH_FIELDS).order_by('id')
+        for user in users.iterator(chunk_size=options['chunk_size']):
+            chunk.append(user)
+            if len(chunk) >= options['chunk_size']:
+                with transaction.atomic():
+                    total_grams += search.index_users(chunk)
+                total_users += len(chunk)
+                chunk = []
+        if chunk:
+            with transaction.atomic():
+                total_grams += search.index_users(chunk)
+            total_users += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indice di ricerca ricostruito per {total_users} utenti ({total_grams} trigrammi)."
+        ))
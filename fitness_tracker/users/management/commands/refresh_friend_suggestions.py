@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from users import friends
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola i suggerimenti di amicizia (amici di amici). "
+        "Da eseguire periodicamente, ad esempio ogni notte con un cron job."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--limit', type=int, default=friends.SUGGESTIONS_PER_USER,
+                            help="Suggerimenti salvati per utente.")
+
+    def handle(self, *args, **options):
+        # Solo chi ha almeno un amico può avere amici di amici
+        user_ids = (
+            CustomUser.objects.filter(friends__isnull=False).distinct()
+            .order_by('id').values_list('id', flat=True)
+        )
+        chunk, total_users, total_rows = [], 0, 0
+        for user_id in user_ids.iterator(chunk_size=options['chunk_size']):
+            chunk.append(user_id)
+            if len(chunk) >= options['chunk_size']:
+                total_rows += friends.refresh_suggestions(chunk, options['limit'])
+                total_users += len(chunk)
+                chunk = []
+        if chunk:
+            total_rows += friends.refresh_suggestions(chunk, options['limit'])
+            total_users += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Suggerimenti ricalcolati per {total_users} utenti ({total_rows} righe)."
+        ))
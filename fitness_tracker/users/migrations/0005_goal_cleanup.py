@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_remove_goal_activity_achieved_remove_goal_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='goal',
+            name='completed_cycling',
+        ),
+        migrations.RemoveField(
+            model_name='goal',
+            name='completed_running',
+        ),
+        migrations.RemoveField(
+            model_name='goal',
+            name='completed_swimming',
+        ),
+        migrations.RemoveField(
+            model_name='goal',
+            name='completed_weight',
+        ),
+        migrations.AlterField(
+            model_name='goal',
+            name='athlete',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='goals', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='goal',
+            name='coach',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coached_goals', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
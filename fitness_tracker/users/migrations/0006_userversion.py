@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_goal_cleanup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('feed', 'Feed'), ('workouts', 'Workout'), ('goals', 'Obiettivi'), ('coach', 'Dashboard coach'), ('profile', 'Scheda personale')], max_length=10)),
+                ('value', models.PositiveBigIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'scope'), name='userversion_user_scope_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:22
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Copia di `users.search` com'era in questa migrazione: le migrazioni non
+# importano codice dell'app, che può cambiare dopo
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def ngrams(*texts):
+    grams = set()
+    for text in texts:
+        for word in _WORD.findall(normalize(text)):
+            padded = f'  {word} '
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in SEARCH_FIELDS:
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS users_customuser_{column}_trgm "
+                f"ON users_customuser USING gin ({column} gin_trgm_ops)"
+            )
+        return
+    CustomUser = apps.get_model('users', 'CustomUser')
+    UserSearchGram = apps.get_model('users', 'UserSearchGram')
+    users = CustomUser.objects.only(*SEARCH_FIELDS).iterator(chunk_size=1000)
+    UserSearchGram.objects.bulk_create(
+        (UserSearchGram(user_id=user.id, gram=gram)
+         for user in users for gram in ngrams(*(getattr(user, name) for name in SEARCH_FIELDS))),
+        batch_size=5000,
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for column in SEARCH_FIELDS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS users_customuser_{column}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_userversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('gram', 'user'), name='usersearchgram_gram_user_uniq')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+
+
+def backfill_measurements(apps, schema_editor):
+    # L'unico dato storico disponibile è il valore corrente della scheda
+    CustomUser = apps.get_model('users', 'CustomUser')
+    BodyMeasurement = apps.get_model('users', 'BodyMeasurement')
+    today = timezone.localdate()
+    users = CustomUser.objects.filter(Q(weight_kg__isnull=False) | Q(height_cm__isnull=False))
+    BodyMeasurement.objects.bulk_create(
+        [BodyMeasurement(user_id=user_id, date=today, weight_kg=weight, height_cm=height)
+         for user_id, weight, height in users.values_list('id', 'weight_kg', 'height_cm').iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_friendsuggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BodyMeasurement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('weight_kg', models.FloatField(blank=True, null=True)),
+                ('height_cm', models.FloatField(blank=True, null=True)),
+                ('samples', models.PositiveIntegerField(default=1)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='measurements', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='bodymeasurement_user_date_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_measurements, migrations.RunPython.noop),
+    ]
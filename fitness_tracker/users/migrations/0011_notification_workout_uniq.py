@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_notifications'),
+        ('workouts', '0010_leaderboardrefresh'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('workout__isnull', False)), fields=('recipient', 'workout', 'kind'), name='notification_workout_uniq'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
@@ -30,3 +31,148 @@ class Goal(models.Model):
 
     def __str__(self):
         return f"Obiettivi di {self.athlete.username} a cura di {self.coach.username}"
+
+
+class UserVersion(models.Model):
+    """Contatore di versione per utente e ambito (feed, workouts, goals, coach).
+
+    Viene incrementato a ogni scrittura che cambia i dati di quell'ambito e
+    serve per ETag/Last-Modified e per invalidare la cache.
+    """
+    FEED = 'feed'
+    WORKOUTS = 'workouts'
+    GOALS = 'goals'
+    COACH = 'coach'
+    PROFILE = 'profile'
+    SCOPE_CHOICES = [
+        (FEED, 'Feed'),
+        (WORKOUTS, 'Workout'),
+        (GOALS, 'Obiettivi'),
+        (COACH, 'Dashboard coach'),
+        (PROFILE, 'Scheda personale'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='versions')
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    value = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope'], name='userversion_user_scope_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.scope} v{self.value}"
+
+
+class UserSearchGram(models.Model):
+    """Trigramma di username, nome, cognome o email di un utente.
+
+    Indice di ricerca precalcolato per i database senza pg_trgm (SQLite):
+    cercare significa contare i trigrammi in comune con la query usando
+    l'indice (gram, user). Su PostgreSQL si usano invece gli indici GIN
+    trigram sulle colonne di `CustomUser`.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['gram', 'user'], name='usersearchgram_gram_user_uniq'),
+        ]
+
+
+class FriendSuggestion(models.Model):
+    """"Persone che potresti conoscere": amici di amici precalcolati.
+
+    La tabella viene riempita periodicamente da `refresh_friend_suggestions`,
+    così la pagina legge una lista già ordinata invece di attraversare il
+    grafo delle amicizie a ogni richiesta.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='friend_suggestions', db_index=False)
+    suggested = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    mutual_count = models.PositiveIntegerField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'suggested'], name='friendsuggestion_user_suggested_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-mutual_count'], name='friendsuggestion_user_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.suggested.username} per {self.user.username} ({self.mutual_count} in comune)"
+
+
+class BodyMeasurement(models.Model):
+    """Peso e altezza di un utente in un giorno (al più una riga al giorno).
+
+    Ogni salvataggio della scheda personale aggiorna la riga del giorno; le
+    misure vecchie possono essere accorpate per settimana con
+    `downsample_body_metrics`, e `samples` ricorda quante misure la riga
+    rappresenta.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='measurements', db_index=False)
+    date = models.DateField()
+    weight_kg = models.FloatField(null=True, blank=True)
+    height_cm = models.FloatField(null=True, blank=True)
+    samples = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='bodymeasurement_user_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.date}: {self.weight_kg} kg"
+
+
+class Notification(models.Model):
+    """Notifica in-app: un amico ha registrato un workout o un atleta ha raggiunto un obiettivo.
+
+    Il testo viene composto al momento dell'invio, così la lista non deve
+    rileggere workout e obiettivi; se il workout viene cancellato la notifica
+    resta (e il contatore dei non letti non va riallineato).
+    """
+    WORKOUT = 'workout'
+    GOAL_MET = 'goal_met'
+    KIND_CHOICES = [
+        (WORKOUT, 'Nuovo workout'),
+        (GOAL_MET, 'Obiettivo raggiunto'),
+    ]
+
+    recipient = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications', db_index=False)
+    actor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    workout = models.ForeignKey('workouts.Workout', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    message = models.CharField(max_length=200)
+    read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Una sola notifica per destinatario, workout e tipo: il fan-out può ripartire
+            models.UniqueConstraint(
+                fields=['recipient', 'workout', 'kind'], condition=Q(workout__isnull=False),
+                name='notification_workout_uniq',
+            ),
+        ]
+        indexes = [
+            # Pagine keyset della lista: (destinatario, id decrescente)
+            models.Index(fields=['recipient', '-id'], name='notification_page_idx'),
+        ]
+
+    def __str__(self):
+        return f"Per {self.recipient_id}: {self.message}"
+
+
+class NotificationCounter(models.Model):
+    """Notifiche non lette di un utente, aggiornate insieme alle notifiche."""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} non lette"
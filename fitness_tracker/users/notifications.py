@@ -0,0 +1,171 @@
+"""Notifiche in-app e contatore dei non letti.
+
+Un nuovo workout viene notificato a chi segue l'autore da un lavoro in coda
+(`users.notify_workout`), non dalla richiesta che lo salva: con migliaia di
+follower le righe vengono inserite a blocchi di `CHUNK_SIZE`, ognuno con un
+solo `bulk_create` e un solo aggiornamento dei contatori. Ogni blocco è una
+transazione a sé; se il lavoro fallisce a metà, il nuovo tentativo salta i
+destinatari che hanno già la notifica di quel workout (vincolo unico su
+destinatario, workout e tipo), senza duplicati né contatori gonfiati. Lo
+stesso lavoro avvisa il coach se il workout fa superare un obiettivo di minuti.
+
+Il numero di non lette viene da `NotificationCounter` (una riga per utente),
+non da un `COUNT(*)` sulle notifiche; le liste si sfogliano per id
+decrescente senza OFFSET.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+
+from jobs import queue
+from workouts import feed
+from workouts.models import Workout
+from .models import Goal, Notification, NotificationCounter
+
+CHUNK_SIZE = 1000
+
+# Campo dell'obiettivo corrispondente a ogni tipo di workout
+GOAL_FIELDS = {
+    'run': 'target_running_minutes',
+    'swim': 'target_swimming_minutes',
+    'bike': 'target_cycling_minutes',
+}
+
+
+def page_size():
+    return getattr(settings, 'NOTIFICATIONS_PAGE_SIZE', 20)
+
+
+def _add_unread(user_ids):
+    """Una notifica non letta in più per ogni utente, con un INSERT ... ON CONFLICT DO UPDATE."""
+    if not user_ids:
+        return
+    quote = connection.ops.quote_name
+    table = quote(NotificationCounter._meta.db_table)
+    user, unread = (quote(NotificationCounter._meta.get_field(name).column) for name in ('user', 'unread'))
+    sql = (
+        f"INSERT INTO {table} ({user}, {unread}) VALUES (%s, 1) "
+        f"ON CONFLICT ({user}) DO UPDATE SET {unread} = {table}.{unread} + excluded.{unread}"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(user_id,) for user_id in user_ids])
+
+
+def notify(recipient_ids, actor_id, kind, message, workout_id=None):
+    """Crea la stessa notifica per molti destinatari, un blocco per transazione; restituisce quante ne ha create."""
+    sent, chunk = 0, []
+
+    def flush():
+        with transaction.atomic():
+            fresh = chunk
+            if workout_id is not None:
+                # Blocchi già confermati da un tentativo precedente dello stesso lavoro
+                done = set(Notification.objects.filter(
+                    workout_id=workout_id, kind=kind, recipient_id__in=chunk,
+                ).values_list('recipient_id', flat=True))
+                fresh = [recipient_id for recipient_id in chunk if recipient_id not in done]
+            Notification.objects.bulk_create([
+                Notification(recipient_id=recipient_id, actor_id=actor_id, kind=kind, message=message, workout_id=workout_id)
+                for recipient_id in fresh
+            ], batch_size=CHUNK_SIZE, ignore_conflicts=True)
+            _add_unread(fresh)
+        queue.heartbeat()
+        return len(fresh)
+
+    for recipient_id in recipient_ids:
+        chunk.append(recipient_id)
+        if len(chunk) >= CHUNK_SIZE:
+            sent += flush()
+            chunk = []
+    if chunk:
+        sent += flush()
+    return sent
+
+
+def workout_message(workout):
+    return f"{workout.user.username} ha registrato {workout.duration_minutes} min di {workout.get_type_display().lower()}"
+
+
+def fan_out_workout(workout_id):
+    """Notifica un nuovo workout ai follower dell'autore e controlla gli obiettivi."""
+    workout = Workout.objects.select_related('user').filter(pk=workout_id).first()
+    if workout is None:
+        # Cancellato prima che il lavoro partisse
+        return 0
+    followers = feed.follower_ids(workout.user_id).order_by('from_customuser_id').iterator(chunk_size=CHUNK_SIZE)
+    sent = notify(followers, workout.user_id, Notification.WORKOUT, workout_message(workout), workout.id)
+    return sent + check_goals(workout)
+
+
+def check_goals(workout):
+    """Avvisa il coach se questo workout ha fatto superare un obiettivo di minuti.
+
+    I minuti "prima" e "dopo" si contano sui workout dello stesso tipo fino a
+    questo (per id), così il risultato non dipende da quando gira il lavoro.
+    """
+    field = GOAL_FIELDS[workout.type]
+    goals = list(
+        Goal.objects.filter(athlete_id=workout.user_id, **{f'{field}__isnull': False})
+        .values_list('coach_id', field)
+    )
+    if not goals:
+        return 0
+    after = Workout.objects.filter(
+        user_id=workout.user_id, type=workout.type, id__lte=workout.id,
+    ).aggregate(minutes=Sum('duration_minutes'))['minutes'] or 0
+    before = after - workout.duration_minutes
+    coach_ids = [coach_id for coach_id, target in goals if before < target <= after]
+    message = (
+        f"{workout.user.username} ha raggiunto l'obiettivo di {workout.get_type_display().lower()} "
+        f"({after} min)"
+    )
+    return notify(coach_ids, workout.user_id, Notification.GOAL_MET, message, workout.id)
+
+
+def check_weight_goal(user, previous_weight):
+    """Avvisa il coach quando il peso scende per la prima volta al peso obiettivo."""
+    if user.weight_kg is None:
+        return 0
+    coach_ids = [
+        coach_id
+        for coach_id, target in Goal.objects.filter(athlete=user, target_weight__isnull=False)
+        .values_list('coach_id', 'target_weight')
+        if user.weight_kg <= target and (previous_weight is None or previous_weight > target)
+    ]
+    message = f"{user.username} ha raggiunto il peso obiettivo ({user.weight_kg:g} kg)"
+    return notify(coach_ids, user.id, Notification.GOAL_MET, message)
+
+
+def unread_count(user):
+    return NotificationCounter.objects.filter(user=user).values_list('unread', flat=True).first() or 0
+
+
+def get_page(user, before=None, size=None):
+    """Una pagina di notifiche (più recenti prima) e l'id da cui parte la successiva."""
+    size = size or page_size()
+    rows = Notification.objects.filter(recipient=user)
+    if before:
+        rows = rows.filter(id__lt=before)
+    rows = list(rows.select_related('actor').only(
+        'kind', 'message', 'read', 'created_at', 'workout_id', 'actor__id', 'actor__username',
+    ).order_by('-id')[:size + 1])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = rows[-1].id
+    return rows, next_cursor
+
+
+def mark_read(user, ids=None):
+    """Segna come lette le notifiche indicate (tutte se `ids` è None) e aggiorna il contatore."""
+    unread = Notification.objects.filter(recipient=user, read=False)
+    if ids is None:
+        unread.update(read=True)
+        # Rimette a zero anche un contatore eventualmente disallineato
+        NotificationCounter.objects.filter(user=user).update(unread=0)
+        return
+    changed = unread.filter(id__in=ids).update(read=True)
+    if changed:
+        NotificationCounter.objects.filter(user=user).update(unread=Greatest(F('unread') - changed, 0))
+
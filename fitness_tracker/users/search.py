@@ -0,0 +1,122 @@
+"""Ricerca utenti per prefisso e con tolleranza agli errori di battitura.
+
+Username, nome, cognome ed email vengono scomposti in trigrammi come fa
+pg_trgm (ogni parola minuscola, senza accenti, con due spazi davanti e uno
+dietro): "anna" -> "  a", " an", "ann", "nna", "na ". Una query condivide
+con un risultato i trigrammi iniziali se ne è un prefisso, e buona parte
+degli altri se contiene un errore di battitura.
+
+Su PostgreSQL la ricerca usa `%>` (word similarity) sugli indici GIN
+trigram; altrove conta i trigrammi in comune nella tabella `UserSearchGram`.
+"""
+import math
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Count, Exists, OuterRef
+
+from .models import CustomUser, Goal, UserSearchGram
+
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'email')
+MIN_QUERY_LENGTH = 2
+DEFAULT_LIMIT = 10
+# Frazione minima dei trigrammi della query che un risultato deve condividere
+SIMILARITY_THRESHOLD = 0.3
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def uses_trigram_index():
+    return connection.vendor == 'postgresql'
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def ngrams(*texts):
+    """Insieme dei trigrammi delle parole contenute in `texts`."""
+    grams = set()
+    for text in texts:
+        for word in _WORD.findall(normalize(text)):
+            padded = f'  {word} '
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def user_grams(user):
+    return ngrams(*(getattr(user, name) for name in SEARCH_FIELDS))
+
+
+def index_users(users):
+    """Ricalcola i trigrammi degli utenti indicati (no-op su PostgreSQL)."""
+    if uses_trigram_index():
+        return 0
+    users = list(users)
+    UserSearchGram.objects.filter(user__in=users).delete()
+    grams = [UserSearchGram(user=user, gram=gram) for user in users for gram in user_grams(user)]
+    UserSearchGram.objects.bulk_create(grams, batch_size=5000)
+    return len(grams)
+
+
+def _ranked_ids_grams(query, limit, exclude_id):
+    grams = ngrams(query)
+    if not grams:
+        return []
+    min_hits = max(1, math.ceil(len(grams) * SIMILARITY_THRESHOLD))
+    rows = (
+        UserSearchGram.objects.filter(gram__in=grams)
+        .exclude(user_id=exclude_id)
+        .values('user_id')
+        .annotate(hits=Count('id'))
+        .filter(hits__gte=min_hits)
+        .order_by('-hits', 'user_id')
+        .values_list('user_id', flat=True)[:limit]
+    )
+    return list(rows)
+
+
+def _ranked_ids_trigram(query, limit, exclude_id):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+    from django.db.models import Q
+    from django.db.models.functions import Greatest
+
+    query = normalize(query)
+    matches = Q()
+    for name in SEARCH_FIELDS:
+        matches |= Q(**{f'{name}__trigram_word_similar': query})
+    return list(
+        CustomUser.objects.filter(matches)
+        .exclude(id=exclude_id)
+        .annotate(score=Greatest(*(TrigramWordSimilarity(query, name) for name in SEARCH_FIELDS)))
+        .order_by('-score', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def search(query, viewer, limit=DEFAULT_LIMIT):
+    """Primi `limit` utenti per somiglianza con `query`, escluso `viewer`.
+
+    Ogni utente ha gli attributi `is_friend` (lo segue `viewer`) e
+    `is_my_coach` (ha assegnato obiettivi a `viewer`), calcolati con due
+    EXISTS nella stessa query che carica la pagina di risultati.
+    """
+    query = (query or '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+    rank = _ranked_ids_trigram if uses_trigram_index() else _ranked_ids_grams
+    ids = rank(query, limit, viewer.id)
+    if not ids:
+        return []
+
+    friendships = CustomUser.friends.through.objects.filter(from_customuser=viewer, to_customuser=OuterRef('pk'))
+    coached = Goal.objects.filter(athlete=viewer, coach=OuterRef('pk'))
+    users = (
+        CustomUser.objects.filter(id__in=ids)
+        .only('id', 'username', 'first_name', 'last_name', 'is_coach')
+        .annotate(is_friend=Exists(friendships), is_my_coach=Exists(coached))
+        .in_bulk()
+    )
+    return [users[user_id] for user_id in ids if user_id in users]
@@ -0,0 +1,21 @@
+"""Aggiornamento dell'indice di ricerca quando cambia un utente.
+
+A differenza delle altre scritture, che passano dai servizi, gli utenti
+nascono da molte strade (signup, admin, createsuperuser, comandi): un
+segnale è l'unico punto che le copre tutte.
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import search
+from .models import CustomUser
+
+
+@receiver(post_save, sender=CustomUser)
+def reindex_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # Il login salva solo `last_login`: niente da reindicizzare
+    if update_fields is not None and not set(update_fields) & set(search.SEARCH_FIELDS):
+        return
+    search.index_users([instance])
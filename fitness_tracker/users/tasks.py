@@ -0,0 +1,13 @@
+"""Lavori in coda dell'app users (vedi `jobs.queue`)."""
+from jobs import queue
+from . import friends, notifications
+
+
+@queue.task('users.refresh_suggestions')
+def refresh_suggestions(user_ids):
+    friends.refresh_suggestions(user_ids)
+
+
+@queue.task('users.notify_workout', atomic=False)
+def notify_workout(workout_id):
+    notifications.fan_out_workout(workout_id)
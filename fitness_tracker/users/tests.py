@@ -1,3 +1,409 @@
-from django.test import TestCase
+import csv
+import os
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import cache as core_cache, metrics
+from core.cache import LRUFileBasedCache
+from core.querybudget import QueryBudgetMixin
+from jobs import queue
+from jobs.models import Job
+from workouts import services
+from workouts.models import FeedEntry, Workout, WorkoutTotal
+from . import analytics, body, friends, notifications, views
+from .models import BodyMeasurement, CustomUser, Goal, Notification, NotificationCounter, UserSearchGram
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class CoachDashboardTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.coach = CustomUser.objects.create_user('coach', is_coach=True)
+        for i in range(30):
+            athlete = CustomUser.objects.create_user(f'atleta{i:02}', weight_kg=70)
+            Goal.objects.create(coach=self.coach, athlete=athlete, target_running_minutes=100, target_weight=72)
+            WorkoutTotal.objects.create(user=athlete, type='run', minutes=i * 10, count=i)
+        self.client.force_login(self.coach)
+
+    def test_constant_queries_and_sorting(self):
+        with self.assertMaxQueries(5, 'coach_dashboard'):
+            response = self.client.get(reverse('coach_dashboard'), {'ordina': '-corsa'})
+        rows = response.context['rows']
+        self.assertEqual(rows[0]['athlete'].username, 'atleta29')
+        self.assertEqual(rows[0]['goal'].run_minutes, 290)
+
+    def test_status_filter(self):
+        response = self.client.get(reverse('coach_dashboard'), {'stato': 'completati'})
+        self.assertEqual(len(response.context['rows']), 20)
+
+    def test_athletes_only(self):
+        self.client.force_login(CustomUser.objects.get(username='atleta00'))
+        response = self.client.get(reverse('coach_dashboard'))
+        self.assertRedirects(response, reverse('feed'), fetch_redirect_response=False)
+
+    def test_export_athletes(self):
+        athlete = CustomUser.objects.get(username='atleta03')
+        Workout.objects.create(user=athlete, type='swim', duration_minutes=40)
+        response = self.client.get(reverse('export_athletes'))
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][0], 'athlete')
+        self.assertEqual(rows[1][0], 'atleta03')
+
+
+class VersionedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user('alice', weight_kg=70)
+        self.client.force_login(self.alice)
+        coach = CustomUser.objects.create_user('coach', is_coach=True)
+        Goal.objects.create(coach=coach, athlete=self.alice, target_running_minutes=60)
+
+    @mock.patch.object(metrics, 'registry', metrics.Registry())
+    def test_goals_served_from_cache_until_workout(self):
+        self.client.get(reverse('my_goals'))
+        with self.assertNumQueries(3):  # sessione, utente e versione
+            response = self.client.get(reverse('my_goals'))
+        self.assertEqual(response.context['activity_goals'][0]['current'], 0)
+
+        self.client.post(reverse('create_workout'), {'type': 'run', 'duration_minutes': 30})
+        response = self.client.get(reverse('my_goals'))
+        self.assertEqual(response.context['activity_goals'][0]['current'], 30)
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            self.assertEqual(core_cache.stats()['goals'], {'hits': 1, 'misses': 2, 'hit_rate': 0.333})
+
+    @override_settings(REALTIME_STREAM_URL='https://stream.example.com/feed/stream/')
+    def test_goals_page_opens_configured_stream(self):
+        response = self.client.get(reverse('my_goals'))
+        self.assertContains(response, 'data-stream-url="https://stream.example.com/feed/stream/"')
+
+    def test_personal_sheet_invalidated_on_save(self):
+        self.client.get(reverse('personal_sheet'))
+        self.client.post(reverse('personal_sheet'), {'height_cm': 200, 'weight_kg': 80})
+        response = self.client.get(reverse('personal_sheet'))
+        self.assertEqual(response.context['bmi'], 20.0)
+
+    def test_personal_sheet_invalidated_on_goal_change(self):
+        start = date.today() - timedelta(days=20)
+        for day in range(21):
+            BodyMeasurement.objects.create(user=self.alice, date=start + timedelta(days=day), weight_kg=80 - day * 0.1)
+        response = self.client.get(reverse('personal_sheet'))
+        self.assertIsNone(response.context['trend']['target_weight'])
+
+        coach = CustomUser.objects.get(username='coach')
+        # Le due viste degli obiettivi: /obiettivi/<id>/ e /accounts/obiettivi/<id>/
+        for url, target in ((reverse('set_goals', args=[self.alice.id]), 75),
+                            (f'/accounts/obiettivi/{self.alice.id}/', 74)):
+            self.client.force_login(coach)
+            self.client.post(url, {
+                'target_weight': target, 'target_running_minutes': 60,
+                'target_swimming_minutes': 0, 'target_cycling_minutes': 0,
+            })
+            self.client.force_login(self.alice)
+            response = self.client.get(reverse('personal_sheet'))
+            self.assertEqual(response.context['trend']['target_weight'], target)
+
+    def test_lru_file_cache_evicts_least_recently_read(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = LRUFileBasedCache(location, {'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2}})
+            for i, key in enumerate('abcd'):
+                backend.set(key, i)
+                os.utime(backend._key_to_file(key), (i, i))
+            backend.get('a')  # letto di recente: sopravvive
+            backend.set('e', 4)
+            self.assertEqual([backend.get(key) for key in 'abcde'], [0, None, None, 3, 4])
+
+
+class AsyncViewsTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user('alice', weight_kg=70)
+        self.coach = CustomUser.objects.create_user('coach', is_coach=True)
+        Goal.objects.create(coach=self.coach, athlete=self.alice, target_running_minutes=60, target_weight=72)
+        services.create_workout(Workout(user=self.alice, type='run', duration_minutes=45, date=date.today()))
+
+    async def test_async_goals_match_sync(self):
+        expected = await sync_to_async(views._goals_progress)(self.alice)
+        self.assertEqual(await views._agoals_progress(self.alice), expected)
+
+    def test_manage_goals_async(self):
+        self.client.force_login(self.coach)
+        with self.assertMaxQueries(4, 'manage_goals'):
+            response = self.client.get(reverse('manage_goals'))
+        self.assertEqual([athlete.username for athlete in response.context['athletes']], ['alice'])
+        self.client.force_login(self.alice)
+        self.assertRedirects(self.client.get(reverse('manage_goals')), reverse('feed'), fetch_redirect_response=False)
+
+
+class UserSearchTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice')
+        self.client.force_login(self.alice)
+        self.marco = CustomUser.objects.create_user('mrossi', first_name='Marco', last_name='Rossi', email='marco@example.com')
+        self.coach = CustomUser.objects.create_user('coachgiulia', first_name='Giulia', is_coach=True)
+        CustomUser.objects.create_user('lucia')
+        self.alice.friends.add(self.marco)
+        Goal.objects.create(coach=self.coach, athlete=self.alice)
+
+    def suggest(self, query):
+        response = self.client.get(reverse('search_suggestions'), {'q': query})
+        return response.json()['results']
+
+    def test_prefix_typo_and_name_matches(self):
+        self.assertEqual(self.suggest('mros')[0]['username'], 'mrossi')
+        self.assertEqual(self.suggest('rosi')[0]['username'], 'mrossi')
+        self.assertEqual(self.suggest('Giuila')[0]['username'], 'coachgiulia')
+
+    def test_status_in_single_query(self):
+        CustomUser.objects.create_user('marcogiuliani')
+        with self.assertNumQueries(4):  # sessione, utente, ranking, pagina con EXISTS
+            results = {user['username']: user for user in self.suggest('marco giuli')}
+        self.assertEqual(len(results), 3)
+        self.assertTrue(results['mrossi']['is_friend'])
+        self.assertTrue(results['coachgiulia']['is_my_coach'])
+        self.assertFalse(results['marcogiuliani']['is_friend'])
+
+    def test_index_follows_profile_changes(self):
+        self.marco.first_name = 'Matteo'
+        self.marco.email = 'matteo@example.com'
+        self.marco.save()
+        self.assertEqual(self.suggest('matteo')[0]['username'], 'mrossi')
+        grams = set(UserSearchGram.objects.filter(user=self.marco).values_list('gram', flat=True))
+        self.assertIn('tte', grams)
+        self.assertNotIn('rco', grams)
+
+
+class FriendGraphTests(TestCase):
+    def setUp(self):
+        self.users = [CustomUser.objects.create_user(name) for name in ('anna', 'bruno', 'carla', 'dario', 'elena')]
+        self.anna, self.bruno, self.carla, self.dario, self.elena = self.users
+
+    def test_bulk_add_is_symmetric_and_idempotent(self):
+        pairs = [(self.anna.id, self.bruno.id), (self.bruno.id, self.anna.id), (self.anna.id, self.carla.id)]
+        self.assertEqual(friends.bulk_add(pairs), 2)
+        self.assertEqual(friends.bulk_add(pairs), 0)
+        self.assertTrue(friends.are_friends(self.carla, self.anna))
+
+    def test_bulk_add_many_pairs(self):
+        # Onboarding in blocco: oltre mille amicizie in una sola chiamata
+        others = CustomUser.objects.bulk_create([CustomUser(username=f'nuovo{i}') for i in range(60)])
+        ids = [user.id for user in others]
+        pairs = [(a, b) for index, a in enumerate(ids) for b in ids[index + 1:]]
+        self.assertGreater(len(pairs), 1000)
+        self.assertEqual(friends.bulk_add(pairs), len(pairs))
+        self.assertEqual(len(friends.friend_ids(ids[0])), 59)
+
+    def test_remove_clears_both_directions_and_feed(self):
+        Workout.objects.create(user=self.bruno, type='run', duration_minutes=30)
+        friends.add(self.anna, self.bruno)
+        self.assertTrue(FeedEntry.objects.filter(owner=self.anna, author=self.bruno).exists())
+        self.assertTrue(friends.remove(self.bruno, self.anna))
+        self.assertFalse(friends.are_friends(self.anna, self.bruno))
+        self.assertFalse(FeedEntry.objects.filter(owner=self.anna).exists())
+        self.assertFalse(friends.remove(self.anna, self.bruno))
+
+    def test_mutual_friends_and_suggestions(self):
+        ids = {user.username: user.id for user in self.users}
+        friends.bulk_add([
+            (ids['anna'], ids['bruno']), (ids['anna'], ids['carla']),
+            (ids['bruno'], ids['dario']), (ids['carla'], ids['dario']), (ids['carla'], ids['elena']),
+        ])
+        self.assertEqual({user.username for user in friends.mutual_friends(self.anna, self.dario)}, {'bruno', 'carla'})
+
+        call_command('refresh_friend_suggestions', stdout=StringIO())
+        suggested = [(s.suggested.username, s.mutual_count) for s in friends.suggestions(self.anna)]
+        self.assertEqual(suggested, [('dario', 2), ('elena', 1)])
+
+        friends.add(self.anna, self.dario)
+        self.assertEqual([s.suggested.username for s in friends.suggestions(self.anna)], ['elena'])
+
+
+class BodyMetricTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user('alice')
+        self.client.force_login(self.alice)
+
+    def test_sheet_saves_one_measurement_per_day(self):
+        self.client.post(reverse('personal_sheet'), {'height_cm': 170, 'weight_kg': 70})
+        self.client.post(reverse('personal_sheet'), {'height_cm': 170, 'weight_kg': 69})
+        self.assertEqual(list(BodyMeasurement.objects.values_list('weight_kg', flat=True)), [69])
+
+    def test_trend_and_projection(self):
+        start = date.today() - timedelta(days=10)
+        for day in (0, 5, 10):
+            BodyMeasurement.objects.create(user=self.alice, date=start + timedelta(days=day), weight_kg=80 - day * 0.1)
+        Goal.objects.create(coach=CustomUser.objects.create_user('coach', is_coach=True), athlete=self.alice,
+                            target_weight=75)
+        trend = self.client.get(reverse('weight_trend')).json()['trend']
+        self.assertEqual(len(trend['dates']), 11)
+        self.assertEqual(trend['measured'].count(True), 3)
+        self.assertEqual(trend['kg_per_week'], -0.7)
+        self.assertEqual(trend['moving_averages']['7'][6], 79.7)
+        self.assertEqual(trend['projected_date'], (date.today() + timedelta(days=40)).isoformat())
+
+    def test_downsample_merges_old_weeks(self):
+        monday = date.today() - timedelta(days=date.today().weekday() + 70)
+        for day, weight in ((0, 80), (2, 82)):
+            BodyMeasurement.objects.create(user=self.alice, date=monday + timedelta(days=day), weight_kg=weight)
+        BodyMeasurement.objects.create(user=self.alice, date=date.today(), weight_kg=78)
+        self.assertEqual(body.downsample(date.today() - timedelta(days=30)), 1)
+        self.assertEqual(
+            list(BodyMeasurement.objects.order_by('date').values_list('date', 'weight_kg', 'samples')),
+            [(monday, 81, 2), (date.today(), 78, 1)],
+        )
+
+
+class CoachAnalyticsTests(QueryBudgetMixin, TestCase):
+    def test_ratio_percentiles_and_flags(self):
+        # Riga 0: carico costante; riga 1: settimana finale triplicata; riga 2: si ferma
+        matrix = np.full((3, analytics.HISTORY_DAYS), 30.0)
+        matrix[1, -7:] = 90
+        matrix[2, -7:] = 0
+        result = analytics.analyze(matrix)
+        np.testing.assert_allclose(result['ratio'], [1.0, 90 / 45, 0.0])
+        self.assertEqual(result['overload'].tolist(), [False, True, False])
+        self.assertEqual(result['drop'].tolist(), [False, False, True])
+        self.assertEqual(result['percentile'].tolist(), [50.0, 100.0, 0.0])
+        # I primi due giorni del picco restano sotto soglia: il carico acuto sale gradualmente
+        self.assertEqual(result['overload_days'].tolist(), [0, 5, 0])
+        self.assertGreater(result['trend'][1], 0)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_report_page(self):
+        cache.clear()
+        coach = CustomUser.objects.create_user('coach', is_coach=True)
+        for name in ('anna', 'bruno'):
+            athlete = CustomUser.objects.create_user(name)
+            Goal.objects.create(coach=coach, athlete=athlete)
+            for days_ago in range(10):
+                services.create_workout(Workout(user=athlete, type='run', duration_minutes=30 if name == 'anna' else 5,
+                                                date=date.today() - timedelta(days=days_ago)))
+        # Un allenamento di tre anni fa resta fuori dallo storico analizzato
+        services.create_workout(Workout(user=CustomUser.objects.get(username='bruno'), type='swim',
+                                        duration_minutes=600, date=date.today() - timedelta(days=3 * 365)))
+        self.client.force_login(coach)
+        with self.assertMaxQueries(5, 'coach_analytics'):
+            response = self.client.get(reverse('coach_analytics'))
+        report = response.context['report']
+        self.assertEqual([row['username'] for row in report], ['anna', 'bruno'])
+        self.assertEqual(report[0]['acute'], 30.0)
+        self.assertEqual(report[0]['percentile'], 100)
+        self.assertEqual(report[1]['chronic'], round(50 / 28, 1))
+
+    def test_report_paginated_and_cached(self):
+        cache.clear()
+        coach = CustomUser.objects.create_user('coach', is_coach=True)
+        for i in range(60):
+            athlete = CustomUser.objects.create_user(f'atleta{i:02d}')
+            Goal.objects.create(coach=coach, athlete=athlete)
+        self.client.force_login(coach)
+        first = self.client.get(reverse('coach_analytics'))
+        self.assertEqual(len(first.context['report']), 50)
+        # La seconda pagina non ricalcola il report: sessione, utente e versione
+        with self.assertNumQueries(3):
+            second = self.client.get(reverse('coach_analytics'), {'pagina': 2})
+        self.assertEqual(len(second.context['report']), 10)
+        self.assertContains(second, 'Pagina 2 di 2')
+
+
+class NotificationTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.anna = CustomUser.objects.create_user('anna')
+        self.coach = CustomUser.objects.create_user('coach', is_coach=True)
+        self.followers = [CustomUser.objects.create_user(f'amico{i}') for i in range(5)]
+        friends.bulk_add([(self.anna.id, follower.id) for follower in self.followers])
+
+    def log(self, minutes, workout_type='run'):
+        workout = Workout(user=self.anna, type=workout_type, duration_minutes=minutes, date=date.today())
+        services.create_workout(workout)
+        queue.run_pending()
+        return workout
+
+    def test_workout_fans_out_in_chunks(self):
+        with mock.patch.object(notifications, 'CHUNK_SIZE', 2):
+            self.log(30)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertFalse(Notification.objects.filter(recipient=self.anna).exists())
+        self.assertEqual(notifications.unread_count(self.followers[0]), 1)
+        self.assertEqual(Notification.objects.first().message, 'anna ha registrato 30 min di corsa')
+
+    def test_failed_fan_out_resumes_without_duplicates(self):
+        add_unread = notifications._add_unread
+        calls = []
+
+        def fail_second_chunk(user_ids):
+            calls.append(user_ids)
+            if len(calls) == 2:
+                raise RuntimeError("worker interrotto")
+            add_unread(user_ids)
+
+        with mock.patch.object(notifications, 'CHUNK_SIZE', 2), \
+                mock.patch.object(notifications, '_add_unread', fail_second_chunk), \
+                self.assertLogs('jobs.queue', 'ERROR'):
+            self.log(30)
+        # Il primo blocco è confermato, il secondo annullato
+        self.assertEqual(Notification.objects.count(), 2)
+
+        Job.objects.update(run_at=timezone.now())
+        with mock.patch.object(notifications, 'CHUNK_SIZE', 2):
+            self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual([notifications.unread_count(follower) for follower in self.followers], [1] * 5)
+
+    def test_goal_crossing_notifies_coach_once(self):
+        Goal.objects.create(coach=self.coach, athlete=self.anna, target_running_minutes=50, target_weight=60)
+        self.log(30)
+        self.log(30, 'swim')
+        self.assertEqual(notifications.unread_count(self.coach), 0)
+        self.log(30)
+        self.log(30)
+        self.assertEqual(notifications.unread_count(self.coach), 1)
+        self.assertEqual(
+            Notification.objects.get(recipient=self.coach).message,
+            "anna ha raggiunto l'obiettivo di corsa (60 min)",
+        )
+
+        self.client.force_login(self.anna)
+        self.client.post(reverse('personal_sheet'), {'height_cm': 170, 'weight_kg': 65})
+        self.client.post(reverse('personal_sheet'), {'height_cm': 170, 'weight_kg': 59})
+        self.client.post(reverse('personal_sheet'), {'height_cm': 170, 'weight_kg': 58})
+        self.assertEqual(notifications.unread_count(self.coach), 2)
+
+    @override_settings(QUERY_BUDGET_STRICT=True, NOTIFICATIONS_PAGE_SIZE=2)
+    def test_list_pages_and_marks_read(self):
+        for minutes in (10, 20, 30):
+            self.log(minutes)
+        reader = self.followers[0]
+        self.client.force_login(reader)
+        self.assertEqual(self.client.get(reverse('notification_count')).json(), {'unread': 3})
+
+        with self.assertMaxQueries(5, 'notification_list'):
+            response = self.client.get(reverse('notifications'))
+        self.assertEqual(
+            [n.message for n in response.context['notifications']],
+            ['anna ha registrato 30 min di corsa', 'anna ha registrato 20 min di corsa'],
+        )
+        self.assertEqual(notifications.unread_count(reader), 1)
+
+        response = self.client.get(reverse('notifications'), {'prima': response.context['next_cursor']})
+        self.assertEqual([n.message for n in response.context['notifications']], ['anna ha registrato 10 min di corsa'])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual(notifications.unread_count(reader), 0)
+
+    def test_mark_all_read_resets_counter(self):
+        self.log(10)
+        reader = self.followers[1]
+        NotificationCounter.objects.filter(user=reader).update(unread=7)
+        self.client.force_login(reader)
+        self.client.post(reverse('mark_notifications_read'))
+        self.assertEqual(notifications.unread_count(reader), 0)
+        self.assertFalse(Notification.objects.filter(recipient=reader, read=False).exists())
@@ -1,26 +1,47 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     SignUpView,
     personal_sheet,
+    weight_trend,
     search_users,
+    search_suggestions,
     toggle_friend,
     toggle_coach,
     manage_goals,
+    amanage_goals,
+    coach_dashboard,
+    coach_analytics,
+    export_athletes,
     set_goals,
-    my_goals
+    my_goals,
+    amy_goals,
+    notification_list,
+    notification_count,
+    mark_notifications_read,
 )
 
 urlpatterns = [
     path('signup/', SignUpView.as_view(), name='signup'),
     path('scheda/', personal_sheet, name='personal_sheet'),
+    path('scheda/andamento.json', weight_trend, name='weight_trend'),
     path('cerca/', search_users, name='search_users'),
+    path('cerca/suggerimenti/', search_suggestions, name='search_suggestions'),
     path('toggle_friend/<int:user_id>/', toggle_friend, name='toggle_friend'),
     path('toggle_coach/<int:user_id>/', toggle_coach, name='toggle_coach'),
 
     # Solo visibile ai coach: elenco atleti
-    path('obiettivi/', manage_goals, name='manage_goals'),
+    path('obiettivi/', amanage_goals if settings.ASYNC_VIEWS else manage_goals, name='manage_goals'),
+    path('obiettivi/dashboard/', coach_dashboard, name='coach_dashboard'),
+    path('obiettivi/analisi/', coach_analytics, name='coach_analytics'),
+    path('obiettivi/esporta/', export_athletes, name='export_athletes'),
 
     # Imposta obiettivi per un atleta
     path('obiettivi/<int:user_id>/', set_goals, name='set_goals'),
-    path('i-tuoi-obiettivi/', my_goals, name='my_goals'),
+    path('i-tuoi-obiettivi/', amy_goals if settings.ASYNC_VIEWS else my_goals, name='my_goals'),
+
+    # Notifiche
+    path('notifiche/', notification_list, name='notifications'),
+    path('notifiche/conteggio.json', notification_count, name='notification_count'),
+    path('notifiche/lette/', mark_notifications_read, name='mark_notifications_read'),
 ]
@@ -0,0 +1,43 @@
+"""Contatori di versione per utente, usati per ETag e invalidazione della cache."""
+from django.db import connection
+from django.utils import timezone
+
+from .models import Goal, UserVersion
+
+
+def bump(user_ids, *scopes):
+    """Incrementa la versione di `scopes` per tutti gli utenti indicati.
+
+    Un unico INSERT ... ON CONFLICT DO UPDATE (SQLite e PostgreSQL): le righe
+    mancanti nascono con versione 1, le altre vengono incrementate.
+    """
+    user_ids = [user_ids] if isinstance(user_ids, int) else list(user_ids)
+    if not user_ids or not scopes:
+        return
+    quote = connection.ops.quote_name
+    table = quote(UserVersion._meta.db_table)
+    columns = {name: quote(UserVersion._meta.get_field(name).column) for name in ('user', 'scope', 'value', 'updated_at')}
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns.values())}) VALUES (%s, %s, 1, %s) "
+        f"ON CONFLICT ({columns['user']}, {columns['scope']}) "
+        f"DO UPDATE SET {columns['value']} = {table}.{columns['value']} + 1, "
+        f"{columns['updated_at']} = excluded.{columns['updated_at']}"
+    )
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(user_id, scope, now) for user_id in user_ids for scope in scopes])
+
+
+def get(user, scope):
+    """Restituisce (versione, ultimo aggiornamento); (0, None) se mai modificato."""
+    row = UserVersion.objects.filter(user=user, scope=scope).values_list('value', 'updated_at').first()
+    return row or (0, None)
+
+
+async def aget(user, scope):
+    row = await UserVersion.objects.filter(user=user, scope=scope).values_list('value', 'updated_at').afirst()
+    return row or (0, None)
+
+
+def coach_ids(athlete_id):
+    return Goal.objects.filter(athlete_id=athlete_id).values_list('coach_id', flat=True)
@@ -1,16 +1,29 @@
+from datetime import date
+
 from django.contrib.auth import login, get_user_model
 from django.contrib.auth.decorators import login_required
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.http import urlencode
 from django.views.generic.edit import CreateView
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Sum
-from .models import CustomUser, Goal
+from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.db import transaction
+from core import cache
+from core.querybudget import query_budget
+from core.shortcuts import arender
+from . import analytics, body, dashboard, friends, notifications, search, versions
+from .models import CustomUser, Goal, UserVersion
 from .forms import CustomUserCreationForm, PersonalDataForm, UserSearchForm, GoalForm
-from workouts.models import Workout
+from workouts import exports, feed, totals
+from workouts.stream import stream_url
 
 User = get_user_model()
 
+SEARCH_PAGE_SIZE = 20
+
 # -------- SIGNUP --------
 class SignUpView(CreateView):
     form_class = CustomUserCreationForm
@@ -27,59 +40,80 @@ class SignUpView(CreateView):
 def personal_sheet(request):
     user = request.user
     form = PersonalDataForm(request.POST or None, instance=user)
+    previous_weight = user.weight_kg
     if request.method == 'POST' and form.is_valid():
-        form.save()
+        with transaction.atomic():
+            form.save()
+            body.record(user)
+            notifications.check_weight_goal(user, previous_weight)
+            versions.bump(user.id, UserVersion.PROFILE, UserVersion.GOALS)
+            versions.bump(versions.coach_ids(user.id), UserVersion.COACH)
         return redirect('personal_sheet')
-    return render(request, 'users/personal_sheet.html', {
-        'form': form,
-        'bmi': user.bmi
-    })
+    # Il BMI è un calcolo sui campi dell'utente: in cache solo l'andamento del peso
+    trend = cache.get_or_build('sheet', user, UserVersion.PROFILE, lambda: _sheet_trend(user))
+    return render(request, 'users/personal_sheet.html', {'form': form, 'bmi': user.bmi, 'trend': trend})
+
+
+def _sheet_trend(user):
+    trend = body.user_trend(user)
+    return trend and {key: trend[key] for key in ('current', 'kg_per_week', 'target_weight', 'projected_date')}
+
+
+@login_required
+def weight_trend(request):
+    """Andamento del peso: medie mobili, pendenza e data prevista per l'obiettivo."""
+    try:
+        since = date.fromisoformat(request.GET['da'])
+    except (KeyError, ValueError):
+        since = None
+    return JsonResponse({'trend': body.user_trend(request.user, since)})
 
 # -------- CERCA UTENTI / AMICI / COACH --------
 @login_required
 def search_users(request):
-    form = UserSearchForm()
-    result = None
-    is_friend = False
-    is_coach = False
-    show_actions = False
-
-    if request.method == 'POST':
-        form = UserSearchForm(request.POST)
-        if form.is_valid():
-            username = form.cleaned_data['username']
-            if username == request.user.username:
-                messages.info(request, "Non puoi cercare te stesso.")
-            else:
-                try:
-                    result = User.objects.get(username=username)
-                    is_friend = result in request.user.friends.all()
-                    is_coach = result.is_coach
-                    show_actions = True
-                except User.DoesNotExist:
-                    messages.warning(request, f"L'utente '{username}' non esiste.")
+    form = UserSearchForm(request.GET or None)
+    results = []
+    if form.is_valid():
+        results = search.search(form.cleaned_data['q'], request.user, limit=SEARCH_PAGE_SIZE)
+        if not results:
+            messages.info(request, f"Nessun utente trovato per '{form.cleaned_data['q']}'.")
 
     return render(request, 'users/search_users.html', {
         'form': form,
-        'result': result,
-        'is_friend': is_friend,
-        'is_coach': is_coach,
-        'show_actions': show_actions,
+        'results': results,
+        'suggestions': [] if form.is_bound else friends.suggestions(request.user),
     })
 
+
+@login_required
+def search_suggestions(request):
+    """Suggerimenti per l'autocompletamento della ricerca (JSON)."""
+    results = search.search(request.GET.get('q', ''), request.user)
+    response = JsonResponse({'results': [
+        {
+            'id': user.id,
+            'username': user.username,
+            'name': user.get_full_name(),
+            'is_coach': user.is_coach,
+            'is_friend': user.is_friend,
+            'is_my_coach': user.is_my_coach,
+        }
+        for user in results
+    ]})
+    # Le stesse lettere digitate di nuovo non tornano al server per qualche secondo
+    patch_cache_control(response, private=True, max_age=30)
+    return response
+
 # -------- AGGIUNGI / RIMUOVI AMICO --------
 @login_required
 def toggle_friend(request, user_id):
     target = get_object_or_404(CustomUser, id=user_id)
-    if target in request.user.friends.all():
-        request.user.friends.remove(target)
-        target.friends.remove(request.user)
+    if friends.remove(request.user, target):
         messages.info(request, f"Hai rimosso {target.username} dagli amici.")
-    else:
-        request.user.friends.add(target)
-        target.friends.add(request.user)
+    elif target != request.user:
+        friends.add(request.user, target)
         messages.success(request, f"Hai aggiunto {target.username} agli amici.")
-    return redirect('search_users')
+    return redirect(f"{reverse('search_users')}?{urlencode({'q': target.username})}")
 
 # -------- AGGIUNGI / RIMUOVI COACH --------
 @login_required
@@ -96,27 +130,126 @@ def toggle_coach(request, user_id):
     return redirect('search_users')
 
 # -------- FEED --------
+@query_budget(4)
 @login_required
 def feed_view(request):
-    friends = request.user.friends.all()
-    workouts = Workout.objects.filter(user__in=friends).order_by('-date')
-    return render(request, 'workouts/feed.html', {'workouts': workouts})
+    workouts, next_cursor = feed.get_page(request.user, request.GET.get('cursor'))
+    return render(request, 'workouts/feed.html', {
+        'workouts': workouts,
+        'next_cursor': next_cursor,
+    })
 
 # -------- COACH: GESTISCI ATLETI --------
+@query_budget(4)
 @login_required
 def manage_goals(request):
     if not request.user.is_coach:
         messages.error(request, "Accesso riservato ai coach.")
         return redirect("feed")
 
+    return render(request, 'users/manage_goals.html', {
+        'athletes': _coach_athletes(request.user)
+    })
+
+
+@query_budget(4)
+@login_required
+async def amanage_goals(request):
+    user = await request.auser()
+    if not user.is_coach:
+        messages.error(request, "Accesso riservato ai coach.")
+        return redirect("feed")
+
+    return await arender(request, 'users/manage_goals.html', {
+        'athletes': [athlete async for athlete in _coach_athletes(user)]
+    })
+
+
+def _coach_athletes(coach):
     # Prende gli atleti a cui questo coach ha assegnato obiettivi
-    athlete_ids = Goal.objects.filter(coach=request.user).values_list('athlete_id', flat=True)
-    athletes = CustomUser.objects.filter(id__in=athlete_ids)
+    athlete_ids = Goal.objects.filter(coach=coach).values_list('athlete_id', flat=True)
+    return CustomUser.objects.filter(id__in=athlete_ids).only('id', 'username').order_by('username')
 
-    return render(request, 'users/manage_goals.html', {
-        'athletes': athletes
+# -------- COACH: ANALISI DEL CARICO --------
+@query_budget(5)
+@login_required
+def coach_analytics(request):
+    if not request.user.is_coach:
+        messages.error(request, "Accesso riservato ai coach.")
+        return redirect("feed")
+
+    # Calcolato una volta per tutte le pagine, finché un atleta non cambia
+    today = date.today()
+    report, cohort = cache.get_or_build(
+        'analytics', request.user, UserVersion.COACH,
+        lambda: analytics.coach_report(request.user, today=today), today,
+    )
+    page = Paginator(report, 50).get_page(request.GET.get('pagina'))
+    return render(request, 'users/coach_analytics.html', {
+        'page': page,
+        'report': page.object_list,
+        'cohort': cohort,
+        'overload_ratio': analytics.OVERLOAD_RATIO,
     })
 
+# -------- COACH: DASHBOARD ATLETI --------
+@query_budget(5)
+@login_required
+def coach_dashboard(request):
+    if not request.user.is_coach:
+        messages.error(request, "Accesso riservato ai coach.")
+        return redirect("feed")
+
+    search = request.GET.get('q', '').strip()
+    status = request.GET.get('stato', '')
+    sort = request.GET.get('ordina', 'atleta')
+    goals = dashboard.athlete_progress(request.user, search=search, status=status, sort=sort)
+    page = Paginator(goals, 50).get_page(request.GET.get('pagina'))
+
+    rows = []
+    for goal in page:
+        weight = goal.athlete.weight_kg
+        rows.append({
+            'goal': goal,
+            'athlete': goal.athlete,
+            'weight_met': weight is not None and goal.target_weight is not None and weight <= goal.target_weight,
+            'activities': [
+                (goal.run_minutes, goal.target_running_minutes),
+                (goal.swim_minutes, goal.target_swimming_minutes),
+                (goal.bike_minutes, goal.target_cycling_minutes),
+            ],
+        })
+
+    return render(request, 'users/coach_dashboard.html', {
+        'page': page,
+        'rows': rows,
+        'search': search,
+        'status': status,
+        'sort': sort,
+    })
+
+# -------- COACH: ESPORTA DATI ATLETI --------
+@login_required
+def export_athletes(request):
+    if not request.user.is_coach:
+        messages.error(request, "Accesso riservato ai coach.")
+        return redirect("feed")
+
+    goals = Goal.objects.filter(coach=request.user)
+    usernames = dict(goals.values_list('athlete_id', 'athlete__username'))
+    rows = exports.workout_rows(list(usernames), request.GET.get('dopo'), with_user=True)
+    rows = ((usernames[row[-1]],) + row for row in rows)
+    fields = ['athlete'] + exports.WORKOUT_FIELDS + ['athlete_id']
+
+    if request.GET.get('formato') == 'json':
+        pieces = exports.json_stream(
+            {'coach': request.user.username, 'goals': list(goals.values(*exports.GOAL_FIELDS))},
+            'workouts', fields, rows,
+        )
+        return exports.streaming_response(request, pieces, 'application/json', 'atleti.json')
+    pieces = exports.csv_stream(fields, rows)
+    return exports.streaming_response(request, pieces, 'text/csv', 'atleti.csv')
+
 # -------- COACH: IMPOSTA OBIETTIVI --------
 @login_required
 def set_goals(request, user_id):
@@ -126,6 +259,8 @@ def set_goals(request, user_id):
 
     athlete = get_object_or_404(CustomUser, id=user_id)
     goal, created = Goal.objects.get_or_create(coach=request.user, athlete=athlete)
+    if created:
+        versions.bump(request.user.id, UserVersion.COACH)
 
     if request.method == 'POST':
         form = GoalForm(request.POST, instance=goal)
@@ -134,7 +269,11 @@ def set_goals(request, user_id):
             goal = form.save(commit=False)
             goal.coach = request.user
             goal.athlete = athlete
-            goal.save()
+            with transaction.atomic():
+                goal.save()
+                # Il peso obiettivo compare anche nella scheda personale (andamento del peso)
+                versions.bump(athlete.id, UserVersion.GOALS, UserVersion.PROFILE)
+                versions.bump(request.user.id, UserVersion.COACH)
             messages.success(request, f"Obiettivi aggiornati per {athlete.username}.")
             return redirect('manage_goals')
     else:
@@ -148,16 +287,42 @@ def set_goals(request, user_id):
 
     
 # -------- ATLETA: VISUALIZZA I PROPRI OBIETTIVI --------
+@query_budget(5)
 @login_required
 def my_goals(request):
     user = request.user
-    goal = Goal.objects.filter(athlete=user).first()
-    coach = goal.coach if goal else None
+    progress = cache.get_or_build('goals', user, UserVersion.GOALS, lambda: _goals_progress(user))
+    return render(request, 'users/my_goals.html', {**progress, 'stream_url': stream_url()})
+
+
+@query_budget(5)
+@login_required
+async def amy_goals(request):
+    user = await request.auser()
+    progress = await cache.aget_or_build('goals', user, UserVersion.GOALS, lambda: _agoals_progress(user))
+    return await arender(request, 'users/my_goals.html', {**progress, 'stream_url': stream_url()})
 
-    workouts = Workout.objects.filter(user=user)
-    run_minutes = workouts.filter(type='run').aggregate(Sum('duration_minutes'))['duration_minutes__sum'] or 0
-    swim_minutes = workouts.filter(type='swim').aggregate(Sum('duration_minutes'))['duration_minutes__sum'] or 0
-    bike_minutes = workouts.filter(type='bike').aggregate(Sum('duration_minutes'))['duration_minutes__sum'] or 0
+
+def _goal_query(user):
+    return Goal.objects.filter(athlete=user).select_related('coach')
+
+
+def _goals_progress(user):
+    """Obiettivi dell'atleta con i progressi correnti (il contesto di my_goals)."""
+    # Lettura O(1) dei totali mantenuti da workouts.services
+    return _goals_context(user, _goal_query(user).first(), totals.minutes_by_type(user))
+
+
+async def _agoals_progress(user):
+    goal = await _goal_query(user).afirst()
+    return _goals_context(user, goal, await totals.aminutes_by_type(user))
+
+
+def _goals_context(user, goal, minutes):
+    coach = goal.coach if goal else None
+    run_minutes = minutes['run']
+    swim_minutes = minutes['swim']
+    bike_minutes = minutes['bike']
 
     def status(current, target):
         if target is None:
@@ -168,13 +333,14 @@ def my_goals(request):
 
     if goal:
         # NON usare `if goal.target_XYZ_minutes` perché salta se è 0!
-        for label, value, current in [
-            ('🏃‍♂️ Corsa', goal.target_running_minutes, run_minutes),
-            ('🏊‍♂️ Nuoto', goal.target_swimming_minutes, swim_minutes),
-            ('🚴‍♂️ Bici', goal.target_cycling_minutes, bike_minutes),
+        for workout_type, label, value, current in [
+            ('run', '🏃‍♂️ Corsa', goal.target_running_minutes, run_minutes),
+            ('swim', '🏊‍♂️ Nuoto', goal.target_swimming_minutes, swim_minutes),
+            ('bike', '🚴‍♂️ Bici', goal.target_cycling_minutes, bike_minutes),
         ]:
             if value is not None:
                 activity_goals.append({
+                    'type': workout_type,
                     'label': label,
                     'current': current,
                     'target': value,
@@ -185,11 +351,45 @@ def my_goals(request):
     if goal and goal.target_weight is not None and user.weight_kg:
         weight_status = "✅ Completato" if user.weight_kg <= goal.target_weight else "⏳ In corso"
 
-    return render(request, 'users/my_goals.html', {
+    return {
         'coach': coach,
         'goal': goal,
         'activity_goals': activity_goals,
         'target_weight': goal.target_weight if goal else None,
         'current_weight': user.weight_kg,
         'weight_status': weight_status,
+    }
+
+
+# -------- NOTIFICHE --------
+@query_budget(5)
+@login_required
+def notification_list(request):
+    """Notifiche più recenti prima; quelle mostrate vengono segnate come lette."""
+    try:
+        before = int(request.GET['prima'])
+    except (KeyError, ValueError):
+        before = None
+    items, next_cursor = notifications.get_page(request.user, before)
+    unread_ids = [item.id for item in items if not item.read]
+    if unread_ids:
+        notifications.mark_read(request.user, unread_ids)
+    return render(request, 'users/notifications.html', {
+        'notifications': items,
+        'unread_ids': unread_ids,
+        'next_cursor': next_cursor,
     })
+
+
+@login_required
+def mark_notifications_read(request):
+    if request.method == 'POST':
+        notifications.mark_read(request.user)
+        messages.success(request, "Tutte le notifiche sono state segnate come lette.")
+    return redirect('notifications')
+
+
+@login_required
+def notification_count(request):
+    """Numero di notifiche non lette (per il badge nella barra di navigazione)."""
+    return JsonResponse({'unread': notifications.unread_count(request.user)})
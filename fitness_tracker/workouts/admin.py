@@ -1,4 +1,11 @@
 from django.contrib import admin
 from .models import Workout  # Solo Workout è in workouts.models
 
-admin.site.register(Workout)
+
+@admin.register(Workout)
+class WorkoutAdmin(admin.ModelAdmin):
+    list_display = ('user', 'type', 'duration_minutes', 'date')
+    list_filter = ('type',)
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+    raw_id_fields = ('user',)
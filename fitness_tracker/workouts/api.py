@@ -0,0 +1,57 @@
+"""API JSON di feed e workout personali."""
+from django.db.models import Q
+from django.http import JsonResponse
+
+from core.api import api_login_required, page_size, requested_fields, versioned
+from users.models import UserVersion
+from . import feed
+from .models import Workout
+
+WORKOUT_FIELDS = ['id', 'date', 'type', 'duration_minutes', 'notes']
+FEED_FIELDS = WORKOUT_FIELDS + ['user']
+
+
+def _serialize(workout, fields):
+    data = {}
+    for name in fields:
+        if name == 'user':
+            data['user'] = workout.user.username
+        elif name == 'date':
+            data['date'] = workout.date.isoformat()
+        else:
+            data[name] = getattr(workout, name)
+    return data
+
+
+@api_login_required
+@versioned(UserVersion.FEED)
+def feed_api(request):
+    fields = requested_fields(request, FEED_FIELDS)
+    workouts, next_cursor = feed.get_page(request.user, request.GET.get('cursor'), size=page_size(request))
+    return JsonResponse({
+        'results': [_serialize(workout, fields) for workout in workouts],
+        'next_cursor': next_cursor,
+    })
+
+
+@api_login_required
+@versioned(UserVersion.WORKOUTS)
+def workouts_api(request):
+    fields = requested_fields(request, WORKOUT_FIELDS)
+    size = page_size(request)
+    workouts = Workout.objects.filter(user=request.user)
+    position = feed.decode_cursor(request.GET.get('cursor') or '')
+    if position:
+        day, workout_id = position
+        workouts = workouts.filter(Q(date__lt=day) | Q(date=day, id__lt=workout_id))
+    # id e date servono sempre per il cursore
+    workouts = list(workouts.order_by('-date', '-id').only(*{'id', 'date', *fields})[:size + 1])
+
+    next_cursor = None
+    if len(workouts) > size:
+        workouts = workouts[:size]
+        next_cursor = feed.encode_cursor(workouts[-1])
+    return JsonResponse({
+        'results': [_serialize(workout, fields) for workout in workouts],
+        'next_cursor': next_cursor,
+    })
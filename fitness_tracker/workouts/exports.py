@@ -0,0 +1,134 @@
+"""Export in streaming di workout e obiettivi (CSV e JSON).
+
+Le righe arrivano da `values_list(...).iterator(chunk_size=...)` e vengono
+serializzate a blocchi di ~64 KB, quindi la memoria resta costante anche per
+account con centinaia di migliaia di workout. L'ordine è sempre per
+(data, id) decrescenti, lo stesso dell'indice `workout_user_date_idx`: un
+download interrotto riparte dall'ultima riga ricevuta con `?dopo=<cursore>`.
+"""
+import csv
+import json
+import zlib
+from datetime import date as date_cls
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .models import Workout
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+WORKOUT_FIELDS = ['id', 'date', 'type', 'duration_minutes', 'notes']
+GOAL_FIELDS = [
+    'coach__username', 'athlete__username', 'target_weight',
+    'target_running_minutes', 'target_swimming_minutes', 'target_cycling_minutes',
+]
+
+
+# ----------------- CURSORE DI RIPRESA -----------------
+# Il cursore è `<data>_<id>` dell'ultima riga ricevuta; negli export del
+# coach, ordinati per atleta, è `<athlete_id>_<data>_<id>`.
+
+def _after(queryset, raw, with_user=False):
+    """Filtra le righe successive al cursore (ignorato se non valido)."""
+    try:
+        parts = raw.split('_')
+        if with_user:
+            user_id, day, workout_id = int(parts[0]), date_cls.fromisoformat(parts[1]), int(parts[2])
+        else:
+            day, workout_id = date_cls.fromisoformat(parts[0]), int(parts[1])
+    except (AttributeError, IndexError, ValueError):
+        return queryset
+    after = Q(date__lt=day) | Q(date=day, id__lt=workout_id)
+    if with_user:
+        return queryset.filter(Q(user_id__gt=user_id) | (Q(user_id=user_id) & after))
+    return queryset.filter(after)
+
+
+def workout_rows(user_ids, after=None, with_user=False):
+    """Righe `WORKOUT_FIELDS` in ordine di esportazione.
+
+    Con `with_user` (export del coach) le righe sono ordinate per atleta e
+    terminano con `user_id`.
+    """
+    workouts = Workout.objects.filter(user_id__in=user_ids)
+    if after:
+        workouts = _after(workouts, after, with_user)
+    if with_user:
+        workouts = workouts.order_by('user_id', '-date', '-id').values_list(*WORKOUT_FIELDS, 'user_id')
+    else:
+        workouts = workouts.order_by('-date', '-id').values_list(*WORKOUT_FIELDS)
+    return workouts.iterator(chunk_size=CHUNK_SIZE)
+
+
+# ----------------- SERIALIZZAZIONE -----------------
+
+class _Echo:
+    """Finto file per `csv.writer`: restituisce la riga invece di scriverla."""
+
+    def write(self, value):
+        return value
+
+
+def _buffered(pieces):
+    """Raggruppa le stringhe in blocchi da ~64 KB codificati in UTF-8."""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def csv_stream(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _json_default(value):
+    if isinstance(value, date_cls):
+        return value.isoformat()
+    raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+
+def json_stream(header, key, fields, rows):
+    """Oggetto JSON con i campi di `header` e la lista `key` prodotta in streaming."""
+    head = json.dumps(header, default=_json_default)
+    yield head[:-1] + (', ' if header else '') + json.dumps(key) + ': ['
+    first = True
+    for row in rows:
+        yield ('' if first else ', ') + json.dumps(dict(zip(fields, row)), default=_json_default)
+        first = False
+    yield ']}'
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def streaming_response(request, pieces, content_type, filename):
+    """Risposta in streaming, compressa con gzip se il client lo accetta."""
+    chunks = _buffered(pieces)
+    accepts_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    if accepts_gzip:
+        chunks = gzip_stream(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    if accepts_gzip:
+        response['Content-Encoding'] = 'gzip'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Il file è generato al volo: la ripresa avviene per cursore (?dopo=), non per byte
+    response['Accept-Ranges'] = 'none'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
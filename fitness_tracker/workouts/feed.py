@@ -0,0 +1,181 @@
+"""Feed materializzato degli amici (fan-out on write + paginazione keyset)."""
+from datetime import date as date_cls
+
+from django.conf import settings
+from django.db.models import Q
+
+from users.models import CustomUser
+from .models import FeedEntry, Workout
+
+Friendship = CustomUser.friends.through
+
+
+def page_size():
+    return getattr(settings, 'FEED_PAGE_SIZE', 20)
+
+
+def backfill_limit():
+    """Numero massimo di workout copiati nel feed quando si aggiunge un amico."""
+    return getattr(settings, 'FEED_BACKFILL_LIMIT', 200)
+
+
+def follower_ids(user_id):
+    """Utenti che hanno `user_id` tra gli amici, cioè che ne vedono i workout."""
+    return Friendship.objects.filter(to_customuser_id=user_id).values_list('from_customuser_id', flat=True)
+
+
+def _entry(owner_id, workout):
+    return FeedEntry(owner_id=owner_id, author_id=workout.user_id, workout_id=workout.id, date=workout.date)
+
+
+def publish(workout):
+    """Copia un nuovo workout nel feed di chi segue l'autore."""
+    entries = [_entry(owner_id, workout) for owner_id in follower_ids(workout.user_id)]
+    FeedEntry.objects.bulk_create(entries, batch_size=500, ignore_conflicts=True)
+
+
+def publish_imported(user_id, days):
+    """Copia nel feed dei follower i workout appena importati in quei giorni.
+
+    Come per `follow`, solo i più recenti (`FEED_BACKFILL_LIMIT`) finiscono
+    nel feed: un import di anni di storico non deve inondare gli amici.
+    """
+    owner_ids = list(follower_ids(user_id))
+    if not owner_ids:
+        return
+    workouts = (
+        Workout.objects.filter(user_id=user_id, date__in=days)
+        .only('id', 'user_id', 'date')
+        .order_by('-date', '-id')[:backfill_limit()]
+    )
+    entries = [_entry(owner_id, workout) for workout in workouts for owner_id in owner_ids]
+    FeedEntry.objects.bulk_create(entries, batch_size=500, ignore_conflicts=True)
+
+
+def follow(owner, author):
+    """Aggiunge al feed di `owner` gli ultimi workout di `author`."""
+    workouts = (
+        Workout.objects.filter(user=author)
+        .only('id', 'user_id', 'date')
+        .order_by('-date', '-id')[:backfill_limit()]
+    )
+    entries = [_entry(owner.id, workout) for workout in workouts]
+    FeedEntry.objects.bulk_create(entries, batch_size=500, ignore_conflicts=True)
+
+
+def follow_many(edges):
+    """Come `follow` per molte coppie (owner_id, author_id): una query per autore."""
+    owners_by_author = {}
+    for owner_id, author_id in edges:
+        owners_by_author.setdefault(author_id, []).append(owner_id)
+    for author_id, owner_ids in owners_by_author.items():
+        workouts = (
+            Workout.objects.filter(user_id=author_id)
+            .only('id', 'user_id', 'date')
+            .order_by('-date', '-id')[:backfill_limit()]
+        )
+        entries = [_entry(owner_id, workout) for workout in workouts for owner_id in owner_ids]
+        FeedEntry.objects.bulk_create(entries, batch_size=500, ignore_conflicts=True)
+
+
+def unfollow(owner, author):
+    """Toglie dal feed di `owner` tutti i workout di `author`."""
+    FeedEntry.objects.filter(owner=owner, author=author).delete()
+
+
+def rebuild(owner_id):
+    """Ricostruisce da zero il feed di un utente a partire dai `Workout`."""
+    FeedEntry.objects.filter(owner_id=owner_id).delete()
+    friend_ids = Friendship.objects.filter(from_customuser_id=owner_id).values_list('to_customuser_id', flat=True)
+    workouts = (
+        Workout.objects.filter(user_id__in=friend_ids)
+        .only('id', 'user_id', 'date')
+        .order_by('-date', '-id')[:backfill_limit()]
+    )
+    entries = [_entry(owner_id, workout) for workout in workouts]
+    FeedEntry.objects.bulk_create(entries, batch_size=500)
+    return len(entries)
+
+
+def entries_since(owner_id, after_id, limit=None):
+    """Voci del feed aggiunte dopo `after_id` (per id crescente), con workout e autore."""
+    return list(
+        FeedEntry.objects.filter(owner_id=owner_id, id__gt=after_id)
+        .select_related('workout__user').order_by('id')[:limit or page_size()]
+    )
+
+
+def entries_since_many(requests, limit=None, chunk_size=200):
+    """Come `entries_since` per molte coppie (owner_id, after_id) insieme: {coppia: voci}.
+
+    Una query ogni `chunk_size` coppie (una catena di OR troppo lunga supera
+    la profondità massima delle espressioni di SQLite).
+    """
+    limit = limit or page_size()
+    requests = list(dict.fromkeys(requests))
+    result = {request: [] for request in requests}
+    by_owner = {}
+    for owner_id, after_id in requests:
+        by_owner.setdefault(owner_id, []).append(after_id)
+    for start in range(0, len(requests), chunk_size):
+        condition = Q()
+        for owner_id, after_id in requests[start:start + chunk_size]:
+            condition |= Q(owner_id=owner_id, id__gt=after_id)
+        for entry in FeedEntry.objects.filter(condition).select_related('workout__user').order_by('id'):
+            for after_id in by_owner[entry.owner_id]:
+                entries = result[entry.owner_id, after_id]
+                if entry.id > after_id and len(entries) < limit and (not entries or entries[-1].id < entry.id):
+                    entries.append(entry)
+    return result
+
+
+def last_entry_id(owner_id):
+    return FeedEntry.objects.filter(owner_id=owner_id).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+# ----------------- PAGINAZIONE KEYSET -----------------
+
+def encode_cursor(workout):
+    return f"{workout.date.isoformat()}_{workout.id}"
+
+
+def decode_cursor(raw):
+    """Restituisce (data, id) oppure None se il cursore non è valido."""
+    try:
+        day, workout_id = raw.split('_', 1)
+        return date_cls.fromisoformat(day), int(workout_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _page_entries(user, cursor, size):
+    entries = FeedEntry.objects.filter(owner=user)
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        day, workout_id = position
+        entries = entries.filter(Q(date__lt=day) | Q(date=day, workout_id__lt=workout_id))
+    return entries.select_related('workout__user').order_by('-date', '-workout_id')[:size + 1]
+
+
+def _split_page(workouts, size):
+    next_cursor = None
+    if len(workouts) > size:
+        workouts = workouts[:size]
+        next_cursor = encode_cursor(workouts[-1])
+    return workouts, next_cursor
+
+
+def get_page(user, cursor=None, size=None):
+    """Restituisce una pagina di workout del feed e il cursore della successiva.
+
+    Il costo è lo stesso per ogni pagina: si parte dall'ultimo (data, id)
+    visto invece di usare OFFSET.
+    """
+    size = size or page_size()
+    return _split_page([entry.workout for entry in _page_entries(user, cursor, size)], size)
+
+
+async def aget_page(user, cursor=None, size=None):
+    """Come `get_page`, con l'ORM async."""
+    size = size or page_size()
+    return _split_page([entry.workout async for entry in _page_entries(user, cursor, size)], size)
@@ -10,3 +10,11 @@ class WorkoutForm(forms.ModelForm):
             'duration_minutes': forms.NumberInput(attrs={'class': 'form-input'}),
             'notes': forms.Textarea(attrs={'class': 'form-textarea', 'rows': 3}),
         }
+
+
+class WorkoutImportForm(forms.Form):
+    file = forms.FileField(
+        label="File CSV o GPX",
+        help_text="CSV con colonne date, type, duration_minutes, notes oppure tracce GPX.",
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv,.gpx'}),
+    )
@@ -0,0 +1,371 @@
+"""Import in streaming di workout da file CSV e GPX.
+
+I file vengono letti riga per riga (o traccia per traccia per i GPX) con dei
+generatori: in memoria c'è al più un blocco di `batch_size` workout, che viene
+validato con le regole di `WorkoutForm`, ripulito dalle righe già salvate
+prima dell'import e inserito con `services.bulk_insert_workouts` in una
+transazione; serie e record personali vengono ricalcolati una volta sola,
+dopo l'ultimo blocco.
+
+I file oltre `IMPORT_INLINE_MAX_BYTES` non vengono importati nella richiesta:
+`queue_import` li salva e accoda `run_import`, che conferma un blocco alla
+volta e aggiorna il `WorkoutImport` mostrato all'utente.
+"""
+import csv
+import io
+import os
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from xml.etree.ElementTree import ParseError, iterparse
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from jobs import queue
+from . import records, services
+from .forms import WorkoutForm
+from .models import Workout, WorkoutImport
+
+BATCH_SIZE = 10000
+MAX_REPORTED_ERRORS = 20
+# Date già lette tenute da `Rules` (dieci anni di giorni distinti, anche con l'ora)
+MAX_CACHED_DATES = 100_000
+
+# Valori accettati per il tipo: codice, etichetta italiana e nomi usati da altri tracker
+TYPE_ALIASES = {
+    **{code: code for code, _ in Workout.WORKOUT_CHOICES},
+    **{label.lower(): code for code, label in Workout.WORKOUT_CHOICES},
+    'running': 'run', 'swimming': 'swim', 'cycling': 'bike',
+    'biking': 'bike', 'ride': 'bike', 'bici': 'bike',
+}
+
+# Intestazioni CSV alternative
+CSV_COLUMNS = {
+    'data': 'date',
+    'tipo': 'type',
+    'duration': 'duration_minutes',
+    'durata': 'duration_minutes',
+    'minutes': 'duration_minutes',
+    'note': 'notes',
+}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: list = field(default_factory=list)
+
+    @property
+    def processed(self):
+        return self.created + self.duplicates + self.invalid
+
+    def add_error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"{line}: {message}")
+
+
+# ----------------- LETTURA -----------------
+
+def read_csv(fileobj):
+    """Genera (riga, dati) da un file CSV binario con intestazione."""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        yield from _csv_rows(csv.reader(text))
+    finally:
+        # Chiudere il wrapper chiuderebbe anche il file del chiamante
+        text.detach()
+
+
+def _csv_rows(reader):
+    try:
+        header = next(reader)
+    except StopIteration:
+        return
+    columns = [CSV_COLUMNS.get(name.strip().lower(), name.strip().lower()) for name in header]
+    missing = {'date', 'type', 'duration_minutes'} - set(columns)
+    if missing:
+        raise ImportFormatError(f"Colonne mancanti nel CSV: {', '.join(sorted(missing))}")
+    for values in reader:
+        if values:
+            yield f"riga {reader.line_num}", dict(zip(columns, values))
+
+
+def read_gpx(fileobj):
+    """Genera (traccia, dati) da un file GPX, una traccia per workout.
+
+    Usa `iterparse` e svuota ogni punto dopo averlo letto, così anche
+    tracce con milioni di punti occupano memoria costante.
+    """
+    track = None
+    number = 0
+    try:
+        for event, elem in iterparse(fileobj, events=('start', 'end')):
+            tag = elem.tag.rpartition('}')[2]
+            if event == 'start':
+                if tag == 'trk':
+                    number += 1
+                    track = {'type': '', 'notes': '', 'first': None, 'last': None}
+                continue
+            if track is None:
+                continue
+            if tag == 'type' and not track['type']:
+                track['type'] = (elem.text or '').strip()
+            elif tag == 'name' and not track['notes']:
+                track['notes'] = (elem.text or '').strip()
+            elif tag == 'time' and elem.text:
+                track['first'] = track['first'] or elem.text.strip()
+                track['last'] = elem.text.strip()
+            elif tag == 'trkpt':
+                elem.clear()
+            elif tag == 'trk':
+                elem.clear()
+                yield f"traccia {number}", _track_row(track)
+                track = None
+    except ParseError as exc:
+        raise ImportFormatError(f"GPX non valido: {exc}") from exc
+
+
+def _track_row(track):
+    row = {'type': track['type'], 'notes': track['notes'], 'date': '', 'duration_minutes': ''}
+    if track['first'] and track['last']:
+        try:
+            start = datetime.fromisoformat(track['first'])
+            end = datetime.fromisoformat(track['last'])
+        except ValueError:
+            return row
+        row['date'] = start.date().isoformat()
+        row['duration_minutes'] = str(round((end - start).total_seconds() / 60))
+    return row
+
+
+READERS = {'.csv': read_csv, '.gpx': read_gpx}
+
+
+def _reader(name):
+    try:
+        return READERS[os.path.splitext(name)[1].lower()]
+    except KeyError:
+        raise ImportFormatError("Formato non supportato: usa un file .csv o .gpx") from None
+
+
+def read_file(fileobj, name):
+    return _reader(name)(fileobj)
+
+
+# ----------------- VALIDAZIONE E INSERIMENTO -----------------
+
+class Rules:
+    """Regole di `WorkoutForm` compilate una volta sola.
+
+    Chiamare `Form.clean()` per ogni riga costerebbe più dell'inserimento
+    stesso: qui si usano le stesse scelte e gli stessi limiti dei campi del
+    form, ma senza creare un form per riga.
+    """
+
+    def __init__(self, form_class=WorkoutForm):
+        fields = form_class.base_fields
+        self.types = {str(value) for value, _ in fields['type'].choices if value}
+        self.notes_field = fields['notes']
+        # I limiti di Min/MaxValueValidator diventano un confronto diretto;
+        # eventuali altri validatori vengono comunque eseguiti.
+        self.min_duration, self.max_duration = float('-inf'), float('inf')
+        self.duration_validators = []
+        for validator in fields['duration_minutes'].validators:
+            if isinstance(validator, MinValueValidator):
+                self.min_duration = max(self.min_duration, validator.limit_value)
+            elif isinstance(validator, MaxValueValidator):
+                self.max_duration = min(self.max_duration, validator.limit_value)
+            else:
+                self.duration_validators.append(validator)
+        # Le date si ripetono molto (più workout nello stesso giorno)
+        self.dates = {}
+
+    def build_row(self, row):
+        """Valida una riga e restituisce (data, tipo, minuti, note)."""
+        raw_date = row.get('date') or ''
+        day = self.dates.get(raw_date)
+        if day is None:
+            try:
+                day = date.fromisoformat(raw_date.strip()[:10])
+            except ValueError:
+                raise ValidationError(f"data non valida '{raw_date}'")
+            if len(self.dates) < MAX_CACHED_DATES:
+                self.dates[raw_date] = day
+
+        raw_type = (row.get('type') or '').strip().lower()
+        workout_type = TYPE_ALIASES.get(raw_type, raw_type)
+        if workout_type not in self.types:
+            raise ValidationError(f"tipo non valido '{raw_type}'")
+
+        raw_duration = row.get('duration_minutes') or ''
+        try:
+            duration = int(raw_duration)
+        except ValueError:
+            raise ValidationError(f"durata non valida '{raw_duration}'")
+        if not self.min_duration <= duration <= self.max_duration:
+            raise ValidationError(
+                f"durata fuori dai limiti ({self.min_duration}-{self.max_duration}): {duration}"
+            )
+        for validator in self.duration_validators:
+            validator(duration)
+
+        notes = row.get('notes') or ''
+        if notes:
+            notes = self.notes_field.clean(notes)
+        return day, workout_type, duration, notes
+
+
+class Duplicates:
+    """Riconosce le righe già salvate prima dell'import.
+
+    Solo i workout esistenti all'inizio (id fino a `baseline`) contano: due
+    sessioni uguali nello stesso file (stesso giorno, tipo e durata) sono
+    entrambe vere. Le chiavi si contano con la loro molteplicità, così un
+    file reimportato dopo un errore scarta esattamente le righe confermate
+    dai blocchi precedenti e inserisce le altre.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.baseline = Workout.objects.filter(user=user).aggregate(baseline=Max('id'))['baseline'] or 0
+        # Occorrenze già viste nel file delle chiavi presenti nel database
+        self.seen = Counter()
+
+    def split(self, batch):
+        """Divide il blocco in (nuove, numero di duplicati)."""
+        if not self.baseline:
+            return batch, 0
+        existing = Counter(
+            Workout.objects.filter(user=self.user, id__lte=self.baseline, date__in={row[0] for row in batch})
+            .values_list('date', 'type', 'duration_minutes')
+        )
+        fresh = []
+        for row in batch:
+            key = row[:3]
+            if key not in existing:
+                fresh.append(row)
+                continue
+            self.seen[key] += 1
+            if self.seen[key] > existing[key]:
+                fresh.append(row)
+        return fresh, len(batch) - len(fresh)
+
+
+def _flush(user, batch, duplicates, result):
+    """Scarta le righe già salvate e inserisce il resto."""
+    fresh, skipped = duplicates.split(batch)
+    result.duplicates += skipped
+    if fresh:
+        services.bulk_insert_workouts(user.id, fresh)
+        result.created += len(fresh)
+
+
+def import_workouts(user, rows, batch_size=BATCH_SIZE, progress=None):
+    """Importa le righe `(etichetta, dati)` prodotte da `read_csv`/`read_gpx`.
+
+    `progress`, se indicato, viene chiamato con il risultato parziale dopo
+    ogni blocco inserito.
+    """
+    result = ImportResult()
+    build_row = Rules().build_row
+    duplicates = Duplicates(user)
+    batch = []
+    for line, row in rows:
+        try:
+            batch.append(build_row(row))
+        except ValidationError as exc:
+            result.add_error(line, '; '.join(exc.messages))
+            continue
+        if len(batch) >= batch_size:
+            _flush(user, batch, duplicates, result)
+            batch = []
+            if progress:
+                progress(result)
+    if batch:
+        _flush(user, batch, duplicates, result)
+        if progress:
+            progress(result)
+    if result.created:
+        # Gli import sono quasi sempre nel passato: serie e record una volta sola, a fine file
+        records.recompute_many([user.id])
+    return result
+
+
+# ----------------- IMPORT IN CODA -----------------
+
+def queue_import(user, upload):
+    """Salva il file caricato e ne accoda l'import; restituisce il `WorkoutImport`."""
+    _reader(upload.name)  # formato non supportato: errore prima di salvare il file
+    extension = os.path.splitext(upload.name)[1].lower()
+    stored_name = default_storage.save(f"imports/{user.pk}/{uuid.uuid4().hex}{extension}", upload)
+    with transaction.atomic():
+        record = WorkoutImport.objects.create(
+            user=user, file_name=upload.name[:255], stored_name=stored_name, size=upload.size,
+        )
+        queue.enqueue('workouts.import_file', {'import_id': record.pk}, key=f'workout-import:{record.pk}')
+    return record
+
+
+def run_import(import_id):
+    """Esegue un import accodato, confermando un blocco alla volta.
+
+    Dopo un errore il lavoro riparte dall'inizio del file: i blocchi già
+    confermati vengono riconosciuti come duplicati, quindi i contatori
+    partono da quanto già importato.
+    """
+    record = WorkoutImport.objects.select_related('user').get(pk=import_id)
+    if record.status == WorkoutImport.DONE:
+        return
+    already = record.imported
+    record.status = WorkoutImport.RUNNING
+    record.save(update_fields=['status'])
+
+    def update(result, position):
+        record.bytes_read = position
+        record.imported = already + result.created
+        record.duplicates = max(0, result.duplicates - already)
+        record.invalid = result.invalid
+        record.errors = result.errors
+
+    def progress(result):
+        update(result, fileobj.tell())
+        record.save(update_fields=['bytes_read', 'imported', 'duplicates', 'invalid', 'errors'])
+        queue.heartbeat()
+
+    try:
+        with default_storage.open(record.stored_name, 'rb') as fileobj:
+            result = import_workouts(record.user, read_file(fileobj, record.stored_name), progress=progress)
+    except ImportFormatError as exc:
+        # Il file non cambia: riprovare non serve
+        record.errors = [str(exc)]
+        _finish(record, WorkoutImport.FAILED)
+        return
+    except queue.LockLost:
+        # Il record è di un altro tentativo ancora in corso
+        raise
+    except Exception:
+        record.status = WorkoutImport.FAILED
+        record.save(update_fields=['status'])
+        raise
+    update(result, record.size)
+    _finish(record, WorkoutImport.DONE)
+
+
+def _finish(record, status):
+    record.status = status
+    record.finished_at = timezone.now()
+    record.save(update_fields=['status', 'errors', 'finished_at', 'bytes_read', 'imported', 'duplicates', 'invalid'])
+    default_storage.delete(record.stored_name)
@@ -0,0 +1,144 @@
+"""Classifiche settimanali e mensili tra amici e tra gli atleti di un coach.
+
+Le classifiche si calcolano dagli aggregati `WorkoutRollup` (una riga per
+utente, tipo e periodo) e vengono salvate in `LeaderboardEntry` già
+ordinate. `refresh_leaderboards` le aggiorna periodicamente; la pagina non
+scrive mai classifiche: se mancano o, per il periodo in corso, sono più
+vecchie di `LEADERBOARD_MAX_AGE` secondi, accoda `workouts.refresh_leaderboard`
+e mostra quella salvata.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from jobs import queue
+from users.models import CustomUser, Goal
+from . import rollups
+from .models import LeaderboardEntry, LeaderboardRefresh, WorkoutRollup
+
+Friendship = CustomUser.friends.through
+
+PERIODS = [WorkoutRollup.WEEK, WorkoutRollup.MONTH]
+BOARDS = [board for board, _ in LeaderboardEntry.BOARD_CHOICES]
+TYPES = rollups.TYPES + [LeaderboardEntry.ALL]
+# Periodi passati consultabili
+HISTORY = timedelta(days=365)
+
+
+def max_age():
+    return timedelta(seconds=getattr(settings, 'LEADERBOARD_MAX_AGE', 15 * 60))
+
+
+def current_start(period, today=None):
+    return rollups.bucket_start(today or date.today(), period)
+
+
+def oldest_start(period, today=None):
+    return rollups.bucket_start((today or date.today()) - HISTORY, period)
+
+
+def valid_start(start, period, today=None):
+    """True se `start` è l'inizio di un periodo tra `oldest_start` e quello in corso."""
+    return (
+        start == rollups.bucket_start(start, period)
+        and oldest_start(period, today) <= start <= current_start(period, today)
+    )
+
+
+def members(owner_ids, board):
+    """{owner_id: id dei partecipanti}: l'utente e i suoi amici, o gli atleti del coach."""
+    if board == LeaderboardEntry.FRIENDS:
+        groups = {owner_id: {owner_id} for owner_id in owner_ids}
+        pairs = Friendship.objects.filter(from_customuser_id__in=owner_ids).values_list(
+            'from_customuser_id', 'to_customuser_id')
+    else:
+        groups = {owner_id: set() for owner_id in owner_ids}
+        pairs = Goal.objects.filter(coach_id__in=owner_ids).values_list('coach_id', 'athlete_id')
+    for owner_id, member_id in pairs:
+        groups[owner_id].add(member_id)
+    return groups
+
+
+def rank(minutes_by_member):
+    """[(posizione, membro, minuti)] a parità di minuti stessa posizione (1, 2, 2, 4)."""
+    ordered = sorted(minutes_by_member.items(), key=lambda item: (-item[1], item[0]))
+    ranking = []
+    for index, (member_id, minutes) in enumerate(ordered):
+        position = ranking[-1][0] if ranking and ranking[-1][2] == minutes else index + 1
+        ranking.append((position, member_id, minutes))
+    return ranking
+
+
+def refresh(owner_ids, board, period, start):
+    """Ricalcola e salva le classifiche di più utenti per un periodo.
+
+    Due letture in tutto (partecipanti e aggregati del periodo), qualunque
+    sia il numero di utenti; restituisce le righe scritte. Il calcolo viene
+    registrato in `LeaderboardRefresh` anche quando non produce righe.
+    """
+    groups = members(owner_ids, board)
+    everyone = set().union(*groups.values()) if groups else set()
+    minutes = {member_id: dict.fromkeys(TYPES, 0) for member_id in everyone}
+    buckets = WorkoutRollup.objects.filter(user_id__in=everyone, period=period, start=start).values_list(
+        'user_id', 'type', 'minutes')
+    for member_id, workout_type, total in buckets:
+        minutes[member_id][workout_type] += total
+        minutes[member_id][LeaderboardEntry.ALL] += total
+
+    now = timezone.now()
+    entries = [
+        LeaderboardEntry(
+            owner_id=owner_id, board=board, period=period, start=start, type=workout_type,
+            rank=position, member_id=member_id, minutes=total,
+        )
+        for owner_id, group in groups.items()
+        for workout_type in TYPES
+        for position, member_id, total in rank({member_id: minutes[member_id][workout_type] for member_id in group})
+    ]
+    with transaction.atomic():
+        LeaderboardEntry.objects.filter(owner_id__in=owner_ids, board=board, period=period, start=start).delete()
+        LeaderboardEntry.objects.bulk_create(entries, batch_size=1000)
+        LeaderboardRefresh.objects.bulk_create(
+            [
+                LeaderboardRefresh(owner_id=owner_id, board=board, period=period, start=start, computed_at=now)
+                for owner_id in owner_ids
+            ],
+            update_conflicts=True, unique_fields=['owner', 'board', 'period', 'start'], update_fields=['computed_at'],
+        )
+    return len(entries)
+
+
+def _read(owner, board, period, start, workout_type):
+    return list(
+        LeaderboardEntry.objects.filter(owner=owner, board=board, period=period, start=start, type=workout_type)
+        .select_related('member')
+        .only('rank', 'minutes', 'member__id', 'member__username')
+        .order_by('rank', 'member_id')
+    )
+
+
+def get(owner, board, period, start, workout_type):
+    """Classifica salvata, ora del calcolo e se è in attesa di ricalcolo.
+
+    Non ricalcola mai durante la richiesta: se la classifica manca o è
+    vecchia e il periodo è in corso, accoda il ricalcolo (una volta per
+    calcolo superato, grazie alla chiave) e restituisce quella salvata.
+    """
+    computed_at = (
+        LeaderboardRefresh.objects.filter(owner=owner, board=board, period=period, start=start)
+        .values_list('computed_at', flat=True).first()
+    )
+    pending = computed_at is None or (
+        start == current_start(period) and timezone.now() - computed_at > max_age()
+    )
+    if pending:
+        stamp = int(computed_at.timestamp()) if computed_at else 0
+        queue.enqueue(
+            'workouts.refresh_leaderboard',
+            {'owner_id': owner.id, 'board': board, 'period': period, 'start': start.isoformat()},
+            key=f'leaderboard:{owner.id}:{board}:{period}:{start.isoformat()}:{stamp}',
+        )
+    entries = _read(owner, board, period, start, workout_type) if computed_at else []
+    return entries, computed_at, pending
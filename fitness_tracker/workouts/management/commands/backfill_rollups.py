@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import CustomUser
+from workouts import rollups
+
+
+class Command(BaseCommand):
+    help = "Ricalcola gli aggregati giornalieri, settimanali e mensili dai Workout esistenti, a blocchi di utenti."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help="Utenti elaborati per transazione.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        user_ids = CustomUser.objects.order_by('id').values_list('id', flat=True)
+        total = user_ids.count()
+
+        done = written = 0
+        chunk = []
+        for user_id in user_ids.iterator(chunk_size=chunk_size):
+            chunk.append(user_id)
+            if len(chunk) == chunk_size:
+                written += self._rebuild(chunk)
+                done += len(chunk)
+                chunk = []
+                self.stdout.write(f"{done}/{total} utenti")
+        if chunk:
+            written += self._rebuild(chunk)
+            done += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Aggregati ricalcolati per {done} utenti ({written} righe)."))
+
+    def _rebuild(self, user_ids):
+        with transaction.atomic():
+            return rollups.rebuild(user_ids)
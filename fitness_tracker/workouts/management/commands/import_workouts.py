@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import CustomUser
+from workouts import importers
+
+
+class Command(BaseCommand):
+    help = "Importa workout da file CSV o GPX, leggendoli in streaming e inserendoli a blocchi."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('paths', nargs='+', metavar='file')
+        parser.add_argument('--batch-size', type=int, default=importers.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['username'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"L'utente '{options['username']}' non esiste.")
+
+        for path in options['paths']:
+            started = time.perf_counter()
+
+            def progress(result):
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"\r{path}: {result.processed:,} righe ({result.processed / elapsed:,.0f}/s)",
+                    ending='',
+                )
+                self.stdout.flush()
+
+            try:
+                with open(path, 'rb') as fileobj:
+                    rows = importers.read_file(fileobj, path)
+                    result = importers.import_workouts(user, rows, options['batch_size'], progress)
+            except (OSError, importers.ImportFormatError) as exc:
+                raise CommandError(f"{path}: {exc}")
+
+            self.stdout.write('')
+            for error in result.errors:
+                self.stdout.write(self.style.WARNING(error))
+            self.stdout.write(self.style.SUCCESS(
+                f"{path}: {result.created} importati, {result.duplicates} duplicati, "
+                f"{result.invalid} non validi in {time.perf_counter() - started:.1f}s."
+            ))
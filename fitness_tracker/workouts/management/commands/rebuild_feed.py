@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import CustomUser
+from workouts import feed
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce il feed materializzato degli amici a partire dai Workout esistenti."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames',
+                            help="Ricostruisce solo il feed di questo utente (ripetibile).")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.order_by('id')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        total_users = total_entries = 0
+        for user_id in users.values_list('id', flat=True).iterator(chunk_size=options['chunk_size']):
+            with transaction.atomic():
+                total_entries += feed.rebuild(user_id)
+            total_users += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Feed ricostruito per {total_users} utenti ({total_entries} voci)."
+        ))
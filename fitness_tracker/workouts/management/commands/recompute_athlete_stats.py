@@ -0,0 +1,55 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from users.models import CustomUser
+from workouts import records
+
+
+def _init_worker():
+    # Con `spawn` (macOS, Windows) il processo figlio parte senza Django
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _recompute(user_ids):
+    try:
+        return records.recompute_many(user_ids)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola serie e record personali di tutti gli atleti, a blocchi "
+        "distribuiti su un pool di processi (per il primo riempimento)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Atleti per blocco (una transazione ciascuno).")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Processi in parallelo; 0 per eseguire tutto in questo processo.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        user_ids = list(CustomUser.objects.order_by('id').values_list('id', flat=True))
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+
+        done = 0
+        if options['workers'] <= 0:
+            for chunk in chunks:
+                done += records.recompute_many(chunk)
+        else:
+            # I figli non devono ereditare connessioni aperte dal padre
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+                futures = [pool.submit(_recompute, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    done += future.result()
+                    self.stdout.write(f"{done}/{len(user_ids)} atleti")
+
+        self.stdout.write(self.style.SUCCESS(f"Statistiche ricalcolate per {done} atleti."))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from workouts import totals
+from workouts.models import WorkoutTotal
+
+
+class Command(BaseCommand):
+    help = "Ricalcola da zero i totali per atleta e tipo, segnala le differenze e le corregge."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Mostra le differenze senza correggerle.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = totals.recompute()
+            stored = {
+                (row.user_id, row.type): row
+                for row in WorkoutTotal.objects.select_for_update()
+            }
+
+            to_update, to_create = [], []
+            for key in expected.keys() | stored.keys():
+                minutes, count = expected.get(key, (0, 0))
+                row = stored.get(key)
+                if row is None:
+                    to_create.append(WorkoutTotal(user_id=key[0], type=key[1], minutes=minutes, count=count))
+                elif (row.minutes, row.count) != (minutes, count):
+                    self.stdout.write(
+                        f"utente {key[0]} / {key[1]}: {row.minutes} min, {row.count} sessioni "
+                        f"-> {minutes} min, {count} sessioni"
+                    )
+                    row.minutes, row.count = minutes, count
+                    to_update.append(row)
+            for row in to_create:
+                self.stdout.write(f"utente {row.user_id} / {row.type}: mancante -> {row.minutes} min, {row.count} sessioni")
+
+            drift = len(to_update) + len(to_create)
+            if drift and not options['dry_run']:
+                WorkoutTotal.objects.bulk_update(to_update, ['minutes', 'count'], batch_size=1000)
+                WorkoutTotal.objects.bulk_create(to_create, batch_size=1000)
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Nessuna differenza: i totali sono allineati."))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{drift} totali non allineati (dry run, nessuna modifica)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Corretti {drift} totali."))
@@ -0,0 +1,45 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from users.models import CustomUser, Goal
+from workouts import leaderboards
+from workouts.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola le classifiche della settimana e del mese in corso (o di --data) "
+        "dagli aggregati. Da eseguire periodicamente, ad esempio ogni 15 minuti."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', type=date.fromisoformat, default=None,
+                            help="Giorno contenuto nei periodi da ricalcolare (AAAA-MM-GG).")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        day = options['data'] or date.today()
+        owners = {
+            # Una classifica tra amici ha senso solo con almeno un amico
+            LeaderboardEntry.FRIENDS: CustomUser.objects.filter(
+                Exists(CustomUser.friends.through.objects.filter(from_customuser=OuterRef('pk')))),
+            LeaderboardEntry.ATHLETES: CustomUser.objects.filter(
+                Exists(Goal.objects.filter(coach=OuterRef('pk')))),
+        }
+        written = 0
+        for board, users in owners.items():
+            owner_ids = users.order_by('id').values_list('id', flat=True)
+            for period in leaderboards.PERIODS:
+                start = leaderboards.current_start(period, day)
+                chunk = []
+                for owner_id in owner_ids.iterator(chunk_size=options['chunk_size']):
+                    chunk.append(owner_id)
+                    if len(chunk) >= options['chunk_size']:
+                        written += leaderboards.refresh(chunk, board, period, start)
+                        chunk = []
+                if chunk:
+                    written += leaderboards.refresh(chunk, board, period, start)
+
+        self.stdout.write(self.style.SUCCESS(f"Classifiche ricalcolate ({written} righe)."))
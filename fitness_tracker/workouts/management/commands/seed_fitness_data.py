@@ -0,0 +1,56 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import CustomUser
+from workouts import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un dataset sintetico e riproducibile: utenti con un grafo di amicizie a legge di potenza, "
+        "coach con i loro atleti, obiettivi e workout. A parità di parametri, --seed e --fino i dati sono identici."
+    )
+
+    def add_arguments(self, parser):
+        defaults = seed.SeedConfig()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--friends', type=int, default=defaults.friends,
+                            help="Amici medi per utente.")
+        parser.add_argument('--coaches', type=int, default=defaults.coaches)
+        parser.add_argument('--roster', type=int, default=defaults.roster,
+                            help="Atleti con obiettivi per coach.")
+        parser.add_argument('--workouts', type=int, default=defaults.workouts,
+                            help="Workout per utente.")
+        parser.add_argument('--giorni', type=int, default=defaults.days, dest='days',
+                            help="Intervallo di date dei workout, fino a --fino.")
+        parser.add_argument('--fino', type=date.fromisoformat, default=None, dest='end',
+                            help="Ultimo giorno dei workout (AAAA-MM-GG, predefinito oggi).")
+        parser.add_argument('--prefix', default=defaults.prefix,
+                            help="Prefisso degli username generati.")
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--password', default=None,
+                            help="Password comune degli utenti (predefinito: nessun login con password).")
+        parser.add_argument('--batch-size', type=int, default=defaults.batch_size)
+
+    def handle(self, *args, **options):
+        if options['coaches'] > options['users']:
+            raise CommandError("Ci sono più coach che utenti.")
+        if CustomUser.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Esistono già utenti con il prefisso '{options['prefix']}': usa --prefix.")
+
+        config = seed.SeedConfig(**{
+            name: options[name] for name in (
+                'users', 'friends', 'coaches', 'roster', 'workouts', 'days', 'prefix', 'seed', 'password',
+                'batch_size',
+            )
+        })
+        if options['end']:
+            config.end = options['end']
+
+        started = time.perf_counter()
+        counts = seed.seed(config, log=self.stdout.write)
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count:,}")
+        self.stdout.write(self.style.SUCCESS(f"Dataset generato in {time.perf_counter() - started:.1f}s."))
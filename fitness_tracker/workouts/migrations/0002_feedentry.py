@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+                ('workout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='workouts.workout')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-date', '-workout'], name='feedentry_owner_date_idx'), models.Index(fields=['owner', 'author'], name='feedentry_owner_author_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'workout'), name='feedentry_owner_workout_uniq')],
+            },
+        ),
+    ]
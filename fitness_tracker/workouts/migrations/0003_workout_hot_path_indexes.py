@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0002_feedentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', '-date', '-id'], name='workout_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workout',
+            index=models.Index(fields=['user', 'type', 'duration_minutes'], name='workout_user_type_minutes_idx'),
+        ),
+    ]
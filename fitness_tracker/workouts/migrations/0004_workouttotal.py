@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_totals(apps, schema_editor):
+    Workout = apps.get_model('workouts', 'Workout')
+    WorkoutTotal = apps.get_model('workouts', 'WorkoutTotal')
+    rows = (
+        Workout.objects.order_by()
+        .values_list('user_id', 'type')
+        .annotate(minutes=Sum('duration_minutes'), count=Count('id'))
+    )
+    WorkoutTotal.objects.bulk_create(
+        [WorkoutTotal(user_id=user_id, type=type, minutes=minutes, count=count)
+         for user_id, type, minutes, count in rows.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0003_workout_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkoutTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('run', 'Corsa'), ('swim', 'Nuoto'), ('bike', 'Bicicletta')], max_length=10)),
+                ('minutes', models.PositiveBigIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workout_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'type'), name='workouttotal_user_type_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0004_workouttotal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkoutRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('run', 'Corsa'), ('swim', 'Nuoto'), ('bike', 'Bicicletta')], max_length=10)),
+                ('period', models.CharField(choices=[('day', 'Giorno'), ('week', 'Settimana'), ('month', 'Mese')], max_length=5)),
+                ('start', models.DateField()),
+                ('minutes', models.PositiveBigIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workout_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'start', 'type'), name='workoutrollup_bucket_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:01
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0005_workoutrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workout',
+            name='date',
+            field=models.DateField(default=datetime.date.today, editable=False),
+        ),
+    ]
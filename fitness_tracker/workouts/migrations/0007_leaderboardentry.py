@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0006_workout_date_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('friends', 'Amici'), ('athletes', 'Atleti')], max_length=10)),
+                ('period', models.CharField(choices=[('day', 'Giorno'), ('week', 'Settimana'), ('month', 'Mese')], max_length=5)),
+                ('start', models.DateField()),
+                ('type', models.CharField(choices=[('run', 'Corsa'), ('swim', 'Nuoto'), ('bike', 'Bicicletta'), ('all', 'Tutti')], max_length=10)),
+                ('rank', models.PositiveIntegerField()),
+                ('minutes', models.PositiveBigIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'board', 'period', 'start', 'type', 'rank'], name='leaderboard_page_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'board', 'period', 'start', 'type', 'member'), name='leaderboard_member_uniq')],
+            },
+        ),
+    ]
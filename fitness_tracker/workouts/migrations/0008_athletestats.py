@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0007_leaderboardentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AthleteStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('current_streak', models.PositiveIntegerField(default=0)),
+                ('last_workout_date', models.DateField(blank=True, null=True)),
+                ('longest_streak', models.PositiveIntegerField(default=0)),
+                ('longest_streak_end', models.DateField(blank=True, null=True)),
+                ('best_run_minutes', models.PositiveIntegerField(default=0)),
+                ('best_swim_minutes', models.PositiveIntegerField(default=0)),
+                ('best_bike_minutes', models.PositiveIntegerField(default=0)),
+                ('best_week_minutes', models.PositiveBigIntegerField(default=0)),
+                ('best_week_start', models.DateField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='athlete_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workouts', '0009_workoutimport'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('friends', 'Amici'), ('athletes', 'Atleti')], max_length=10)),
+                ('period', models.CharField(choices=[('day', 'Giorno'), ('week', 'Settimana'), ('month', 'Mese')], max_length=5)),
+                ('start', models.DateField()),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('owner', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner', 'board', 'period', 'start'), name='leaderboard_refresh_uniq')],
+            },
+        ),
+    ]
@@ -1,4 +1,7 @@
+import datetime
+
 from django.db import models
+from django.utils import timezone
 from users.models import CustomUser
 
 class Workout(models.Model):
@@ -9,10 +12,229 @@ class Workout(models.Model):
     ]
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    date = models.DateField(auto_now_add=True)
+    # default invece di auto_now_add: gli import devono poter indicare la data
+    date = models.DateField(default=datetime.date.today, editable=False)
     type = models.CharField(max_length=10, choices=WORKOUT_CHOICES)
     duration_minutes = models.PositiveIntegerField()
     notes = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # feed / my_workouts: filtro per utente, ordinamento per data
+            models.Index(fields=['user', '-date', '-id'], name='workout_user_date_idx'),
+            # my_goals: filtro per utente e tipo, somma dei minuti senza leggere la tabella
+            models.Index(fields=['user', 'type', 'duration_minutes'], name='workout_user_type_minutes_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.get_type_display()} ({self.duration_minutes} min)"
+
+
+class FeedEntry(models.Model):
+    """Voce materializzata del feed: un workout di `author` visto da `owner`.
+
+    Le voci vengono scritte alla creazione del workout (fan-out on write) e
+    quando cambia l'amicizia, così la lettura del feed è una scansione per
+    indice su `owner` invece di un join su tutti gli amici.
+    """
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='feed_entries')
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    workout = models.ForeignKey(Workout, on_delete=models.CASCADE, related_name='feed_entries')
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'workout'], name='feedentry_owner_workout_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-date', '-workout'], name='feedentry_owner_date_idx'),
+            models.Index(fields=['owner', 'author'], name='feedentry_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner.username} <- {self.workout}"
+
+
+class WorkoutTotal(models.Model):
+    """Totale corrente di minuti e sessioni per atleta e tipo di workout.
+
+    Aggiornato nella stessa transazione delle scritture su `Workout`
+    (vedi `workouts.services`); `reconcile_totals` lo ricalcola da zero.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='workout_totals')
+    type = models.CharField(max_length=10, choices=Workout.WORKOUT_CHOICES)
+    minutes = models.PositiveBigIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'type'], name='workouttotal_user_type_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.get_type_display()}: {self.minutes} min"
+
+
+class WorkoutRollup(models.Model):
+    """Minuti e sessioni per utente, tipo e periodo (giorno/settimana/mese)."""
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [
+        (DAY, 'Giorno'),
+        (WEEK, 'Settimana'),
+        (MONTH, 'Mese'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='workout_rollups')
+    type = models.CharField(max_length=10, choices=Workout.WORKOUT_CHOICES)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    # Primo giorno del periodo (il lunedì per le settimane, il giorno 1 per i mesi)
+    start = models.DateField()
+    minutes = models.PositiveBigIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'start', 'type'], name='workoutrollup_bucket_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.period} {self.start} {self.type}: {self.minutes} min"
+
+
+class LeaderboardEntry(models.Model):
+    """Posizione di un utente nella classifica di `owner` per un periodo.
+
+    Le classifiche (amici di `owner`, o atleti se `owner` è un coach) sono
+    calcolate dagli aggregati `WorkoutRollup` e salvate già ordinate: la
+    pagina legge un intervallo dell'indice `leaderboard_page_idx`.
+    """
+    FRIENDS = 'friends'
+    ATHLETES = 'athletes'
+    BOARD_CHOICES = [
+        (FRIENDS, 'Amici'),
+        (ATHLETES, 'Atleti'),
+    ]
+    ALL = 'all'
+    TYPE_CHOICES = Workout.WORKOUT_CHOICES + [(ALL, 'Tutti')]
+
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+', db_index=False)
+    board = models.CharField(max_length=10, choices=BOARD_CHOICES)
+    period = models.CharField(max_length=5, choices=WorkoutRollup.PERIOD_CHOICES)
+    start = models.DateField()
+    type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    rank = models.PositiveIntegerField()
+    member = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    minutes = models.PositiveBigIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['owner', 'board', 'period', 'start', 'type', 'member'],
+                name='leaderboard_member_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'board', 'period', 'start', 'type', 'rank'], name='leaderboard_page_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner.username} {self.board} {self.period} {self.start} {self.type}: #{self.rank} {self.member.username}"
+
+
+class LeaderboardRefresh(models.Model):
+    """Ultimo calcolo di una classifica, anche se non ha prodotto righe.
+
+    Distingue una classifica mai calcolata da una vuota (coach senza atleti):
+    solo la prima va ricalcolata.
+    """
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+', db_index=False)
+    board = models.CharField(max_length=10, choices=LeaderboardEntry.BOARD_CHOICES)
+    period = models.CharField(max_length=5, choices=WorkoutRollup.PERIOD_CHOICES)
+    start = models.DateField()
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'board', 'period', 'start'], name='leaderboard_refresh_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner.username} {self.board} {self.period} {self.start}: {self.computed_at}"
+
+
+class AthleteStats(models.Model):
+    """Serie di giorni consecutivi e record personali di un atleta.
+
+    Aggiornato in O(1) da `workouts.services` a ogni nuovo workout; modifiche
+    e cancellazioni ricalcolano solo la parte interessata (vedi
+    `workouts.records`).
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='athlete_stats')
+    # Serie che termina con l'ultimo giorno di allenamento
+    current_streak = models.PositiveIntegerField(default=0)
+    last_workout_date = models.DateField(null=True, blank=True)
+    longest_streak = models.PositiveIntegerField(default=0)
+    longest_streak_end = models.DateField(null=True, blank=True)
+    # Workout più lungo per tipo, in minuti
+    best_run_minutes = models.PositiveIntegerField(default=0)
+    best_swim_minutes = models.PositiveIntegerField(default=0)
+    best_bike_minutes = models.PositiveIntegerField(default=0)
+    # Settimana con più minuti (tutti i tipi)
+    best_week_minutes = models.PositiveBigIntegerField(default=0)
+    best_week_start = models.DateField(null=True, blank=True)
+
+    def streak_on(self, day):
+        """Serie ancora aperta a `day`: valida se l'ultimo allenamento è di oggi o di ieri."""
+        if self.last_workout_date and (day - self.last_workout_date).days <= 1:
+            return self.current_streak
+        return 0
+
+    def __str__(self):
+        return f"{self.user.username}: serie {self.current_streak}, record {self.longest_streak}"
+
+
+class WorkoutImport(models.Model):
+    """Import di un file grande, eseguito in coda (`workouts.import_file`).
+
+    Il file caricato resta nello storage di default finché l'import non
+    termina; i contatori vengono aggiornati dopo ogni blocco inserito.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'In coda'),
+        (RUNNING, 'In corso'),
+        (DONE, 'Completato'),
+        (FAILED, 'Fallito'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='workout_imports')
+    file_name = models.CharField(max_length=255)
+    stored_name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    bytes_read = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    imported = models.PositiveIntegerField(default=0)
+    duplicates = models.PositiveIntegerField(default=0)
+    invalid = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @property
+    def percent(self):
+        if self.status == self.DONE:
+            return 100
+        return min(99, self.bytes_read * 100 // self.size) if self.size else 0
+
+    def __str__(self):
+        return f"{self.user.username} - {self.file_name} ({self.get_status_display()})"
@@ -0,0 +1,244 @@
+"""Serie di giorni consecutivi e record personali (`AthleteStats`).
+
+Un nuovo workout aggiorna la riga dell'atleta in O(1): allunga o riapre la
+serie e confronta durata e minuti della settimana con i record. Modifiche,
+cancellazioni e workout retrodatati toccano solo ciò che possono cambiare:
+
+- la serie che contiene il giorno del workout, letta a finestre attorno a
+  quel giorno finché non si trova un giorno di pausa per lato;
+- il massimo del tipo interessato (dall'indice user/type/duration), solo se
+  il workout tolto o accorciato era il record;
+- la settimana del workout, e tutte le settimane solo se quella era la
+  migliore e ha perso minuti.
+
+Solo quando si accorcia proprio la serie più lunga servono tutti i giorni di
+allenamento dell'atleta. Gli import ricalcolano l'atleta una volta sola, a
+fine file (`recompute_many`).
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Sum
+
+from . import rollups
+from .models import AthleteStats, Workout, WorkoutRollup
+
+BEST_FIELDS = {
+    'run': 'best_run_minutes',
+    'swim': 'best_swim_minutes',
+    'bike': 'best_bike_minutes',
+}
+# Giorni letti per volta cercando l'inizio o la fine di una serie (poi raddoppiati)
+SEGMENT_WINDOW = 64
+
+ONE_DAY = timedelta(days=1)
+
+
+def _week_minutes(user_id, start):
+    return WorkoutRollup.objects.filter(
+        user_id=user_id, period=WorkoutRollup.WEEK, start=start,
+    ).aggregate(minutes=Sum('minutes'))['minutes'] or 0
+
+
+def _locked_stats(user_id):
+    """Riga dell'atleta bloccata; None se mancava ed è stata appena ricalcolata."""
+    stats, created = AthleteStats.objects.select_for_update().get_or_create(user_id=user_id)
+    if created and Workout.objects.filter(user_id=user_id).exists():
+        recompute_many([user_id])
+        return None
+    return stats
+
+
+def _trained_on(user_id, day):
+    return Workout.objects.filter(user_id=user_id, date=day).exists()
+
+
+def _edge(user_id, day, step):
+    """Ultimo giorno della serie di `day` (giorno di allenamento) andando nella direzione `step`."""
+    edge, window = day, SEGMENT_WINDOW
+    while True:
+        limit = edge + step * window * ONE_DAY
+        days = set(
+            Workout.objects.filter(user_id=user_id, date__range=sorted((edge, limit)))
+            .values_list('date', flat=True).distinct()
+        )
+        following = edge + step * ONE_DAY
+        while following in days:
+            edge, following = following, following + step * ONE_DAY
+        if edge != limit:
+            return edge
+        window *= 2
+
+
+def _day_added(stats, user_id, day):
+    """`day`, prima dell'ultimo allenamento, è diventato un giorno di allenamento."""
+    first, end = _edge(user_id, day, -1), _edge(user_id, day, 1)
+    length = (end - first).days + 1
+    if end == stats.last_workout_date:
+        stats.current_streak = length
+    if length > stats.longest_streak or (length == stats.longest_streak and end < stats.longest_streak_end):
+        stats.longest_streak, stats.longest_streak_end = length, end
+
+
+def _day_removed(stats, user_id, day):
+    """`day` non è più un giorno di allenamento: la sua serie si divide in due."""
+    first = _edge(user_id, day - ONE_DAY, -1) if _trained_on(user_id, day - ONE_DAY) else day
+    end = _edge(user_id, day + ONE_DAY, 1) if _trained_on(user_id, day + ONE_DAY) else day
+    if stats.longest_streak_end and first <= stats.longest_streak_end <= end:
+        # Si è accorciata la serie più lunga: serve tutta la storia
+        _rescan_streaks(stats, user_id)
+        return
+    if day == stats.last_workout_date:
+        if first < day:
+            stats.last_workout_date, stats.current_streak = day - ONE_DAY, (day - first).days
+        else:
+            last = Workout.objects.filter(user_id=user_id, date__lt=day).aggregate(last=Max('date'))['last']
+            stats.last_workout_date = last
+            stats.current_streak = (last - _edge(user_id, last, -1)).days + 1 if last else 0
+    elif end == stats.last_workout_date:
+        stats.current_streak = (end - day).days
+
+
+def _rescan_streaks(stats, user_id):
+    dates = (
+        Workout.objects.filter(user_id=user_id)
+        .values_list('date', flat=True).distinct().order_by('date')
+    )
+    (stats.current_streak, stats.last_workout_date,
+     stats.longest_streak, stats.longest_streak_end) = streaks(dates)
+
+
+def _lower_best(stats, user_id, workout_type, minutes):
+    """Rilegge il massimo di `workout_type` se il workout tolto o accorciato era il record."""
+    field = BEST_FIELDS[workout_type]
+    if minutes >= getattr(stats, field):
+        best = Workout.objects.filter(user_id=user_id, type=workout_type).aggregate(
+            minutes=Max('duration_minutes'))['minutes']
+        setattr(stats, field, best or 0)
+
+
+def _update_week(stats, user_id, day):
+    """Confronta la settimana di `day` (aggregati già aggiornati) con la migliore."""
+    week_start = rollups.bucket_start(day, WorkoutRollup.WEEK)
+    week_minutes = _week_minutes(user_id, week_start)
+    if week_minutes > stats.best_week_minutes:
+        stats.best_week_minutes, stats.best_week_start = week_minutes, week_start
+    elif week_start == stats.best_week_start and week_minutes < stats.best_week_minutes:
+        stats.best_week_minutes, stats.best_week_start = 0, None
+        weeks = (
+            WorkoutRollup.objects.filter(user_id=user_id, period=WorkoutRollup.WEEK)
+            .values_list('start').annotate(minutes=Sum('minutes')).order_by('start')
+        )
+        for start, minutes in weeks:
+            if minutes > stats.best_week_minutes:
+                stats.best_week_minutes, stats.best_week_start = minutes, start
+
+
+def on_create(workout):
+    """Aggiorna serie e record per un nuovo workout (dopo `rollups.apply`)."""
+    stats = _locked_stats(workout.user_id)
+    if stats is None:
+        return
+    day, last = workout.date, stats.last_workout_date
+    if last is not None and day < last:
+        # Un workout nel passato può allungare o unire serie
+        if not Workout.objects.filter(user_id=workout.user_id, date=day).exclude(pk=workout.pk).exists():
+            _day_added(stats, workout.user_id, day)
+    elif last is None or day > last:
+        stats.current_streak = stats.current_streak + 1 if last and (day - last).days == 1 else 1
+        stats.last_workout_date = day
+        if stats.current_streak > stats.longest_streak:
+            stats.longest_streak = stats.current_streak
+            stats.longest_streak_end = day
+
+    field = BEST_FIELDS[workout.type]
+    setattr(stats, field, max(getattr(stats, field), workout.duration_minutes))
+    _update_week(stats, workout.user_id, day)
+    stats.save()
+
+
+def on_update(previous, workout):
+    """Aggiorna i record dopo un cambio di tipo o durata (la data non cambia)."""
+    stats = _locked_stats(workout.user_id)
+    if stats is None:
+        return
+    _lower_best(stats, workout.user_id, previous.type, previous.duration_minutes)
+    field = BEST_FIELDS[workout.type]
+    setattr(stats, field, max(getattr(stats, field), workout.duration_minutes))
+    _update_week(stats, workout.user_id, workout.date)
+    stats.save()
+
+
+def on_delete(workout):
+    """Aggiorna serie e record dopo la cancellazione di un workout (dopo `rollups.apply`)."""
+    stats = _locked_stats(workout.user_id)
+    if stats is None:
+        return
+    if not _trained_on(workout.user_id, workout.date):
+        _day_removed(stats, workout.user_id, workout.date)
+    _lower_best(stats, workout.user_id, workout.type, workout.duration_minutes)
+    _update_week(stats, workout.user_id, workout.date)
+    stats.save()
+
+
+def streaks(dates):
+    """(serie corrente, ultimo giorno, serie più lunga, fine della più lunga) da date crescenti distinte."""
+    current = longest = 0
+    previous = longest_end = None
+    for day in dates:
+        current = current + 1 if previous and (day - previous).days == 1 else 1
+        if current > longest:
+            longest, longest_end = current, day
+        previous = day
+    return current, previous, longest, longest_end
+
+
+def recompute_many(user_ids):
+    """Ricalcola da zero le statistiche di un gruppo di atleti (tre query in tutto)."""
+    user_ids = list(user_ids)
+    dates = defaultdict(list)
+    rows = (
+        Workout.objects.filter(user_id__in=user_ids)
+        .values_list('user_id', 'date').distinct().order_by('user_id', 'date')
+    )
+    for user_id, day in rows:
+        dates[user_id].append(day)
+
+    best = defaultdict(dict)
+    rows = (
+        Workout.objects.filter(user_id__in=user_ids).order_by()
+        .values_list('user_id', 'type').annotate(minutes=Max('duration_minutes'))
+    )
+    for user_id, workout_type, minutes in rows:
+        best[user_id][workout_type] = minutes
+
+    weeks = {}
+    rows = (
+        WorkoutRollup.objects.filter(user_id__in=user_ids, period=WorkoutRollup.WEEK)
+        .values_list('user_id', 'start').annotate(minutes=Sum('minutes')).order_by('user_id', 'start')
+    )
+    for user_id, start, minutes in rows:
+        if minutes > weeks.get(user_id, (0, None))[0]:
+            weeks[user_id] = (minutes, start)
+
+    stats = []
+    for user_id in user_ids:
+        current, last, longest, longest_end = streaks(dates[user_id])
+        week_minutes, week_start = weeks.get(user_id, (0, None))
+        stats.append(AthleteStats(
+            user_id=user_id,
+            current_streak=current, last_workout_date=last,
+            longest_streak=longest, longest_streak_end=longest_end,
+            best_week_minutes=week_minutes, best_week_start=week_start,
+            **{field: best[user_id].get(workout_type, 0) for workout_type, field in BEST_FIELDS.items()},
+        ))
+    with transaction.atomic():
+        AthleteStats.objects.filter(user_id__in=user_ids).delete()
+        AthleteStats.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
+
+
+def get(user):
+    """Statistiche dell'atleta (una riga vuota se non si è mai allenato)."""
+    return AthleteStats.objects.filter(user=user).first() or AthleteStats(user=user)
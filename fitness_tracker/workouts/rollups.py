@@ -0,0 +1,102 @@
+"""Aggregati per giorno, settimana e mese dei minuti di allenamento."""
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import Workout, WorkoutRollup
+
+PERIODS = [period for period, _ in WorkoutRollup.PERIOD_CHOICES]
+TYPES = [choice for choice, _ in Workout.WORKOUT_CHOICES]
+
+TRUNCATE = {
+    WorkoutRollup.DAY: TruncDay,
+    WorkoutRollup.WEEK: TruncWeek,
+    WorkoutRollup.MONTH: TruncMonth,
+}
+
+
+def bucket_start(day, period):
+    if period == WorkoutRollup.WEEK:
+        return day - timedelta(days=day.weekday())
+    if period == WorkoutRollup.MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def apply(user_id, workout_type, day, minutes, count):
+    """Somma `minutes` e `count` (anche negativi) ai tre periodi che contengono `day`."""
+    for period in PERIODS:
+        apply_bucket(user_id, workout_type, period, bucket_start(day, period), minutes, count)
+
+
+def apply_bucket(user_id, workout_type, period, start, minutes, count):
+    """Somma `minutes` e `count` a un singolo periodo."""
+    bucket = WorkoutRollup.objects.filter(user_id=user_id, period=period, start=start, type=workout_type)
+    if bucket.update(minutes=F('minutes') + minutes, count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            WorkoutRollup.objects.create(
+                user_id=user_id, type=workout_type, period=period, start=start,
+                minutes=max(minutes, 0), count=max(count, 0),
+            )
+    except IntegrityError:
+        apply_bucket(user_id, workout_type, period, start, minutes, count)
+
+
+def apply_many(user_id, deltas):
+    """Applica in blocco {(tipo, periodo, inizio): (minuti, sessioni)} a un utente.
+
+    Un solo `executemany` di INSERT ... ON CONFLICT DO UPDATE (SQLite e
+    PostgreSQL) invece di un UPDATE per periodo: i periodi mancanti vengono
+    creati e quelli esistenti incrementati in modo atomico.
+    """
+    if not deltas:
+        return
+    quote = connection.ops.quote_name
+    table = quote(WorkoutRollup._meta.db_table)
+    names = ['user', 'type', 'period', 'start', 'minutes', 'count']
+    columns = {name: quote(WorkoutRollup._meta.get_field(name).column) for name in names}
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns.values())}) VALUES (%s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT ({columns['user']}, {columns['period']}, {columns['start']}, {columns['type']}) "
+        f"DO UPDATE SET {columns['minutes']} = {table}.{columns['minutes']} + excluded.{columns['minutes']}, "
+        f"{columns['count']} = {table}.{columns['count']} + excluded.{columns['count']}"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (user_id, workout_type, period, start, minutes, count)
+            for (workout_type, period, start), (minutes, count) in deltas.items()
+        ])
+
+
+def rebuild(user_ids):
+    """Ricalcola da zero gli aggregati di un gruppo di utenti; ritorna le righe scritte."""
+    WorkoutRollup.objects.filter(user_id__in=user_ids).delete()
+    rollups = []
+    for period, trunc in TRUNCATE.items():
+        rows = (
+            Workout.objects.filter(user_id__in=user_ids)
+            .annotate(start=trunc('date'))
+            .order_by()
+            .values_list('user_id', 'type', 'start')
+            .annotate(minutes=Sum('duration_minutes'), count=Count('id'))
+        )
+        rollups += [
+            WorkoutRollup(user_id=user_id, type=workout_type, period=period, start=start, minutes=minutes, count=count)
+            for user_id, workout_type, start, minutes, count in rows
+        ]
+    WorkoutRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+
+def series(user, period, since=None, workout_type=None):
+    """Aggregati di un utente in ordine cronologico: [(start, type, minuti, sessioni)]."""
+    rollups = WorkoutRollup.objects.filter(user=user, period=period)
+    if since:
+        rollups = rollups.filter(start__gte=bucket_start(since, period))
+    if workout_type:
+        rollups = rollups.filter(type=workout_type)
+    return list(rollups.order_by('start', 'type').values_list('start', 'type', 'minutes', 'count'))
@@ -0,0 +1,204 @@
+"""Dati sintetici riproducibili per sviluppo e benchmark (`seed_fitness_data`).
+
+Con gli stessi parametri, lo stesso `seed` e la stessa data finale si
+ottiene sempre lo stesso dataset. Le righe vengono inserite con
+`bulk_create` a blocchi, saltando servizi e segnali; le tabelle derivate
+(feed, totali, aggregati, statistiche, indice di ricerca, suggerimenti)
+vengono poi ricalcolate una volta sola con le stesse funzioni dei comandi di
+manutenzione.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from users import friends, search
+from users.models import CustomUser, Goal
+from . import feed, records, rollups, totals
+from .models import Workout, WorkoutTotal
+
+Friendship = CustomUser.friends.through
+
+FIRST_NAMES = (
+    'Alessandro', 'Giulia', 'Marco', 'Francesca', 'Luca', 'Chiara', 'Matteo', 'Sara', 'Andrea', 'Martina',
+    'Davide', 'Elena', 'Simone', 'Valentina', 'Federico', 'Alessia', 'Lorenzo', 'Giorgia', 'Riccardo', 'Anna',
+)
+LAST_NAMES = (
+    'Rossi', 'Russo', 'Ferrari', 'Esposito', 'Bianchi', 'Romano', 'Colombo', 'Ricci', 'Marino', 'Greco',
+    'Bruno', 'Gallo', 'Conti', 'De Luca', 'Mancini', 'Costa', 'Giordano', 'Rizzo', 'Lombardi', 'Moretti',
+)
+# Tipo: (peso nella scelta, durata media, deviazione standard) in minuti
+WORKOUT_TYPES = {
+    'run': (5, 45, 15),
+    'bike': (3, 75, 30),
+    'swim': (2, 40, 12),
+}
+NOTES = ('', '', '', 'Ripetute', 'Lento', 'Con il gruppo', 'Gara', 'Recupero')
+
+
+@dataclass
+class SeedConfig:
+    users: int = 1000
+    friends: int = 10
+    coaches: int = 20
+    roster: int = 25
+    workouts: int = 50
+    days: int = 365
+    end: date = field(default_factory=date.today)
+    prefix: str = 'seed'
+    seed: int = 42
+    password: str = None
+    batch_size: int = 5000
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def friend_pairs(user_ids, average, rng):
+    """Grafo di amicizie ad attaccamento preferenziale (Barabási–Albert).
+
+    Ogni nuovo utente sceglie `average / 2` amici tra quelli già creati, con
+    probabilità proporzionale al numero di amici che hanno già: pochi utenti
+    molto connessi e una lunga coda con pochi amici (legge di potenza).
+    """
+    per_user = max(1, average // 2)
+    # Ogni utente compare una volta per ogni amicizia: scegliere a caso da qui
+    # vuol dire scegliere in proporzione al grado
+    ends = []
+    pairs = set()
+    for index, user_id in enumerate(user_ids[1:], start=1):
+        chosen = set()
+        while len(chosen) < min(per_user, index):
+            chosen.add(rng.choice(ends) if ends else user_ids[rng.randrange(index)])
+        for friend_id in chosen:
+            pairs.add((friend_id, user_id))
+            ends += (friend_id, user_id)
+    return sorted(pairs)
+
+
+def _workout(rng, user_id, config):
+    workout_type = rng.choices(list(WORKOUT_TYPES), [weight for weight, _, _ in WORKOUT_TYPES.values()])[0]
+    _, mean, deviation = WORKOUT_TYPES[workout_type]
+    return Workout(
+        user_id=user_id,
+        type=workout_type,
+        duration_minutes=max(5, round(rng.gauss(mean, deviation))),
+        date=config.end - timedelta(days=rng.randrange(config.days)),
+        notes=rng.choice(NOTES),
+    )
+
+
+def seed(config, log=print):
+    """Genera il dataset descritto da `config`; restituisce il numero di righe per tabella."""
+    rng = random.Random(config.seed)
+    counts = {}
+    password = make_password(config.password)
+
+    log("Utenti...")
+    users = []
+    for index in range(config.users):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        users.append(CustomUser(
+            username=f'{config.prefix}{index:06d}',
+            first_name=first_name,
+            last_name=last_name,
+            email=f'{config.prefix}{index:06d}@example.com',
+            password=password,
+            is_coach=index < config.coaches,
+            height_cm=round(rng.gauss(172, 9), 1),
+            weight_kg=round(rng.gauss(70, 11), 1),
+        ))
+    with transaction.atomic():
+        for batch in _batches(users, config.batch_size):
+            CustomUser.objects.bulk_create(batch)
+    # Su SQLite `bulk_create` restituisce gli id; in generale si rileggono
+    user_ids = list(
+        CustomUser.objects.filter(username__startswith=config.prefix).order_by('username').values_list('id', flat=True)
+    )
+    counts['users'] = len(user_ids)
+
+    log("Amicizie...")
+    pairs = friend_pairs(user_ids, config.friends, rng)
+    edges = ((a, b) for pair in pairs for a, b in (pair, pair[::-1]))
+    with transaction.atomic():
+        for batch in _batches(edges, config.batch_size):
+            Friendship.objects.bulk_create(
+                [Friendship(from_customuser_id=owner_id, to_customuser_id=friend_id) for owner_id, friend_id in batch])
+    counts['friendships'] = len(pairs)
+
+    log("Obiettivi...")
+    coach_ids, athlete_ids = user_ids[:config.coaches], user_ids[config.coaches:]
+    goals = []
+    for coach_id in coach_ids:
+        for athlete_id in rng.sample(athlete_ids, min(config.roster, len(athlete_ids))):
+            goals.append(Goal(
+                coach_id=coach_id,
+                athlete_id=athlete_id,
+                target_weight=round(rng.gauss(68, 8), 1) if rng.random() < 0.5 else None,
+                target_running_minutes=rng.randrange(300, 3000, 30) if rng.random() < 0.8 else None,
+                target_swimming_minutes=rng.randrange(120, 1200, 30) if rng.random() < 0.4 else None,
+                target_cycling_minutes=rng.randrange(300, 4000, 30) if rng.random() < 0.6 else None,
+            ))
+    Goal.objects.bulk_create(goals, batch_size=config.batch_size)
+    counts['goals'] = len(goals)
+
+    log("Workout...")
+    workouts = (_workout(rng, user_id, config) for user_id in user_ids for _ in range(config.workouts))
+    counts['workouts'] = 0
+    with transaction.atomic():
+        for batch in _batches(workouts, config.batch_size):
+            Workout.objects.bulk_create(batch)
+            counts['workouts'] += len(batch)
+
+    counts.update(rebuild_derived(user_ids, config.batch_size, log))
+    return counts
+
+
+def rebuild_derived(user_ids, chunk_size=5000, log=print):
+    """Ricalcola le tabelle derivate degli utenti indicati dopo un inserimento in blocco."""
+    counts = {}
+    seeded = set(user_ids)
+
+    log("Totali...")
+    rows = [
+        WorkoutTotal(user_id=user_id, type=workout_type, minutes=minutes, count=count)
+        for (user_id, workout_type), (minutes, count) in totals.recompute().items()
+        if user_id in seeded
+    ]
+    with transaction.atomic():
+        WorkoutTotal.objects.filter(user_id__in=user_ids).delete()
+        WorkoutTotal.objects.bulk_create(rows, batch_size=chunk_size)
+    counts['totals'] = len(rows)
+
+    log("Aggregati e statistiche...")
+    counts['rollups'] = 0
+    # Blocchi più piccoli: `user_id IN (...)` resta sotto il limite di parametri di SQLite
+    for chunk in _batches(user_ids, 500):
+        with transaction.atomic():
+            counts['rollups'] += rollups.rebuild(chunk)
+            records.recompute_many(chunk)
+
+    log("Feed...")
+    counts['feed_entries'] = 0
+    for chunk in _batches(user_ids, 500):
+        with transaction.atomic():
+            counts['feed_entries'] += sum(feed.rebuild(user_id) for user_id in chunk)
+
+    log("Indice di ricerca e suggerimenti...")
+    counts['search_grams'] = counts['suggestions'] = 0
+    for chunk in _batches(user_ids, 500):
+        with transaction.atomic():
+            counts['search_grams'] += search.index_users(
+                CustomUser.objects.filter(id__in=chunk).only(*search.SEARCH_FIELDS))
+        counts['suggestions'] += friends.refresh_suggestions(chunk)
+    return counts
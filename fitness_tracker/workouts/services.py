@@ -0,0 +1,117 @@
+"""Scritture sui workout e aggiornamento delle strutture derivate.
+
+Le viste passano da qui invece di chiamare `save()`/`delete()` direttamente,
+così feed, totali, aggregati per periodo, record personali e contatori di
+versione restano coerenti con la tabella `Workout` nella stessa transazione.
+Le notifiche di un nuovo workout vengono solo accodate (`jobs.queue`).
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+
+from jobs import queue
+from users import versions
+from users.models import UserVersion
+from . import feed, records, rollups, totals
+from .models import Workout
+
+# Righe per INSERT sui database senza limite stretto di parametri (PostgreSQL)
+MAX_INSERT_ROWS = 1000
+
+
+def _touch(user_id):
+    """Segnala che i dati derivati dai workout di `user_id` sono cambiati."""
+    versions.bump(user_id, UserVersion.WORKOUTS, UserVersion.GOALS)
+    versions.bump(feed.follower_ids(user_id), UserVersion.FEED)
+    versions.bump(versions.coach_ids(user_id), UserVersion.COACH)
+
+
+def create_workout(workout):
+    with transaction.atomic():
+        workout.save()
+        feed.publish(workout)
+        totals.apply(workout.user_id, workout.type, workout.duration_minutes, 1)
+        rollups.apply(workout.user_id, workout.type, workout.date, workout.duration_minutes, 1)
+        records.on_create(workout)
+        _touch(workout.user_id)
+        # Le notifiche ad amici e coach partono da un lavoro in coda
+        queue.enqueue('users.notify_workout', {'workout_id': workout.id}, key=f'notify-workout:{workout.id}')
+
+
+def update_workout(workout):
+    with transaction.atomic():
+        # Rilegge la riga salvata (bloccandola) per sapere cosa togliere dai totali
+        previous = Workout.objects.select_for_update().get(pk=workout.pk)
+        workout.save()
+        _touch(workout.user_id)
+        if (previous.type, previous.duration_minutes) == (workout.type, workout.duration_minutes):
+            return
+        # Le voci del feed puntano al workout: basta spostare minuti e
+        # sessioni dai vecchi valori ai nuovi, anche quando cambia il tipo.
+        totals.apply(previous.user_id, previous.type, -previous.duration_minutes, -1)
+        totals.apply(workout.user_id, workout.type, workout.duration_minutes, 1)
+        rollups.apply(previous.user_id, previous.type, previous.date, -previous.duration_minutes, -1)
+        rollups.apply(workout.user_id, workout.type, workout.date, workout.duration_minutes, 1)
+        records.on_update(previous, workout)
+
+
+def delete_workout(workout):
+    with transaction.atomic():
+        # Le voci del feed vengono eliminate in cascata
+        _, deleted = Workout.objects.filter(pk=workout.pk).delete()
+        if deleted.get(Workout._meta.label):
+            totals.apply(workout.user_id, workout.type, -workout.duration_minutes, -1)
+            rollups.apply(workout.user_id, workout.type, workout.date, -workout.duration_minutes, -1)
+            records.on_delete(workout)
+            _touch(workout.user_id)
+
+
+def bulk_insert_workouts(user_id, rows):
+    """Inserisce un blocco di workout `(data, tipo, minuti, note)` di un utente.
+
+    Usa INSERT su più righe invece di `bulk_create`, che costruisce
+    un'istanza del modello e compila ogni valore per riga; con SQLite le
+    righe per INSERT restano nel limite di 999 parametri. Totali, aggregati e
+    feed vengono aggiornati una volta per blocco invece che una volta per
+    workout. Serie e record no: il chiamante li ricalcola con
+    `records.recompute_many` dopo l'ultimo blocco.
+    """
+    quote = connection.ops.quote_name
+    table = quote(Workout._meta.db_table)
+    fields = [Workout._meta.get_field(name) for name in ('user', 'date', 'type', 'duration_minutes', 'notes')]
+    columns = ', '.join(quote(field.column) for field in fields)
+    size = max(1, min(connection.ops.bulk_batch_size(fields, rows), MAX_INSERT_ROWS))
+
+    # Prima per giorno e tipo, poi per periodo: i giorni distinti sono pochi
+    days = {}
+    for day, workout_type, duration, _ in rows:
+        day_minutes, day_count = days.get((day, workout_type), (0, 0))
+        days[day, workout_type] = (day_minutes + duration, day_count + 1)
+    minutes, counts = Counter(), Counter()
+    buckets = {}
+    for (day, workout_type), (day_minutes, day_count) in days.items():
+        minutes[workout_type] += day_minutes
+        counts[workout_type] += day_count
+        for period in rollups.PERIODS:
+            key = (workout_type, period, rollups.bucket_start(day, period))
+            bucket_minutes, bucket_count = buckets.get(key, (0, 0))
+            buckets[key] = (bucket_minutes + day_minutes, bucket_count + day_count)
+
+    # Una conversione per giorno invece che per riga
+    iso = {day: connection.ops.adapt_datefield_value(day) for day, _ in days}
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for offset in range(0, len(rows), size):
+                chunk = rows[offset:offset + size]
+                values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk))
+                cursor.execute(
+                    f"INSERT INTO {table} ({columns}) VALUES {values}",
+                    [value for day, workout_type, duration, notes in chunk
+                     for value in (user_id, iso[day], workout_type, duration, notes)],
+                )
+        for workout_type, value in minutes.items():
+            totals.apply(user_id, workout_type, value, counts[workout_type])
+        rollups.apply_many(user_id, buckets)
+        feed.publish_imported(user_id, {day for day, _ in days})
+        _touch(user_id)
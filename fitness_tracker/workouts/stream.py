@@ -0,0 +1,247 @@
+"""Aggiornamenti in tempo reale del feed e degli obiettivi (Server-Sent Events).
+
+Funziona solo servito via ASGI (`core.asgi`, processo `stream` del Procfile:
+il sito resta su WSGI, più veloce per le richieste brevi, e sotto WSGI la vista
+risponde 204 perché EventSource non si riconnetta). La connessione resta aperta e
+aspetta i messaggi dell'hub in-process (`core.realtime`). Le letture dal
+database avvengono solo quando arriva un messaggio, nel pool di thread
+condiviso; le nuove voci del feed richieste da molte connessioni nello
+stesso momento (tutti i follower di chi ha appena salvato un workout) si
+leggono insieme, con `feed.entries_since_many`.
+
+`core.asgi` instrada `feed/stream/` direttamente su `asgi_stream`, fuori
+dalla catena dei middleware: sotto ASGI ogni richiesta che passa dai
+middleware sincroni tiene un thread tutto per sé finché non si chiude, e
+migliaia di connessioni inattive vorrebbero dire migliaia di thread. La
+vista `feed_stream` resta per il routing, `reverse()` e i test.
+
+Se nessun proxy instrada `feed/stream/` verso il processo `stream`, le pagine
+aprono `REALTIME_STREAM_URL` su un altro host: le origini del sito vanno in
+`REALTIME_ALLOWED_ORIGINS` e il cookie di sessione deve valere anche lì
+(`SESSION_COOKIE_DOMAIN`).
+
+Eventi inviati:
+- `feed`: i nuovi workout degli amici (l'`id` dell'evento è l'ultima voce
+  del feed, così `Last-Event-ID` fa riprendere da lì dopo una riconnessione);
+- `obiettivi`: i progressi correnti, come `api/obiettivi/`.
+"""
+import asyncio
+import json
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections, connection
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.http.cookie import parse_cookie
+from django.urls import reverse
+
+from core import realtime
+from users.api import goal_progress
+from users.models import CustomUser, UserVersion
+from . import feed
+
+# Millisecondi che il browser aspetta prima di riconnettersi
+RETRY_MS = 5000
+# Secondi in cui si raccolgono le letture del feed da fare insieme
+BATCH_WINDOW = 0.01
+HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    # Niente buffering nei proxy (nginx)
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def stream_url():
+    """URL da aprire con EventSource: quello del processo `stream` se è su un altro host."""
+    return settings.REALTIME_STREAM_URL or reverse('feed_stream')
+
+
+def _cors_headers(origin):
+    """Header CORS per un'origine del sito servito da un altro host, altrimenti nessuno."""
+    if origin not in settings.REALTIME_ALLOWED_ORIGINS:
+        return []
+    return [
+        (b'access-control-allow-origin', origin.encode('latin-1')),
+        (b'access-control-allow-credentials', b'true'),
+        (b'vary', b'origin'),
+    ]
+
+
+def _event(name, data, event_id=None):
+    lines = [f"event: {name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _workout_data(workout):
+    return {
+        'id': workout.id,
+        'username': workout.user.username,
+        'type': workout.type,
+        'type_label': workout.get_type_display(),
+        'duration_minutes': workout.duration_minutes,
+        'date': workout.date.isoformat(),
+        'notes': workout.notes,
+    }
+
+
+def _new_workouts(requests):
+    """[(user_id, after_id), ...] → {(user_id, after_id): (nuovi workout, id dell'ultima voce)}."""
+    close_old_connections()
+    return {
+        (user_id, after_id): ([_workout_data(entry.workout) for entry in entries], entries[-1].id if entries else after_id)
+        for (user_id, after_id), entries in feed.entries_since_many(requests).items()
+    }
+
+
+def _goals(user_id):
+    close_old_connections()
+    return goal_progress(CustomUser.objects.get(pk=user_id))
+
+
+def _close_connection():
+    connection.close()
+
+
+def _read(func, *args):
+    # Pool condiviso: i thread (e le loro connessioni) sono pochi e riusati
+    return sync_to_async(func, thread_sensitive=False)(*args)
+
+
+class FeedLoader:
+    """Raccoglie per `BATCH_WINDOW` le letture delle nuove voci e le fa con una query."""
+
+    def __init__(self):
+        self.pending = {}
+
+    def load(self, user_id, after_id):
+        """Future con (nuovi workout, id dell'ultima voce); le richieste uguali la condividono."""
+        key = (user_id, after_id)
+        if key not in self.pending:
+            if not self.pending:
+                asyncio.get_running_loop().create_task(self._flush())
+            self.pending[key] = asyncio.get_running_loop().create_future()
+        return self.pending[key]
+
+    async def _flush(self):
+        await asyncio.sleep(BATCH_WINDOW)
+        pending, self.pending = self.pending, {}
+        try:
+            loaded = await _read(_new_workouts, list(pending))
+        except Exception as exc:
+            for future in pending.values():
+                future.set_exception(exc)
+            return
+        for key, future in pending.items():
+            future.set_result(loaded[key])
+
+
+loader = FeedLoader()
+
+
+async def _events(user_id, last_id):
+    # Abbonamento dentro il generatore: il `finally` lo chiude sempre
+    queue = realtime.hub.subscribe(user_id)
+    realtime.watcher.ensure_running()
+    try:
+        if last_id is None:
+            last_id = await _read(feed.last_entry_id, user_id)
+        else:
+            # Riconnessione: recupera subito quello che è arrivato nel frattempo
+            queue.put_nowait({'scope': UserVersion.FEED})
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), realtime.heartbeat_interval())
+            except asyncio.TimeoutError:
+                # Commento SSE: tiene aperta la connessione attraverso i proxy
+                yield ": ping\n\n"
+                continue
+            if message['scope'] == UserVersion.FEED:
+                # `shield`: la future è condivisa, chiudere questa connessione non la annulla
+                workouts, last_id = await asyncio.shield(loader.load(user_id, last_id))
+                if workouts:
+                    yield _event('feed', workouts, last_id)
+            elif message['scope'] == UserVersion.GOALS:
+                yield _event('obiettivi', await _read(_goals, user_id))
+    finally:
+        realtime.hub.unsubscribe(user_id, queue)
+
+
+async def feed_stream(request):
+    if not isinstance(request, ASGIRequest):
+        # Sotto WSGI ogni connessione terrebbe un thread per ore
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': "Autenticazione richiesta."}, status=401)
+    try:
+        last_id = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        last_id = None
+    # Sessione e utente sono stati letti nel thread di questa richiesta: la
+    # sua connessione al database non deve restare aperta per ore
+    await sync_to_async(_close_connection)()
+
+    response = StreamingHttpResponse(_events(user.id, last_id))
+    for name, value in HEADERS:
+        response[name.decode()] = value.decode()
+    return response
+
+
+def _session_user_id(session_key):
+    """Id dell'utente della sessione (con gli stessi controlli di `AuthenticationMiddleware`)."""
+    close_old_connections()
+    if not session_key:
+        return None
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    user = get_user(request)
+    return user.pk if user.is_authenticated else None
+
+
+async def asgi_stream(scope, receive, send):
+    """Lo stream come applicazione ASGI, senza middleware né thread per connessione."""
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+    cors = _cors_headers(headers.get('origin'))
+    if scope.get('method') == 'OPTIONS':
+        # Preflight delle riconnessioni da un'altra origine (header Last-Event-ID)
+        allow = [(b'access-control-allow-methods', b'GET'), (b'access-control-allow-headers', b'last-event-id')]
+        await send({'type': 'http.response.start', 'status': 204, 'headers': cors + allow if cors else []})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    cookies = parse_cookie(headers.get('cookie', ''))
+    user_id = await _read(_session_user_id, cookies.get(settings.SESSION_COOKIE_NAME))
+    if user_id is None:
+        await send({'type': 'http.response.start', 'status': 401,
+                    'headers': [(b'content-type', b'application/json'), *cors]})
+        await send({'type': 'http.response.body', 'body': json.dumps({'error': "Autenticazione richiesta."}).encode()})
+        return
+    try:
+        last_id = int(headers['last-event-id'])
+    except (KeyError, ValueError):
+        last_id = None
+
+    async def pump():
+        await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS + cors})
+        async for chunk in _events(user_id, last_id):
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    tasks = [asyncio.create_task(pump()), asyncio.create_task(disconnected())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # La cancellazione arriva dentro `_events`, che chiude l'abbonamento
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
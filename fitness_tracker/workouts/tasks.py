@@ -0,0 +1,15 @@
+"""Lavori in coda dell'app workouts (vedi `jobs.queue`)."""
+from datetime import date
+
+from jobs import queue
+from . import importers, leaderboards
+
+
+@queue.task('workouts.import_file', atomic=False)
+def import_file(import_id):
+    importers.run_import(import_id)
+
+
+@queue.task('workouts.refresh_leaderboard')
+def refresh_leaderboard(owner_id, board, period, start):
+    leaderboards.refresh([owner_id], board, period, date.fromisoformat(start))
@@ -1,3 +1,828 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.core.checks import Tags, run_checks
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core import dbhooks, metrics, profiler, realtime, static
+from core.querybudget import QueryBudgetExceeded, QueryBudgetMixin, count_queries
+from jobs import queue
+from jobs.models import Job
+from users import friends
+from users.models import CustomUser, Goal
+from . import feed, importers, leaderboards, records, rollups, seed, services, stream, totals, views
+from .models import AthleteStats, FeedEntry, LeaderboardEntry, Workout, WorkoutImport, WorkoutRollup, WorkoutTotal
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user('alice')
+        self.bob = CustomUser.objects.create_user('bob')
+        self.client.force_login(self.alice)
+
+    def befriend(self):
+        self.client.get(reverse('toggle_friend', args=[self.bob.id]))
+
+    def test_toggle_friend_backfills_and_clears_feed(self):
+        workout = Workout.objects.create(user=self.bob, type='run', duration_minutes=30)
+        self.befriend()
+        self.assertTrue(FeedEntry.objects.filter(owner=self.alice, workout=workout).exists())
+        self.befriend()
+        self.assertFalse(FeedEntry.objects.filter(owner=self.alice).exists())
+
+    def test_create_workout_fans_out_to_friends(self):
+        self.befriend()
+        self.client.force_login(self.bob)
+        self.client.post(reverse('create_workout'), {'type': 'swim', 'duration_minutes': 45})
+        self.assertEqual(FeedEntry.objects.filter(owner=self.alice).count(), 1)
+
+    def test_feed_keyset_pagination(self):
+        self.befriend()
+        for minutes in range(5):
+            workout = Workout.objects.create(user=self.bob, type='bike', duration_minutes=minutes + 1)
+            FeedEntry.objects.create(owner=self.alice, author=self.bob, workout=workout, date=workout.date)
+
+        with self.settings(FEED_PAGE_SIZE=2):
+            seen = []
+            cursor = ''
+            while True:
+                response = self.client.get(reverse('feed'), {'cursor': cursor})
+                seen += [w.id for w in response.context['workouts']]
+                cursor = response.context['next_cursor']
+                if not cursor:
+                    break
+
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), 5)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user('alice')
+        self.client.force_login(self.alice)
+        for i in range(10):
+            friend = CustomUser.objects.create_user(f'friend{i}')
+            self.alice.friends.add(friend)
+            for _ in range(3):
+                workout = Workout.objects.create(user=friend, type='run', duration_minutes=20)
+                FeedEntry.objects.create(owner=self.alice, author=friend, workout=workout, date=workout.date)
+                Workout.objects.create(user=self.alice, type='swim', duration_minutes=10)
+
+    def test_feed_within_budget(self):
+        with self.assertMaxQueries(4, 'feed'):
+            response = self.client.get(reverse('feed'))
+        self.assertContains(response, 'friend9')
+
+    def test_my_workouts_within_budget(self):
+        with self.assertMaxQueries(4, 'my_workouts'):
+            self.client.get(reverse('my_workouts'))
+
+    @mock.patch.object(views.stats, 'query_budget', 1)
+    def test_over_budget_raises_in_tests(self):
+        # QUERY_BUDGET_STRICT è attivato dal runner dei test (core.testing)
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'stats:'):
+            self.client.get(reverse('stats'))
+
+    @mock.patch.object(views.stats, 'query_budget', 1)
+    async def test_over_budget_raises_over_asgi(self):
+        # Catena async: le query della vista sync girano in un altro thread
+        await self.async_client.aforce_login(self.alice)
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'stats:'):
+            await self.async_client.get(reverse('stats'))
+
+    @mock.patch.object(views.stats, 'query_budget', 1)
+    @override_settings(DEBUG=True, QUERY_BUDGET_STRICT=False)
+    def test_over_budget_logged_when_not_strict(self):
+        with self.assertLogs('core.querybudget', 'WARNING') as logs:
+            response = self.client.get(reverse('stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('(budget 1)', logs.output[0])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(METRICS_DIR=directory.name, METRICS_TOKEN='segreto')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        registry = mock.patch.object(metrics, 'registry', metrics.Registry())
+        registry.start()
+        self.addCleanup(registry.stop)
+        self.alice = CustomUser.objects.create_user('alice')
+        Workout.objects.create(user=self.alice, type='run', duration_minutes=30)
+
+    def scrape(self, **headers):
+        return self.client.get(reverse('metrics'), **headers)
+
+    def test_records_views_and_merges_workers(self):
+        self.client.force_login(self.alice)
+        self.client.get(reverse('feed'))
+        self.client.get(reverse('feed'))
+        # File di un altro worker gunicorn
+        other = metrics.Registry()
+        other.observe('feed', 500, 0.2, queries=3)
+        (self.directory / '1-a1b2c3.json').write_text(json.dumps(other.snapshot()))
+
+        text = self.scrape(HTTP_AUTHORIZATION='Bearer segreto').content.decode()
+        self.assertIn('fitness_tracker_requests_total{view="feed",status="2xx"} 2', text)
+        self.assertIn('fitness_tracker_requests_total{view="feed",status="5xx"} 1', text)
+        self.assertIn('fitness_tracker_request_duration_seconds_count{view="feed"} 3', text)
+        self.assertIn('fitness_tracker_cache_requests_total{fragment="feed",outcome="hit"} 1', text)
+        data = metrics.registry.snapshot()['views']['feed']
+        self.assertGreater(data['queries'], 0)
+        self.assertGreater(data['template_seconds'], 0)
+        self.assertTrue(any(self.directory.glob('*.json')))
+
+    async def test_records_asgi_requests(self):
+        await self.async_client.aforce_login(self.alice)
+        await self.async_client.get(reverse('feed'))
+        data = metrics.registry.snapshot()['views']['feed']
+        self.assertEqual(data['requests'], {'2xx': 1})
+        self.assertGreater(data['queries'], 0)
+        self.assertGreater(data['template_seconds'], 0)
+
+    def test_worker_files_not_reused(self):
+        registry = metrics.Registry()
+        registry.observe('feed', 200, 0.1)
+        registry.flush()
+        first = registry.own_file()
+        self.assertTrue((self.directory / first).exists())
+        # Un processo nuovo con lo stesso pid non riusa il file
+        registry.pid = None
+        self.assertNotEqual(registry.own_file(), first)
+        self.assertTrue(first.startswith(f'{os.getpid()}-'))
+
+    def test_worker_exit_never_lowers_counters(self):
+        def requests():
+            return metrics.collect()['views']['feed']['requests']['2xx']
+
+        exiting = metrics.Registry()
+        exiting.observe('feed', 200, 0.1)
+        exiting.flush()
+        # Richiesta arrivata dopo l'ultimo flush: la salva l'uscita
+        exiting.observe('feed', 200, 0.1)
+        killed = metrics.Registry()
+        killed.observe('feed', 200, 0.1)
+        (self.directory / '1-a1b2c3.json').write_text(json.dumps(killed.snapshot()))
+        self.assertEqual(requests(), 2)
+
+        exiting.archive_file()
+        self.assertEqual(requests(), 3)
+        metrics.archive_worker_files(1)
+        self.assertEqual(requests(), 3)
+        # Il master può vedere uscire anche un worker che si è già archiviato
+        metrics.archive_worker_files(os.getpid())
+        self.assertEqual(requests(), 3)
+        self.assertEqual([path.name for path in self.directory.glob('*.json')], [metrics.ARCHIVE])
+
+    def test_requires_token_or_staff(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer sbagliato').status_code, 403)
+        self.client.force_login(self.alice)
+        self.assertEqual(self.scrape().status_code, 403)
+        self.alice.is_staff = True
+        self.alice.save()
+        self.assertEqual(self.scrape().status_code, 200)
+
+
+def _slow_helper(seconds):
+    time.sleep(seconds)
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(
+            PROFILER_DIR=directory.name, PROFILER_SAMPLE_RATE=1.0, PROFILER_INTERVAL=0.001, PROFILER_MAX_PROFILES=3,
+            MIDDLEWARE=['core.profiler.ProfilerMiddleware', *django_settings.MIDDLEWARE],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.alice = CustomUser.objects.create_user('alice')
+        Workout.objects.create(user=self.alice, type='run', duration_minutes=30)
+
+    def test_threshold_starts_sampling_a_slow_thread(self):
+        sampler = profiler.Sampler()
+        with override_settings(PROFILER_THRESHOLD=0.01):
+            profile = profiler.Profile(threading.get_ident(), recording=False)
+            sampler.add(profile)
+            sampler.sample()
+            self.assertFalse(profile.recording)
+            _slow_helper(0.02)
+            sampler.sample()
+            sampler.discard(profile)
+        self.assertEqual((profile.trigger, profile.tree[0]), ('soglia', 1))
+        stacks = json.dumps(profile.tree)
+        self.assertIn('test_threshold_starts_sampling_a_slow_thread', stacks)
+
+    def test_sampled_requests_are_stored_and_browsable(self):
+        self.client.force_login(self.alice)
+        for _ in range(4):
+            self.client.get(reverse('my_workouts'))
+        # Buffer ad anello: restano solo gli ultimi PROFILER_MAX_PROFILES
+        profiles = profiler.recent()
+        self.assertEqual(len(profiles), 3)
+        self.assertEqual(profiles[0]['view'], 'my_workouts')
+        self.assertGreater(profiles[0]['query_count'], 0)
+        self.assertIn('workouts_workout', json.dumps(profiles[0]['queries']))
+
+        self.assertEqual(self.client.get(reverse('profile_list')).status_code, 302)
+        self.alice.is_staff = True
+        self.alice.save()
+        self.assertContains(self.client.get(reverse('profile_list')), 'my_workouts')
+        self.assertContains(self.client.get(reverse('profile_detail', args=[profiles[0]['id']])), 'Query SQL')
+        response = self.client.get(reverse('profile_diff'), {'a': profiles[1]['id'], 'b': profiles[0]['id']})
+        self.assertContains(response, 'Confronto dei punti caldi')
+        self.assertEqual(self.client.get(reverse('profile_detail', args=['..'])).status_code, 404)
+
+    async def test_asgi_requests_are_profiled(self):
+        await self.async_client.aforce_login(self.alice)
+        await self.async_client.get(reverse('my_workouts'))
+        profile = (await sync_to_async(profiler.recent)())[0]
+        self.assertEqual(profile['view'], 'my_workouts')
+        self.assertGreater(profile['query_count'], 0)
+
+    def test_hotspots_count_recursion_once(self):
+        data = {'samples': 4, 'interval': 0.005, 'tree': [4, {'a': [4, {'b': [3, {'a': [2, {}]}]}]}]}
+        spots = profiler.hotspots(data)
+        self.assertEqual((spots['a']['own'], spots['a']['inclusive']), (3, 4))
+        self.assertEqual((spots['b']['own'], spots['b']['inclusive']), (1, 3))
+
+
+class AsyncMiddlewareTests(SimpleTestCase):
+    @override_settings(DEBUG=True, PROFILER_THRESHOLD=1.0)
+    def test_asgi_chain_has_no_sync_middleware(self):
+        # Django registra ogni middleware che deve adattare (passando a un thread)
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+
+class DbHooksTests(TransactionTestCase):
+    def test_connection_opened_inside_block_keeps_hooks(self):
+        result = []
+
+        def run():
+            # Thread nuovo: la connessione si apre dentro il blocco
+            with count_queries() as counter:
+                CustomUser.objects.count()
+            CustomUser.objects.count()
+            result.extend([counter.count, connection.execute_wrappers])
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(result, [1, [dbhooks._execute]])
+
+
+class StaticReferenceTests(TestCase):
+    def test_project_templates_use_static_tag(self):
+        self.assertEqual(static.check_static_references(), [])
+
+    def test_reports_literal_and_missing_assets(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, 'pagina.html').write_text(
+                '{% load static %}\n'
+                '<link rel="stylesheet" href="/static/css/style.css">\n'
+                "<script src=\"{% static 'js/manca.js' %}\"></script>\n"
+                '<img src="{{ user.avatar_url }}"><a href="https://example.com/x.js">x</a>\n'
+            )
+            with override_settings(TEMPLATES=[{**django_settings.TEMPLATES[0], 'DIRS': [directory]}]):
+                errors = static.check_static_references()
+                # Registrato da CoreConfig.ready
+                registered = run_checks(tags=[Tags.staticfiles])
+        self.assertEqual([error.id for error in errors], ['core.E001', 'core.E002'])
+        self.assertIn('pagina.html:2:', errors[0].msg)
+        self.assertIn('pagina.html:3:', errors[1].msg)
+        self.assertEqual([error.id for error in registered], ['core.E001', 'core.E002'])
+
+    def test_storage_falls_back_only_in_debug(self):
+        with tempfile.TemporaryDirectory() as directory:
+            storage = static.StaticStorage(location=directory)
+            with override_settings(DEBUG=True):
+                self.assertEqual(storage.url('css/style.css'), '/static/css/style.css')
+            with self.assertRaisesMessage(ValueError, 'css/style.css'):
+                storage.url('css/style.css')
+
+
+class WorkoutTotalTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice')
+        self.client.force_login(self.alice)
+
+    def minutes(self):
+        return dict(WorkoutTotal.objects.filter(user=self.alice).values_list('type', 'minutes'))
+
+    def test_totals_follow_create_edit_delete(self):
+        self.client.post(reverse('create_workout'), {'type': 'run', 'duration_minutes': 30})
+        self.client.post(reverse('create_workout'), {'type': 'run', 'duration_minutes': 20})
+        self.assertEqual(self.minutes(), {'run': 50})
+
+        workout = Workout.objects.filter(user=self.alice).first()
+        self.client.post(reverse('edit_workout', args=[workout.id]), {'type': 'swim', 'duration_minutes': 40})
+        self.assertEqual(self.minutes(), {'run': 50 - workout.duration_minutes, 'swim': 40})
+
+        self.client.post(reverse('delete_workout', args=[workout.id]))
+        self.assertEqual(totals.minutes_by_type(self.alice), totals.aggregate_minutes(self.alice))
+
+    def test_reconcile_fixes_drift(self):
+        Workout.objects.create(user=self.alice, type='bike', duration_minutes=90)
+        out = StringIO()
+        call_command('reconcile_totals', stdout=out)
+        self.assertIn('Corretti 1', out.getvalue())
+        self.assertEqual(self.minutes(), {'bike': 90})
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice')
+        self.client.force_login(self.alice)
+
+    def rollup_rows(self):
+        return sorted(WorkoutRollup.objects.filter(user=self.alice, minutes__gt=0)
+                      .values_list('period', 'start', 'type', 'minutes', 'count'))
+
+    def test_incremental_matches_backfill(self):
+        self.client.post(reverse('create_workout'), {'type': 'run', 'duration_minutes': 30})
+        self.client.post(reverse('create_workout'), {'type': 'bike', 'duration_minutes': 60})
+        workout = Workout.objects.get(user=self.alice, type='run')
+        self.client.post(reverse('edit_workout', args=[workout.id]), {'type': 'swim', 'duration_minutes': 25})
+        incremental = self.rollup_rows()
+
+        call_command('backfill_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), incremental)
+        self.assertEqual(len(incremental), 6)
+
+    def test_stats_json(self):
+        self.client.post(reverse('create_workout'), {'type': 'run', 'duration_minutes': 30})
+        self.assertContains(self.client.get(reverse('stats')), '30 min')
+        response = self.client.get(reverse('stats_json'), {'periodo': 'month'})
+        series = response.json()['series']
+        self.assertEqual(series['run'][0]['minutes'], 30)
+        self.assertEqual(series['run'][0]['start'], rollups.bucket_start(Workout.objects.get().date, 'month').isoformat())
+
+
+GPX = b"""<?xml version="1.0"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><name>Lungomare</name><type>running</type><trkseg>
+    <trkpt lat="44.0" lon="12.0"><time>2024-05-01T07:00:00Z</time></trkpt>
+    <trkpt lat="44.1" lon="12.1"><time>2024-05-01T07:42:00Z</time></trkpt>
+  </trkseg></trk>
+</gpx>"""
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice')
+
+    def test_csv_import_validates_and_skips_duplicates(self):
+        data = (
+            b"date,type,duration_minutes,notes\n"
+            b"2024-01-02,run,30,\n"
+            b"2024-01-03,swim,-5,\n"
+            b"2024-01-04,yoga,20,\n"
+            b"2024-01-05,cycling,90,giro lungo\n"
+        )
+        result = importers.import_workouts(self.alice, importers.read_csv(BytesIO(data)), batch_size=2)
+        self.assertEqual((result.created, result.duplicates, result.invalid), (2, 0, 2))
+        self.assertEqual(totals.minutes_by_type(self.alice), {'run': 30, 'swim': 0, 'bike': 90})
+
+        again = importers.import_workouts(self.alice, importers.read_csv(BytesIO(data)))
+        self.assertEqual((again.created, again.duplicates), (0, 2))
+        out = StringIO()
+        call_command('reconcile_totals', stdout=out)
+        self.assertIn('Nessuna differenza', out.getvalue())
+
+    def test_identical_sessions_in_same_file_are_kept(self):
+        # Due sessioni vere con stesso giorno, tipo e durata, in blocchi diversi
+        data = (
+            b"date,type,duration_minutes\n"
+            b"2024-01-02,run,30\n"
+            b"2024-01-02,Corsa,30\n"
+            b"2024-01-03,swim,20\n"
+        )
+        result = importers.import_workouts(self.alice, importers.read_csv(BytesIO(data)), batch_size=1)
+        self.assertEqual((result.created, result.duplicates), (3, 0))
+        self.assertEqual(totals.minutes_by_type(self.alice)['run'], 60)
+
+        again = importers.import_workouts(self.alice, importers.read_csv(BytesIO(data)), batch_size=1)
+        self.assertEqual((again.created, again.duplicates), (0, 3))
+        self.assertEqual(Workout.objects.filter(user=self.alice).count(), 3)
+
+    def test_resumed_import_skips_only_committed_rows(self):
+        # Il primo tentativo ha confermato solo la prima riga
+        first = b"date,type,duration_minutes\n2024-01-02,run,30\n"
+        importers.import_workouts(self.alice, importers.read_csv(BytesIO(first)))
+        data = first + b"2024-01-02,run,30\n2024-01-03,swim,20\n"
+        result = importers.import_workouts(self.alice, importers.read_csv(BytesIO(data)), batch_size=1)
+        self.assertEqual((result.created, result.duplicates), (2, 1))
+        self.assertEqual(Workout.objects.filter(user=self.alice, date=date(2024, 1, 2)).count(), 2)
+
+    def test_gpx_import(self):
+        result = importers.import_workouts(self.alice, importers.read_gpx(BytesIO(GPX)))
+        self.assertEqual(result.created, 1)
+        workout = Workout.objects.get(user=self.alice)
+        self.assertEqual((workout.type, workout.duration_minutes, workout.notes), ('run', 42, 'Lungomare'))
+        self.assertEqual(WorkoutRollup.objects.get(user=self.alice, period='month').start.isoformat(), '2024-05-01')
+
+    def test_upload_view(self):
+        self.client.force_login(self.alice)
+        upload = BytesIO(b"date,type,duration_minutes\n2024-01-02,run,30\n")
+        upload.name = 'storico.csv'
+        response = self.client.post(reverse('import_workouts'), {'file': upload})
+        self.assertEqual(response.context['result'].created, 1)
+
+    def queued_upload(self, data, name='storico.csv'):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.client.force_login(self.alice)
+        upload = BytesIO(data)
+        upload.name = name
+        with override_settings(MEDIA_ROOT=directory.name, IMPORT_INLINE_MAX_BYTES=10):
+            response = self.client.post(reverse('import_workouts'), {'file': upload})
+            record = WorkoutImport.objects.get(user=self.alice)
+            self.assertRedirects(response, reverse('import_status', args=[record.pk]))
+            self.assertFalse(Workout.objects.filter(user=self.alice).exists())
+            self.assertEqual(queue.run_pending(), 1)
+        record.refresh_from_db()
+        self.assertEqual(list(Path(directory.name).rglob('*.*')), [])
+        return record
+
+    def test_large_upload_is_queued_with_progress(self):
+        data = b"date,type,duration_minutes\n" + b"".join(
+            f"2024-01-{day:02d},run,30\n".encode() for day in range(1, 21)
+        ) + b"2024-01-21,yoga,30\n"
+        record = self.queued_upload(data)
+        self.assertEqual(
+            (record.status, record.imported, record.invalid, record.percent),
+            (WorkoutImport.DONE, 20, 1, 100),
+        )
+        self.assertEqual(Workout.objects.filter(user=self.alice).count(), 20)
+        response = self.client.get(reverse('import_status', args=[record.pk]))
+        self.assertContains(response, 'Completato')
+        self.assertNotContains(response, 'import_status.js')
+
+    def test_queued_upload_with_bad_header_fails_without_retry(self):
+        record = self.queued_upload(b"giorno,sport\n2024-01-02,run\n")
+        self.assertEqual(record.status, WorkoutImport.FAILED)
+        self.assertIn('Colonne mancanti', record.errors[0])
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice')
+        self.client.force_login(self.alice)
+        for minutes in (10, 20, 30):
+            Workout.objects.create(user=self.alice, type='run', duration_minutes=minutes)
+
+    def download(self, **params):
+        response = self.client.get(reverse('export_workouts'), params)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_and_resume(self):
+        rows = list(csv.reader(StringIO(self.download())))
+        self.assertEqual(rows[0], ['id', 'date', 'type', 'duration_minutes', 'notes'])
+        self.assertEqual([row[3] for row in rows[1:]], ['30', '20', '10'])
+
+        cursor = f"{rows[1][1]}_{rows[1][0]}"
+        resumed = list(csv.reader(StringIO(self.download(dopo=cursor))))
+        self.assertEqual([row[3] for row in resumed[1:]], ['20', '10'])
+
+    def test_gzip_json_export(self):
+        response = self.client.get(reverse('export_workouts'), {'formato': 'json'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(data['username'], 'alice')
+        self.assertEqual(len(data['workouts']), 3)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice')
+        self.client.force_login(self.alice)
+        for minutes in (10, 20, 30):
+            self.client.post(reverse('create_workout'), {'type': 'run', 'duration_minutes': minutes})
+
+    def test_not_modified_until_new_workout(self):
+        response = self.client.get(reverse('api_workouts'))
+        etag = response['ETag']
+        self.assertEqual(len(response.json()['results']), 3)
+
+        with self.assertNumQueries(3):  # sessione, utente e versione: nessuna query sui workout
+            response = self.client.get(reverse('api_workouts'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(reverse('create_workout'), {'type': 'swim', 'duration_minutes': 15})
+        response = self.client.get(reverse('api_workouts'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_keyset_pages_and_sparse_fields(self):
+        response = self.client.get(reverse('api_workouts'), {'limite': 2, 'campi': 'duration_minutes'})
+        data = response.json()
+        self.assertEqual(data['results'], [{'duration_minutes': 30}, {'duration_minutes': 20}])
+        response = self.client.get(reverse('api_workouts'), {'limite': 2, 'cursor': data['next_cursor']})
+        self.assertEqual([row['duration_minutes'] for row in response.json()['results']], [10])
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_feed')).status_code, 401)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice')
+        self.bob = CustomUser.objects.create_user('bob')
+        self.carol = CustomUser.objects.create_user('carol')
+        friends.bulk_add([(self.alice.id, self.bob.id), (self.alice.id, self.carol.id)])
+        for user, minutes in ((self.alice, 30), (self.bob, 50), (self.carol, 30)):
+            services.create_workout(Workout(user=user, type='run', duration_minutes=minutes))
+        services.create_workout(Workout(user=self.carol, type='swim', duration_minutes=40))
+        queue.run_pending()  # notifiche e suggerimenti accodati qui sopra
+        self.client.force_login(self.alice)
+
+    def test_rankings_per_type_with_ties(self):
+        call_command('refresh_leaderboards', stdout=StringIO())
+        start = leaderboards.current_start(WorkoutRollup.WEEK)
+        run, _, pending = leaderboards.get(self.alice, LeaderboardEntry.FRIENDS, WorkoutRollup.WEEK, start, 'run')
+        self.assertFalse(pending)
+        self.assertEqual([(e.rank, e.member.username, e.minutes) for e in run],
+                         [(1, 'bob', 50), (2, 'alice', 30), (2, 'carol', 30)])
+        total, _, _ = leaderboards.get(self.alice, LeaderboardEntry.FRIENDS, WorkoutRollup.WEEK, start, 'all')
+        self.assertEqual(total[0].member.username, 'carol')
+
+    def test_page_is_read_only_and_queues_refresh(self):
+        response = self.client.get(reverse('leaderboard'))
+        self.assertEqual((response.context['entries'], response.context['pending']), ([], True))
+        self.assertFalse(LeaderboardEntry.objects.exists())
+        self.client.get(reverse('leaderboard'))
+        self.assertEqual(queue.run_pending(), 1)
+
+        with self.assertNumQueries(4):  # sessione, utente, ultimo calcolo e classifica salvata
+            response = self.client.get(reverse('leaderboard'), {'tipo': 'swim'})
+        self.assertEqual(response.context['entries'][0].member.username, 'carol')
+        self.assertFalse(response.context['pending'])
+
+    def test_start_must_be_a_recent_period_start(self):
+        week = leaderboards.current_start(WorkoutRollup.WEEK)
+        for value in ((week + timedelta(days=1)).isoformat(), (week + timedelta(days=7)).isoformat(), '2001-01-01'):
+            response = self.client.get(reverse('leaderboard'), {'inizio': value})
+            self.assertEqual(response.context['start'], week)
+        response = self.client.get(reverse('leaderboard'), {'inizio': (week - timedelta(days=7)).isoformat()})
+        self.assertEqual(response.context['start'], week - timedelta(days=7))
+
+    def test_coach_board(self):
+        coach = CustomUser.objects.create_user('coach', is_coach=True)
+        Goal.objects.create(coach=coach, athlete=self.bob)
+        self.client.force_login(coach)
+        params = {'gruppo': 'athletes', 'periodo': 'month'}
+        self.client.get(reverse('leaderboard'), params)
+        queue.run_pending()
+        response = self.client.get(reverse('leaderboard'), params)
+        self.assertEqual([e.member.username for e in response.context['entries']], ['bob'])
+
+    def test_empty_board_is_not_recomputed(self):
+        coach = CustomUser.objects.create_user('coach', is_coach=True)
+        self.client.force_login(coach)
+        params = {'gruppo': 'athletes'}
+        self.client.get(reverse('leaderboard'), params)
+        self.assertEqual(queue.run_pending(), 1)
+        response = self.client.get(reverse('leaderboard'), params)
+        self.assertEqual((response.context['entries'], response.context['pending']), ([], False))
+        self.assertEqual(queue.run_pending(), 0)
+
+
+class RecordTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user('alice')
+        self.today = date.today()
+
+    def add(self, days_ago, minutes, workout_type='run'):
+        workout = Workout(user=self.alice, type=workout_type, duration_minutes=minutes,
+                          date=self.today - timedelta(days=days_ago))
+        services.create_workout(workout)
+        return workout
+
+    def stats(self):
+        return AthleteStats.objects.get(user=self.alice)
+
+    def test_incremental_streaks_and_bests(self):
+        self.add(4, 20)
+        self.add(3, 30)
+        self.add(1, 25, 'swim')
+        self.add(0, 45)
+        stats = self.stats()
+        self.assertEqual((stats.current_streak, stats.longest_streak), (2, 2))
+        self.assertEqual((stats.best_run_minutes, stats.best_swim_minutes), (45, 25))
+        self.assertEqual(stats.streak_on(self.today + timedelta(days=2)), 0)
+
+        # L'aggiornamento incrementale coincide con il ricalcolo completo
+        records.recompute_many([self.alice.id])
+        recomputed = self.stats()
+        for field in ('current_streak', 'longest_streak', 'longest_streak_end', 'best_week_minutes', 'best_week_start'):
+            self.assertEqual(getattr(recomputed, field), getattr(stats, field), field)
+
+        self.add(2, 10)  # retrodatato: unisce le due serie
+        self.assertEqual(self.stats().longest_streak, 5)
+
+    def test_delete_and_edit_recompute(self):
+        self.add(1, 30)
+        best = self.add(0, 90)
+        best.duration_minutes = 40
+        services.update_workout(best)
+        self.assertEqual(self.stats().best_run_minutes, 40)
+        services.delete_workout(best)
+        stats = self.stats()
+        self.assertEqual((stats.best_run_minutes, stats.current_streak, stats.last_workout_date),
+                         (30, 1, self.today - timedelta(days=1)))
+
+    @mock.patch.object(records, 'SEGMENT_WINDOW', 2)
+    def test_bounded_updates_match_full_recompute(self):
+        fields = [field.name for field in AthleteStats._meta.fields if field.name not in ('id', 'user')]
+        rng = random.Random(7)
+        workouts = []
+        for step in range(120):
+            action = rng.random()
+            if action < 0.55 or not workouts:
+                workouts.append(self.add(rng.randint(0, 40), rng.randint(5, 120), rng.choice(['run', 'swim', 'bike'])))
+            elif action < 0.75:
+                workout = rng.choice(workouts)
+                workout.duration_minutes = rng.randint(5, 120)
+                workout.type = rng.choice(['run', 'swim', 'bike'])
+                services.update_workout(workout)
+            else:
+                services.delete_workout(workouts.pop(rng.randrange(len(workouts))))
+            incremental = {field: getattr(self.stats(), field) for field in fields}
+            records.recompute_many([self.alice.id])
+            self.assertEqual(incremental, {field: getattr(self.stats(), field) for field in fields}, step)
+
+    def test_import_recomputes_once(self):
+        data = b"date,type,duration_minutes\n" + b"".join(
+            f"{self.today - timedelta(days=day)},run,{day + 10}\n".encode() for day in range(6)
+        )
+        with mock.patch.object(records, 'recompute_many', wraps=records.recompute_many) as recompute:
+            importers.import_workouts(self.alice, importers.read_csv(BytesIO(data)), batch_size=2)
+        self.assertEqual(recompute.call_count, 1)
+        self.assertEqual((self.stats().current_streak, self.stats().best_run_minutes), (6, 15))
+
+    def test_batch_command(self):
+        self.add(0, 30)
+        AthleteStats.objects.all().delete()
+        call_command('recompute_athlete_stats', workers=0, stdout=StringIO())
+        self.assertEqual(self.stats().best_week_minutes, 30)
+
+
+class SeedTests(TestCase):
+    def config(self, prefix):
+        return seed.SeedConfig(
+            users=40, friends=4, coaches=2, roster=5, workouts=6, end=date(2025, 1, 31), prefix=prefix,
+        )
+
+    def snapshot(self, prefix):
+        users = CustomUser.objects.filter(username__startswith=prefix)
+        return (
+            sorted(Workout.objects.filter(user__in=users).values_list('user__first_name', 'type', 'duration_minutes', 'date')),
+            sorted(users.values_list('username', 'weight_kg')),
+        )
+
+    def test_dataset_is_reproducible_and_consistent(self):
+        counts = seed.seed(self.config('uno'), log=lambda message: None)
+        self.assertEqual((counts['users'], counts['goals'], counts['workouts']), (40, 10, 240))
+        degrees = [len(friends.friend_ids(user)) for user in CustomUser.objects.all()]
+        self.assertGreaterEqual(min(degrees), 2)
+        self.assertGreater(max(degrees), 2 * statistics.median(degrees))
+
+        # Le tabelle derivate coincidono con quelle che scriverebbero i servizi
+        user = CustomUser.objects.get(username='uno000010')
+        self.assertEqual(totals.minutes_by_type(user), totals.aggregate_minutes(user))
+        self.assertEqual(FeedEntry.objects.filter(owner=user).count(), feed.rebuild(user.id))
+
+        seed.seed(self.config('due'), log=lambda message: None)
+        first, second = self.snapshot('uno'), self.snapshot('due')
+        self.assertEqual(first[0], second[0])
+        self.assertEqual([weight for _, weight in first[1]], [weight for _, weight in second[1]])
+
+    def test_command_refuses_existing_prefix(self):
+        CustomUser.objects.create_user('seed000000')
+        with self.assertRaises(CommandError):
+            call_command('seed_fitness_data', users=5, coaches=1, stdout=StringIO())
+
+
+class RealtimeTests(TestCase):
+    def setUp(self):
+        self.anna = CustomUser.objects.create_user('anna')
+        self.bruno = CustomUser.objects.create_user('bruno')
+        friends.add(self.anna, self.bruno)
+
+    def test_watcher_reports_each_bump_once(self):
+        watcher = realtime.VersionWatcher(realtime.Hub())
+        watcher.changes([self.bruno.id])
+        services.create_workout(Workout(user=self.anna, type='run', duration_minutes=30, date=date.today()))
+        changed = watcher.changes([self.anna.id, self.bruno.id])
+        self.assertIn((self.bruno.id, 'feed'), [(user_id, scope) for user_id, scope, _ in changed])
+        self.assertIn((self.anna.id, 'goals'), [(user_id, scope) for user_id, scope, _ in changed])
+        self.assertEqual(watcher.changes([self.anna.id, self.bruno.id]), [])
+
+    def test_hub_drops_oldest_when_full(self):
+        hub = realtime.Hub()
+        queue = hub.subscribe(1)
+        for version in range(realtime.QUEUE_SIZE + 3):
+            hub.publish(1, {'scope': 'feed', 'version': version})
+        self.assertEqual(queue.get_nowait()['version'], 3)
+        hub.unsubscribe(1, queue)
+        self.assertEqual(hub.channels(), [])
+
+    def test_entries_since_many_matches_single_reads(self):
+        for minutes in (10, 20, 30):
+            services.create_workout(Workout(user=self.anna, type='run', duration_minutes=minutes, date=date.today()))
+        first = feed.last_entry_id(self.bruno.id) - 2
+        requests = [(self.bruno.id, 0), (self.bruno.id, first), (self.anna.id, 0)]
+        batched = feed.entries_since_many(requests, limit=2)
+        for owner_id, after_id in requests:
+            self.assertEqual(batched[owner_id, after_id], feed.entries_since(owner_id, after_id, limit=2))
+
+    async def test_stream_requires_login(self):
+        response = await self.async_client.get(reverse('feed_stream'))
+        self.assertEqual(response.status_code, 401)
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'path': reverse('feed_stream'), 'headers': [(b'cookie', b'sessionid=nessuna')]}
+        await stream.asgi_stream(scope, None, send)
+        self.assertEqual(sent[0]['status'], 401)
+
+    def test_stream_not_served_over_wsgi(self):
+        self.client.force_login(self.bruno)
+        self.assertEqual(self.client.get(reverse('feed_stream')).status_code, 204)
+
+    @override_settings(REALTIME_ALLOWED_ORIGINS=['https://www.example.com'])
+    async def test_stream_cors_for_site_origins(self):
+        async def call(method, origin):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            headers = [(b'origin', origin), (b'cookie', b'sessionid=nessuna')]
+            await stream.asgi_stream({'type': 'http', 'method': method, 'headers': headers}, None, send)
+            return sent[0]['status'], dict(sent[0]['headers'])
+
+        status, headers = await call('OPTIONS', b'https://www.example.com')
+        self.assertEqual(status, 204)
+        self.assertEqual(headers[b'access-control-allow-origin'], b'https://www.example.com')
+        self.assertEqual(headers[b'access-control-allow-headers'], b'last-event-id')
+        status, headers = await call('GET', b'https://www.example.com')
+        self.assertEqual((status, headers[b'access-control-allow-credentials']), (401, b'true'))
+        status, headers = await call('GET', b'https://altro.example.org')
+        self.assertNotIn(b'access-control-allow-origin', headers)
+
+
+@override_settings(REALTIME_POLL_INTERVAL=0.05)
+class FeedStreamTests(TransactionTestCase):
+    async def test_new_workout_is_pushed(self):
+        anna = await CustomUser.objects.acreate(username='anna')
+        bruno = await CustomUser.objects.acreate(username='bruno')
+        await sync_to_async(friends.add)(anna, bruno)
+        await self.async_client.aforce_login(bruno)
+
+        response = await self.async_client.get(reverse('feed_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b'retry: 5000\n\n')
+
+        await sync_to_async(services.create_workout)(
+            Workout(user=anna, type='swim', duration_minutes=25, date=date.today()))
+        event = (await asyncio.wait_for(anext(events), 5)).decode()
+        self.assertTrue(event.startswith('event: feed\n'))
+        payload = json.loads(event.split('data: ', 1)[1])
+        self.assertEqual([(w['username'], w['duration_minutes']) for w in payload], [('anna', 25)])
+        await events.aclose()
@@ -0,0 +1,55 @@
+"""Totali per atleta e tipo di workout, mantenuti in modo incrementale."""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import Workout, WorkoutTotal
+
+TYPES = [choice for choice, _ in Workout.WORKOUT_CHOICES]
+
+
+def apply(user_id, workout_type, minutes, count):
+    """Somma `minutes` e `count` (anche negativi) al totale di (utente, tipo)."""
+    updated = WorkoutTotal.objects.filter(user_id=user_id, type=workout_type).update(
+        minutes=F('minutes') + minutes,
+        count=F('count') + count,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            WorkoutTotal.objects.create(user_id=user_id, type=workout_type, minutes=max(minutes, 0), count=max(count, 0))
+    except IntegrityError:
+        # Un'altra richiesta ha creato la riga nel frattempo: riprova l'UPDATE
+        apply(user_id, workout_type, minutes, count)
+
+
+def minutes_by_type(user):
+    """Minuti totali per tipo letti dalla tabella dei totali (al più 3 righe)."""
+    minutes = dict.fromkeys(TYPES, 0)
+    minutes.update(WorkoutTotal.objects.filter(user=user).values_list('type', 'minutes'))
+    return minutes
+
+
+async def aminutes_by_type(user):
+    minutes = dict.fromkeys(TYPES, 0)
+    async for workout_type, total in WorkoutTotal.objects.filter(user=user).values_list('type', 'minutes'):
+        minutes[workout_type] = total
+    return minutes
+
+
+def aggregate_minutes(user):
+    """Minuti totali per tipo calcolati dai `Workout` in un'unica query."""
+    sums = Workout.objects.filter(user=user).aggregate(**{
+        workout_type: Sum('duration_minutes', filter=Q(type=workout_type)) for workout_type in TYPES
+    })
+    return {workout_type: sums[workout_type] or 0 for workout_type in TYPES}
+
+
+def recompute():
+    """Totali attesi calcolati da zero: {(user_id, type): (minuti, sessioni)}."""
+    rows = (
+        Workout.objects.order_by()
+        .values_list('user_id', 'type')
+        .annotate(minutes=Sum('duration_minutes'), count=Count('id'))
+    )
+    return {(user_id, workout_type): (minutes, count) for user_id, workout_type, minutes, count in rows}
@@ -1,18 +1,35 @@
+from django.conf import settings
 from django.urls import path
+from .stream import feed_stream
 from .views import (
     feed_view,
+    afeed_view,
     create_workout,
     my_workouts,
+    amy_workouts,
     edit_workout,
     delete_workout,
+    import_workouts,
+    import_status,
+    export_workouts,
+    stats,
+    stats_json,
+    leaderboard,
     set_goals
 )
 
 urlpatterns = [
-    path('feed/', feed_view, name='feed'),
+    path('feed/', afeed_view if settings.ASYNC_VIEWS else feed_view, name='feed'),
+    path('feed/stream/', feed_stream, name='feed_stream'),
     path('workouts/new/', create_workout, name='create_workout'),
-    path('workouts/miei/', my_workouts, name='my_workouts'),
+    path('workouts/miei/', amy_workouts if settings.ASYNC_VIEWS else my_workouts, name='my_workouts'),
     path('workouts/<int:workout_id>/edit/', edit_workout, name='edit_workout'),
     path('workouts/<int:pk>/delete/', delete_workout, name='delete_workout'),
+    path('workouts/importa/', import_workouts, name='import_workouts'),
+    path('workouts/importa/<int:pk>/', import_status, name='import_status'),
+    path('workouts/esporta/', export_workouts, name='export_workouts'),
+    path('workouts/statistiche/', stats, name='stats'),
+    path('workouts/statistiche.json', stats_json, name='stats_json'),
+    path('classifica/', leaderboard, name='leaderboard'),
     path('obiettivi/<int:user_id>/', set_goals, name='set_goals'),
 ]
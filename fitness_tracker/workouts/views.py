@@ -1,25 +1,72 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Workout
-from .forms import WorkoutForm
-from users.models import CustomUser, Goal  # assicurati di importare anche Goal
+from django.db import transaction
+from core import cache
+from core.querybudget import query_budget
+from core.shortcuts import arender
+from . import exports, feed, importers, leaderboards, records, rollups, services
+from .models import LeaderboardEntry, Workout, WorkoutImport, WorkoutRollup
+from .forms import WorkoutForm, WorkoutImportForm
+from users import versions
+from users.models import CustomUser, Goal, UserVersion  # assicurati di importare anche Goal
 
 # ----------------- WORKOUTS -----------------
 
+@query_budget(4)
 @login_required
 def feed_view(request):
-    """Mostra i workout degli amici."""
-    friends = request.user.friends.all()
-    workouts = Workout.objects.filter(user__in=friends).order_by('-date')
-    return render(request, 'workouts/feed.html', {'workouts': workouts})
+    """Mostra i workout degli amici, una pagina alla volta."""
+    cursor = request.GET.get('cursor') or ''
+    workouts, next_cursor = cache.get_or_build(
+        'feed', request.user, UserVersion.FEED,
+        lambda: feed.get_page(request.user, cursor),
+        feed.page_size(), cursor,
+    )
+    return render(request, 'workouts/feed.html', {
+        'workouts': workouts,
+        'next_cursor': next_cursor,
+    })
+
+
+@query_budget(4)
+@login_required
+async def afeed_view(request):
+    """Versione async di `feed_view` (con `ASYNC_VIEWS`)."""
+    user = await request.auser()
+    cursor = request.GET.get('cursor') or ''
+    workouts, next_cursor = await cache.aget_or_build(
+        'feed', user, UserVersion.FEED,
+        lambda: feed.aget_page(user, cursor),
+        feed.page_size(), cursor,
+    )
+    return await arender(request, 'workouts/feed.html', {
+        'workouts': workouts,
+        'next_cursor': next_cursor,
+    })
+
+
+def _my_workouts_query(user):
+    return Workout.objects.filter(user=user).order_by('-date', '-id')
 
 
+@query_budget(4)
 @login_required
 def my_workouts(request):
     """Mostra i workout personali dell'utente."""
-    workouts = Workout.objects.filter(user=request.user).order_by('-date')
-    return render(request, 'workouts/my_workouts.html', {'workouts': workouts})
+    return render(request, 'workouts/my_workouts.html', {'workouts': _my_workouts_query(request.user)})
+
+
+@query_budget(4)
+@login_required
+async def amy_workouts(request):
+    """Versione async di `my_workouts`: i workout vengono letti prima del rendering."""
+    workouts = [workout async for workout in _my_workouts_query(await request.auser())]
+    return await arender(request, 'workouts/my_workouts.html', {'workouts': workouts})
 
 
 @login_required
@@ -30,7 +77,7 @@ def create_workout(request):
         if form.is_valid():
             workout = form.save(commit=False)
             workout.user = request.user
-            workout.save()
+            services.create_workout(workout)
             messages.success(request, "Workout aggiunto con successo!")
             return redirect('my_workouts')
     else:
@@ -45,7 +92,7 @@ def edit_workout(request, workout_id):
     if request.method == 'POST':
         form = WorkoutForm(request.POST, instance=workout)
         if form.is_valid():
-            form.save()
+            services.update_workout(form.save(commit=False))
             messages.success(request, "Workout aggiornato.")
             return redirect('my_workouts')
     else:
@@ -58,12 +105,162 @@ def delete_workout(request, pk):
     """Permette all'utente di eliminare un workout."""
     workout = get_object_or_404(Workout, id=pk, user=request.user)
     if request.method == 'POST':
-        workout.delete()
+        services.delete_workout(workout)
         messages.success(request, "Workout eliminato.")
         return redirect('my_workouts')
     return render(request, 'workouts/confirm_delete.html', {'workout': workout})
 
 
+@login_required
+def import_workouts(request):
+    """Importa in blocco i workout da un file CSV o GPX.
+
+    I file oltre `IMPORT_INLINE_MAX_BYTES` vengono importati in coda e
+    l'utente segue l'avanzamento da `import_status`.
+    """
+    result = None
+    form = WorkoutImportForm(request.POST or None, request.FILES or None)
+    if request.method == 'POST' and form.is_valid():
+        upload = form.cleaned_data['file']
+        try:
+            if upload.size > settings.IMPORT_INLINE_MAX_BYTES:
+                record = importers.queue_import(request.user, upload)
+                return redirect('import_status', pk=record.pk)
+            rows = importers.read_file(upload.file, upload.name)
+            result = importers.import_workouts(request.user, rows)
+        except importers.ImportFormatError as exc:
+            form.add_error('file', str(exc))
+        else:
+            messages.success(
+                request,
+                f"Importati {result.created} workout ({result.duplicates} duplicati, {result.invalid} righe non valide).",
+            )
+    return render(request, 'workouts/import_workouts.html', {'form': form, 'result': result})
+
+
+@login_required
+def import_status(request, pk):
+    """Avanzamento di un import in coda."""
+    record = get_object_or_404(WorkoutImport, pk=pk, user=request.user)
+    return render(request, 'workouts/import_status.html', {'import': record})
+
+
+@login_required
+def export_workouts(request):
+    """Scarica in streaming i propri workout e obiettivi (?formato=csv|json)."""
+    user = request.user
+    rows = exports.workout_rows([user.id], after=request.GET.get('dopo'))
+    if request.GET.get('formato') == 'json':
+        goals = list(Goal.objects.filter(athlete=user).values(*exports.GOAL_FIELDS))
+        pieces = exports.json_stream(
+            {'username': user.username, 'goals': goals}, 'workouts', exports.WORKOUT_FIELDS, rows,
+        )
+        return exports.streaming_response(request, pieces, 'application/json', f'workouts_{user.username}.json')
+    pieces = exports.csv_stream(exports.WORKOUT_FIELDS, rows)
+    return exports.streaming_response(request, pieces, 'text/csv', f'workouts_{user.username}.csv')
+
+
+# ----------------- STATISTICHE -----------------
+
+# Finestra mostrata di default per ogni periodo
+STATS_WINDOWS = {
+    WorkoutRollup.DAY: timedelta(days=90),
+    WorkoutRollup.WEEK: timedelta(weeks=52),
+    WorkoutRollup.MONTH: timedelta(days=3 * 365),
+}
+
+
+def _stats_params(request):
+    period = request.GET.get('periodo', WorkoutRollup.WEEK)
+    if period not in STATS_WINDOWS:
+        period = WorkoutRollup.WEEK
+    try:
+        since = date.fromisoformat(request.GET['da'])
+    except (KeyError, ValueError):
+        since = date.today() - STATS_WINDOWS[period]
+    return period, since
+
+
+@query_budget(4)
+@login_required
+def stats(request):
+    """Mostra i minuti per periodo letti dagli aggregati."""
+    period, since = _stats_params(request)
+    buckets = {}
+    for start, workout_type, minutes, _ in rollups.series(request.user, period, since):
+        buckets.setdefault(start, dict.fromkeys(rollups.TYPES, 0))[workout_type] = minutes
+    rows = [
+        {'start': start, 'run': values['run'], 'swim': values['swim'], 'bike': values['bike']}
+        for start, values in sorted(buckets.items(), reverse=True)
+    ]
+    athlete_stats = records.get(request.user)
+    return render(request, 'workouts/stats.html', {
+        'records': athlete_stats,
+        'current_streak': athlete_stats.streak_on(date.today()),
+        'rows': rows,
+        'period': period,
+        'periods': WorkoutRollup.PERIOD_CHOICES,
+        'since': since,
+    })
+
+
+@query_budget(4)
+@login_required
+def stats_json(request):
+    """Serie per i grafici: {tipo: [{start, minutes, count}, ...]}."""
+    period, since = _stats_params(request)
+    workout_type = request.GET.get('tipo') or None
+    series = {}
+    for start, row_type, minutes, count in rollups.series(request.user, period, since, workout_type):
+        series.setdefault(row_type, []).append({
+            'start': start.isoformat(),
+            'minutes': minutes,
+            'count': count,
+        })
+    return JsonResponse({'period': period, 'since': since.isoformat(), 'series': series})
+
+
+# ----------------- CLASSIFICHE -----------------
+
+@login_required
+def leaderboard(request):
+    """Classifica della settimana o del mese tra amici, o tra gli atleti del coach."""
+    board = request.GET.get('gruppo', LeaderboardEntry.FRIENDS)
+    if board not in leaderboards.BOARDS or (board == LeaderboardEntry.ATHLETES and not request.user.is_coach):
+        board = LeaderboardEntry.FRIENDS
+    period = request.GET.get('periodo', WorkoutRollup.WEEK)
+    if period not in leaderboards.PERIODS:
+        period = WorkoutRollup.WEEK
+    workout_type = request.GET.get('tipo', LeaderboardEntry.ALL)
+    if workout_type not in leaderboards.TYPES:
+        workout_type = LeaderboardEntry.ALL
+    current = leaderboards.current_start(period)
+    try:
+        start = date.fromisoformat(request.GET['inizio'])
+    except (KeyError, ValueError):
+        start = current
+    if not leaderboards.valid_start(start, period):
+        start = current
+
+    previous = rollups.bucket_start(start - timedelta(days=1), period)
+    following = rollups.bucket_start(start + timedelta(days=31 if period == WorkoutRollup.MONTH else 7), period)
+    entries, computed_at, pending = leaderboards.get(request.user, board, period, start, workout_type)
+    return render(request, 'workouts/leaderboard.html', {
+        'entries': entries,
+        'computed_at': computed_at,
+        'pending': pending,
+        'board': board,
+        'period': period,
+        'workout_type': workout_type,
+        'start': start,
+        'previous': previous if leaderboards.valid_start(previous, period) else None,
+        'following': following if following <= current else None,
+        'boards': LeaderboardEntry.BOARD_CHOICES,
+        'periods': [choice for choice in WorkoutRollup.PERIOD_CHOICES if choice[0] in leaderboards.PERIODS],
+        'types': LeaderboardEntry.TYPE_CHOICES,
+    })
+
+
 # ----------------- COACH - SET GOALS -----------------
 
 @login_required
@@ -82,7 +279,10 @@ def set_goals(request, user_id):
         target_minutes = request.POST.get('target_minutes')
         goal.target_weight = target_weight
         goal.target_minutes = target_minutes
-        goal.save()
+        with transaction.atomic():
+            goal.save()
+            versions.bump(athlete.id, UserVersion.GOALS, UserVersion.PROFILE)
+            versions.bump(request.user.id, UserVersion.COACH)
         messages.success(request, f"Obiettivi aggiornati per {athlete.username}.")
         return redirect('manage_goals')
 